@@ -0,0 +1,277 @@
+# async_llm.py
+import os
+import json
+import time
+import random
+import asyncio
+import traceback
+import urllib.request
+import urllib.error
+
+from llm_processor import (
+    GEMINI_API_ENDPOINT, GEMINI_MODEL_NAME, MAP_REDUCE_THRESHOLD_TOKENS, GEMINI_CONTEXT_CACHE, GEMINI_CONTEXT_CACHE_TTL,
+    build_gemini_request, build_map_request, build_reduce_request, context_cache_supported,
+    estimate_tokens, split_transcript_into_chunks,
+)
+
+# 以 REST API 直接呼叫 Gemini，讓批次處理可以在單一 asyncio 事件迴圈中同時送出多個請求，
+# 並共用同一組 RPM (每分鐘請求數) / TPM (每分鐘 token 數) 限速器。
+# 與同步路徑相同，透過 GEMINI_API_ENDPOINT (見 llm_processor.py) 可以指向本地的假伺服器 (見 fake_gemini_server.py) 進行離線測試。
+DEFAULT_BASE_URL = GEMINI_API_ENDPOINT or "https://generativelanguage.googleapis.com"
+if "://" not in DEFAULT_BASE_URL:
+    DEFAULT_BASE_URL = "https://" + DEFAULT_BASE_URL  # SDK 的 api_endpoint 可以只寫主機名稱
+DEFAULT_RPM = int(os.getenv("GEMINI_RPM_LIMIT", "15"))
+DEFAULT_TPM = int(os.getenv("GEMINI_TPM_LIMIT", "1000000"))
+
+# 視為暫時性錯誤、可以重試的 HTTP 狀態碼
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+class GeminiRequestError(Exception):
+    """Gemini 請求失敗 (status 為 HTTP 狀態碼，網路錯誤或逾時時為 None)。"""
+
+    def __init__(self, message, status=None, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+class TokenBucket:
+    """
+    asyncio 版的 token bucket 限速器。
+    rate_per_minute 為每分鐘補充的額度，容量預設等於一分鐘的額度；rate_per_minute 為 0 或 None 時不限速。
+    """
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate_per_second = (rate_per_minute or 0) / 60.0
+        self.capacity = capacity or rate_per_minute or 0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, amount=1):
+        if self.rate_per_second <= 0:
+            return
+        # 單一請求超過容量時最多等到桶子全滿，避免永遠等不到
+        amount = min(amount, self.capacity)
+        while True:
+            async with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate_per_second)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate_per_second
+            # 在鎖外等待後重新檢查：額度不足的請求不會讓只需少量額度的請求排在後面
+            await asyncio.sleep(wait)
+
+class AsyncGeminiClient:
+    """
+    非同步 Gemini 用戶端：RPM / TPM 限速、逾時、以及對 429 與 5xx 的指數退避 (含隨機抖動) 重試。
+    """
+
+    def __init__(self, api_key, model_name=GEMINI_MODEL_NAME, base_url=DEFAULT_BASE_URL,
+                 requests_per_minute=DEFAULT_RPM, tokens_per_minute=DEFAULT_TPM,
+                 max_concurrency=4, max_retries=5, timeout=120.0,
+                 backoff_base=1.0, backoff_max=60.0, context_cache=GEMINI_CONTEXT_CACHE):
+        self.api_key = api_key
+        self.model_name = model_name
+        self.base_url = base_url.rstrip("/")
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.stats = {"requests": 0, "retries": 0, "prompt_tokens": 0, "response_tokens": 0, "cached_tokens": 0}
+        # 固定的整理指示 -> (cachedContents 名稱, 到期時間)；名稱為 None 代表無法建立快取
+        self.context_cache = context_cache
+        self._cached_instructions = {}
+        self._cache_lock = asyncio.Lock()
+
+    @property
+    def _model_path(self):
+        return self.model_name if self.model_name.startswith("models/") else f"models/{self.model_name}"
+
+    def _post(self, prompt, max_output_tokens, instruction_fields=None):
+        """同步送出 HTTP 請求 (在執行緒中執行)，返回解析後的 JSON。"""
+        body = {
+            "contents": [{"role": "user", "parts": [{"text": prompt}]}],
+            "generationConfig": {"maxOutputTokens": max_output_tokens},
+        }
+        body.update(instruction_fields or {})
+        return self._post_json(f"{self._model_path}:generateContent", body)
+
+    def _post_json(self, path, payload):
+        url = f"{self.base_url}/v1beta/{path}"
+        body = json.dumps(payload).encode("utf-8")
+        request = urllib.request.Request(
+            url, data=body, method="POST",
+            headers={"Content-Type": "application/json", "x-goog-api-key": self.api_key},
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read().decode("utf-8"))
+        except urllib.error.HTTPError as e:
+            retry_after = e.headers.get("Retry-After") if e.headers else None
+            raise GeminiRequestError(
+                f"HTTP {e.code}: {e.read().decode('utf-8', 'replace')[:200]}",
+                status=e.code,
+                retry_after=float(retry_after) if retry_after and retry_after.replace('.', '', 1).isdigit() else None,
+            )
+        except (urllib.error.URLError, TimeoutError, ConnectionError) as e:
+            raise GeminiRequestError(f"連線錯誤：{e}")
+
+    async def _instruction_fields(self, system_instruction):
+        """
+        返回請求中附帶整理指示的欄位：已建立 context cache 時只送 cachedContent 名稱，
+        否則直接以 systemInstruction 送出。每段指示只嘗試建立一次快取，到期前 60 秒重新建立；
+        不符合快取條件 (見 llm_processor.context_cache_supported) 時不會呼叫建立快取的 API。
+        """
+        if not system_instruction:
+            return {}
+        inline = {"systemInstruction": {"parts": [{"text": system_instruction}]}}
+        if not self.context_cache or not context_cache_supported(system_instruction, self.model_name):
+            return inline
+        async with self._cache_lock:
+            name, expires_at = self._cached_instructions.get(system_instruction, (False, None))
+            if name is False or (name and time.monotonic() >= expires_at):
+                try:
+                    data = await asyncio.to_thread(self._post_json, "cachedContents", {
+                        "model": self._model_path,
+                        "systemInstruction": inline["systemInstruction"],
+                        "ttl": f"{GEMINI_CONTEXT_CACHE_TTL}s",
+                    })
+                    name = data["name"]
+                    print(f"[Async LLM] 已建立整理指示的 context cache：{name}")
+                except (GeminiRequestError, KeyError) as e:
+                    name = None
+                    print(f"[Async LLM] 無法建立 context cache ({e})，改為每次請求附帶整理指示。")
+                expires_at = time.monotonic() + GEMINI_CONTEXT_CACHE_TTL - 60
+                self._cached_instructions[system_instruction] = (name, expires_at)
+        return {"cachedContent": name} if name else inline
+
+    def _backoff_delay(self, attempt, error):
+        if error.retry_after is not None:
+            return error.retry_after
+        # full jitter：在 [0, base * 2^attempt] 之間隨機等待，避免大量請求同時重試
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def generate(self, prompt, max_output_tokens=8192, usage_stats=None, system_instruction=None):
+        """
+        送出單一請求並返回文字結果。重試次數用盡或遇到不可重試的錯誤時拋出 GeminiRequestError。
+        提供 usage_stats 時，會另外將這個請求的 token 用量累加進去 (格式同 llm_processor)。
+        system_instruction 為固定的整理指示，可用時會透過 context cache 送出。
+        """
+        instruction_fields = await self._instruction_fields(system_instruction)
+        prompt_tokens = estimate_tokens(prompt)
+        if "systemInstruction" in instruction_fields:
+            prompt_tokens += estimate_tokens(system_instruction)
+        attempt = 0
+        while True:
+            await self.request_bucket.acquire(1)
+            await self.token_bucket.acquire(prompt_tokens)
+            try:
+                async with self.semaphore:
+                    self.stats["requests"] += 1
+                    data = await asyncio.wait_for(
+                        asyncio.to_thread(self._post, prompt, max_output_tokens, instruction_fields),
+                        timeout=self.timeout,
+                    )
+                break
+            except (GeminiRequestError, asyncio.TimeoutError) as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    e = GeminiRequestError(f"請求逾時 ({self.timeout} 秒)")
+                retryable = e.status is None or e.status in RETRYABLE_STATUSES
+                if not retryable or attempt >= self.max_retries:
+                    raise e
+                delay = self._backoff_delay(attempt, e)
+                attempt += 1
+                self.stats["retries"] += 1
+                print(f"[Async LLM] 請求失敗 ({e})，{delay:.1f} 秒後進行第 {attempt} 次重試...")
+                await asyncio.sleep(delay)
+
+        usage = data.get("usageMetadata", {})
+        self.stats["prompt_tokens"] += usage.get("promptTokenCount", 0)
+        self.stats["response_tokens"] += usage.get("candidatesTokenCount", 0)
+        self.stats["cached_tokens"] += usage.get("cachedContentTokenCount", 0)
+        if usage_stats is not None:
+            usage_stats["requests"] = usage_stats.get("requests", 0) + 1 + attempt
+            usage_stats["prompt_tokens"] = usage_stats.get("prompt_tokens", 0) + usage.get("promptTokenCount", 0)
+            usage_stats["response_tokens"] = usage_stats.get("response_tokens", 0) + usage.get("candidatesTokenCount", 0)
+            if usage.get("cachedContentTokenCount"):
+                usage_stats["cached_tokens"] = usage_stats.get("cached_tokens", 0) + usage["cachedContentTokenCount"]
+        candidates = data.get("candidates") or []
+        parts = candidates[0].get("content", {}).get("parts", []) if candidates else []
+        text = "".join(part.get("text", "") for part in parts)
+        if not text:
+            feedback = data.get("promptFeedback")
+            raise GeminiRequestError(f"Gemini API 回應為空或不完整 (promptFeedback: {feedback})")
+        return text
+
+async def process_transcript_with_gemini_async(client, transcript_text, video_title="", map_reduce="auto",
+                                               chunk_token_budget=8000, usage_stats=None):
+    """
+    process_transcript_with_gemini 的非同步版本 (輸出格式相同)，失敗時返回 None。
+    map-reduce 模式下，各片段的請求會同時送出，由 client 的限速器控制實際速率。
+    """
+    if not transcript_text:
+        print("[Async LLM] 錯誤：沒有逐字稿內容可以處理。")
+        return None
+    if map_reduce == "auto":
+        map_reduce = estimate_tokens(transcript_text) > MAP_REDUCE_THRESHOLD_TOKENS
+    try:
+        if not map_reduce:
+            system_instruction, request = build_gemini_request(transcript_text, video_title)
+            return await client.generate(request, usage_stats=usage_stats, system_instruction=system_instruction)
+        chunks = split_transcript_into_chunks(transcript_text, chunk_token_budget)
+        map_requests = [build_map_request(chunk, video_title, index, len(chunks))
+                        for index, chunk in enumerate(chunks, start=1)]
+        partial_notes = await asyncio.gather(*(
+            client.generate(request, max_output_tokens=4096, usage_stats=usage_stats,
+                            system_instruction=system_instruction)
+            for system_instruction, request in map_requests
+        ))
+        system_instruction, request = build_reduce_request(partial_notes, video_title)
+        return await client.generate(request, usage_stats=usage_stats, system_instruction=system_instruction)
+    except GeminiRequestError as e:
+        print(f"[Async LLM] 處理「{video_title}」時與 Gemini API 互動失敗：{e}")
+        return None
+    except Exception as e:
+        print(f"[Async LLM] 處理「{video_title}」時發生未預期的錯誤：{e}")
+        traceback.print_exc()
+        return None
+
+async def process_transcripts_async(api_key, items, **client_options):
+    """
+    同時處理多份逐字稿。
+
+    參數:
+    items (list): (逐字稿, 影片標題) 的 list。
+    client_options: 傳給 AsyncGeminiClient 的設定 (例如 requests_per_minute、base_url)。
+
+    返回:
+    list: 與 items 順序相同的結果 (失敗的項目為 None)。
+    """
+    client = AsyncGeminiClient(api_key, **client_options)
+    return await asyncio.gather(*(
+        process_transcript_with_gemini_async(client, transcript, title)
+        for transcript, title in items
+    ))
+
+if __name__ == '__main__':
+    # 對本地假伺服器進行離線測試：前兩個請求分別回應 429 與 503，驗證重試與限速
+    from fake_gemini_server import start_fake_gemini_server
+
+    print("--- 正在以假的 Gemini 伺服器測試 async_llm.py ---")
+    fake_server, fake_url = start_fake_gemini_server(latency=0.05, fail_statuses=[429, 503])
+    test_items = [(f"這是第 {i} 份測試逐字稿。內容很短。", f"測試影片 {i}") for i in range(1, 7)]
+    started = time.monotonic()
+    results = asyncio.run(process_transcripts_async(
+        "fake-key", test_items, base_url=fake_url,
+        requests_per_minute=120, tokens_per_minute=0, backoff_base=0.1,
+    ))
+    elapsed = time.monotonic() - started
+    fake_server.shutdown()
+    print(f"成功 {sum(1 for r in results if r)} / {len(results)}，共收到 {len(fake_server.request_times)} 個請求，耗時 {elapsed:.2f} 秒。")
+    print("--- async_llm.py 測試結束 ---")
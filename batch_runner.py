@@ -0,0 +1,473 @@
+# batch_runner.py
+import os
+import re
+import queue
+import asyncio
+import threading
+import time
+import argparse
+
+from download_audio import (
+    AUDIO_FORMATS, extract_video_id, sanitize_for_path, output_folder_for_video,
+    is_playlist_url, expand_playlist, YtDlpSession, load_download_archive, record_in_download_archive,
+)
+from transcriber import preload_whisper_model, release_whisper_models
+from transcription_backends import BACKENDS, get_backend
+from llm_processor import process_transcript_with_gemini, get_llm_provider, LLM_PROVIDERS
+from captions import CAPTION_POLICIES, CAPTION_POLICY
+from search_index import SEARCH_INDEX, index_folders
+from async_llm import AsyncGeminiClient, process_transcript_with_gemini_async
+from run_report import RunReport
+from workflow_manifest import STAGES, WorkflowManifest
+from segment_store import read_transcript_text
+from transcription_worker import WHISPER_WORKER
+from workflow_stages import (
+    segments_path_for, transcribe_params_for, lookup_cached_transcript, fetch_caption_transcript, download_stage,
+    transcribe_stage, record_transcript, save_transcript_stage, summarize_stage, sync_to_vault_stage,
+)
+
+# 用於通知下游 worker 結束的哨兵物件
+_STOP = object()
+
+def load_batch_items(source):
+    """
+    讀取批次任務清單。
+
+    參數:
+    source (str | list): 文字檔路徑、單一網址，或是由網址 / (網址, 基礎名稱) 組成的 list。
+                         文字檔中每行格式為「網址 [基礎名稱]」，# 開頭的行會被忽略。
+                         未提供基礎名稱時，使用影片 ID 作為名稱。
+                         播放清單或頻道網址會展開為其中的每一部影片，並以影片標題作為基礎名稱
+                         (若有提供基礎名稱，則作為前綴)。
+
+    返回:
+    list: 每個元素為 {"url": ..., "basename": ...} 的字典。
+    """
+    raw_entries = []
+    if isinstance(source, str) and re.match(r'https?://', source):
+        raw_entries.append((source, None))
+    elif isinstance(source, str):
+        with open(source, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                parts = line.split(None, 1)
+                raw_entries.append((parts[0], parts[1] if len(parts) > 1 else None))
+    else:
+        for entry in source:
+            if isinstance(entry, str):
+                raw_entries.append((entry, None))
+            else:
+                raw_entries.append((entry[0], entry[1] if len(entry) > 1 else None))
+
+    items = []
+    for url, basename in raw_entries:
+        if is_playlist_url(url):
+            for entry in expand_playlist(url):
+                name = entry["title"] or entry["video_id"]
+                items.append({"url": entry["url"], "basename": f"{basename.strip()} - {name}" if basename else name})
+            continue
+        if not basename or not basename.strip():
+            basename = extract_video_id(url) or f"video_{len(items) + 1}"
+        items.append({"url": url, "basename": basename.strip()})
+    return items
+
+def _start_stage(stage_name, worker_fn, in_queue, out_queue, num_workers, downstream_workers, report,
+                 on_job_update=None, manifest_stages=()):
+    """
+    啟動一個管線階段：num_workers 個執行緒從 in_queue 取任務，
+    處理成功的任務交給 out_queue；全部 worker 結束後，向下游送出對應數量的哨兵。
+    worker_fn(job, metrics) 可在 metrics 中加入此階段的額外指標，計時由 report 負責。
+    on_job_update(job, stage_name, passed) 在階段開始 (passed 為 None) 與結束時呼叫。
+    manifest_stages 為此管線階段涵蓋的 manifest 階段 (見 workflow_manifest.STAGES)；
+    worker_fn 拋出例外時，其中第一個尚未完成的階段會記錄為失敗。
+    """
+    def worker_loop():
+        while True:
+            job = in_queue.get()
+            if job is _STOP:
+                break
+            if on_job_update:
+                on_job_update(job, stage_name, None)
+            try:
+                with report.stage(stage_name, video=job["basename"]) as metrics:
+                    passed = worker_fn(job, metrics)
+                    metrics.setdefault("status", "ok" if passed else "failed")
+            except Exception as e:
+                print(f"[Batch] {stage_name} 階段處理 '{job['basename']}' 時發生未預期的錯誤：{e}")
+                job["status"] = "failed"
+                job["error"] = f"{stage_name}: {e}"
+                passed = False
+                manifest = job.get("manifest")
+                pending = [s for s in manifest_stages if not manifest.is_complete(s)] if manifest else []
+                if pending:
+                    manifest.mark_failed(pending[0], error=str(e))
+            if on_job_update:
+                on_job_update(job, stage_name, passed)
+            if passed and out_queue is not None:
+                out_queue.put(job)
+
+    workers = [
+        threading.Thread(target=worker_loop, name=f"{stage_name}-{i + 1}", daemon=True)
+        for i in range(num_workers)
+    ]
+    for t in workers:
+        t.start()
+
+    def closer():
+        for t in workers:
+            t.join()
+        if out_queue is not None:
+            for _ in range(downstream_workers):
+                out_queue.put(_STOP)
+
+    closer_thread = threading.Thread(target=closer, name=f"{stage_name}-closer", daemon=True)
+    closer_thread.start()
+    return closer_thread
+
+def run_batch_workflow(items, whisper_model_size="base", gemini_api_key=None,
+                       obsidian_notes_target_folder=None, output_directory="downloads",
+                       keep_video_file=False, target_language=None,
+                       download_workers=2, transcribe_workers=1, llm_workers=2, queue_size=2,
+                       keep_model_warm=False, chunked_transcription=False, chunk_seconds=600,
+                       async_llm=False, llm_client_options=None, prometheus_path=None, audio_format="mp3",
+                       force_stage=None, use_ytdlp_api=False, concurrent_fragments=4, download_archive=None,
+                       transcription_backend=None, vad=False, llm_provider=None, on_job_update=None,
+                       caption_policy=None, isolated_transcription=None):
+    """
+    以管線方式批次處理多部影片：下載、轉錄、LLM 統整三個階段同時運作，
+    階段之間以有界佇列 (bounded queue) 連接，每個階段有各自的併發數上限。
+
+    參數:
+    items (list): load_batch_items() 的輸出，或同格式的字典 list。
+    download_workers / transcribe_workers / llm_workers (int): 各階段的併發數。
+    queue_size (int): 階段之間佇列的容量，避免下載遠遠超前轉錄而佔用大量磁碟。
+    keep_model_warm (bool): 批次結束後是否將 Whisper 模型留在模型池中，供同一行程的下一個批次使用。
+    chunked_transcription (bool): 是否以分段平行方式轉錄長音訊 (見 chunked_transcriber.py)。
+    chunk_seconds (float): 分段轉錄時每個片段的目標長度 (秒)。
+    transcription_backend (str, optional): 轉錄引擎 ("openai-whisper" 或 "faster-whisper")，預設依 WHISPER_BACKEND。
+    vad (bool): 轉錄前以語音活動偵測略過靜音與音樂，略過的秒數會記錄在執行報告中。
+    isolated_transcription (bool, optional): 在受監控的子行程中轉錄 (記憶體上限、逾時與進度回報，
+                                             見 transcription_worker.py)，預設依 WHISPER_WORKER。
+                                             此模式下模型不會保留在本行程的模型池中。
+    async_llm (bool): LLM 階段改用非同步 Gemini 用戶端 (見 async_llm.py)，所有 LLM worker 共用
+                      同一組 RPM / TPM 限速器，並對 429 與 5xx 錯誤自動退避重試。
+    llm_client_options (dict, optional): 傳給 AsyncGeminiClient 的設定 (例如 requests_per_minute)。
+    llm_provider (str, optional): "gemini" 或 "openai-compatible" (本地 LLM 伺服器，不需要 API 金鑰；
+                                  所有 LLM worker 共用同一個連線池，async_llm 不適用)，預設依 LLM_PROVIDER。
+    caption_policy (str, optional): 字幕快速路徑的策略 (off / manual / any，見 captions.py)，預設依 CAPTION_POLICY。
+                                    字幕品質足夠的影片在下載階段直接取得逐字稿，不下載音訊也不經過 Whisper。
+    prometheus_path (str, optional): 提供時，另外將各階段指標以 Prometheus 文字格式寫入此檔案。
+    audio_format (str): 下載的音訊格式 (見 download_audio.AUDIO_FORMATS)，wav16k / native 可省去 MP3 重新編碼。
+    force_stage (str, optional): 從指定階段 (見 workflow_manifest.STAGES) 開始重新計算；
+                                 否則每部影片依其 manifest 從上次未完成的階段繼續。
+    use_ytdlp_api (bool): 下載階段改用 yt-dlp 的 Python API，每個下載 worker 持有一個長期存在的 session，
+                          不再為每部影片啟動一個 yt-dlp 行程。
+    concurrent_fragments (int): API 模式下，同一部影片平行下載的片段數。
+    download_archive (str, optional): 下載紀錄檔路徑。紀錄中的影片會直接略過；
+                                      整個流程完成的影片會寫入紀錄，供頻道的增量同步使用。
+    on_job_update (callable, optional): 每部影片進入與完成各階段時呼叫 on_job_update(job, 階段名稱, passed)，
+                                        passed 為 None 代表階段剛開始 (供 job_server.py 回報進度)。
+    各階段的計時與資源用量會附加到 <output_directory>/batch_run_report.jsonl。
+
+    返回:
+    list: 每部影片的處理結果字典 (含 "status"，以及成功時產出的檔案路徑)。
+    """
+    archived = load_download_archive(download_archive)
+    if archived:
+        before = len(items)
+        items = [item for item in items if extract_video_id(item["url"]) not in archived]
+        print(f"[Batch] 下載紀錄中已有 {before - len(items)} 部影片，略過。")
+    jobs = []
+    for index, item in enumerate(items):
+        jobs.append({
+            "index": index,
+            "url": item["url"],
+            "basename": item["basename"],
+            "status": "pending",
+            "error": None,
+        })
+    if not jobs:
+        print("[Batch] 沒有任何任務需要處理。")
+        return []
+
+    download_workers = max(1, download_workers)
+    transcribe_workers = max(1, transcribe_workers)
+    llm_workers = max(1, llm_workers)
+
+    download_queue = queue.Queue()
+    transcribe_queue = queue.Queue(maxsize=max(1, queue_size))
+    llm_queue = queue.Queue(maxsize=max(1, queue_size))
+    transcription_backend = get_backend(transcription_backend).name
+    transcribe_params = transcribe_params_for(whisper_model_size, target_language, backend=transcription_backend,
+                                              chunked=chunked_transcription, vad=vad,
+                                              caption_policy=caption_policy or CAPTION_POLICY)
+    llm_engine = get_llm_provider(llm_provider, gemini_api_key)
+    llm_provider = llm_engine.name
+    llm_model = llm_engine.model_label
+    llm_enabled = bool(gemini_api_key) or not llm_engine.requires_api_key
+    report = RunReport("batch")
+
+    # API 模式下每個下載執行緒各自持有一個 yt-dlp session (YoutubeDL 不是執行緒安全的)
+    session_local = threading.local()
+    sessions = []
+
+    def _thread_session():
+        if not hasattr(session_local, "session"):
+            session_local.session = YtDlpSession(output_directory, audio_format, keep_video_file, concurrent_fragments)
+            sessions.append(session_local.session)
+        return session_local.session
+
+    isolated_transcription = WHISPER_WORKER if isolated_transcription is None else isolated_transcription
+
+    # 各階段的處理與 main.run_workflow 共用 (見 workflow_stages.py)，以下只負責任務狀態與排程
+    def download_job(job, metrics):
+        job["video_id"] = extract_video_id(job["url"])
+        job["file_basename"] = sanitize_for_path(job["basename"])
+        job["output_folder"] = output_folder_for_video(output_directory, job["file_basename"], job["video_id"])
+        job["segments_path"] = segments_path_for(job["output_folder"], job["file_basename"])
+        manifest = job["manifest"] = WorkflowManifest(job["output_folder"], job["file_basename"], force_stage=force_stage)
+        # 先前執行已完成轉錄時，直接沿用逐字稿
+        if manifest.is_complete("transcribe", **transcribe_params):
+            job["resumed_transcript"] = read_transcript_text(manifest.artifact("transcribe", "segments"))
+            job["status"] = "downloaded"
+            metrics["status"] = "resumed"
+            return True
+        # 逐字稿快取命中時，直接跳過下載與轉錄
+        job["transcription"] = lookup_cached_transcript(manifest, transcribe_params, video_id=job["video_id"])
+        if job["transcription"]:
+            job["status"] = "downloaded"
+            metrics["status"] = "cached"
+            return True
+        # 影片字幕品質足夠時，以字幕作為逐字稿，不下載音訊
+        job["transcription"] = fetch_caption_transcript(job["url"], transcribe_params, metrics)
+        if job["transcription"]:
+            job["transcript_source"] = f"captions:{job['transcription']['captions']['kind']}"
+            job["status"] = "downloaded"
+            metrics["status"] = "captions"
+            return True
+        print(f"[Batch] ({job['index'] + 1}/{len(jobs)}) 下載音訊：{job['url']}")
+        job["audio_filepath"] = download_stage(
+            manifest, job["url"], job["basename"], output_directory, job["output_folder"],
+            audio_format=audio_format, keep_video_file=keep_video_file,
+            session=_thread_session() if use_ytdlp_api else None, metrics=metrics
+        )
+        if not job["audio_filepath"]:
+            job["status"] = "failed"
+            job["error"] = "download"
+            return False
+        job["status"] = "downloaded"
+        return True
+
+    # 在第一部影片下載的同時預先載入 Whisper 模型
+    warmup_thread = threading.Thread(target=preload_whisper_model, args=(whisper_model_size, transcription_backend),
+                                     daemon=True)
+
+    def transcribe_job(job, metrics):
+        if warmup_thread.is_alive():
+            warmup_thread.join()
+        manifest = job["manifest"]
+        transcript = job.pop("resumed_transcript", None)
+        if transcript is not None:
+            metrics["status"] = "resumed"
+        else:
+            transcription = job.pop("transcription", None)
+            if transcription:
+                metrics["status"] = "captions" if job.get("transcript_source") else "cached"
+            else:
+                print(f"[Batch] ({job['index'] + 1}/{len(jobs)}) 開始轉錄：{job['file_basename']}")
+                metrics["model"] = whisper_model_size
+                transcription = transcribe_stage(manifest, job["audio_filepath"], transcribe_params,
+                                                 video_id=job["video_id"], chunk_seconds=chunk_seconds,
+                                                 isolated=isolated_transcription, metrics=metrics)
+                if not transcription:
+                    job["status"] = "failed"
+                    job["error"] = "transcribe"
+                    return False
+            record_transcript(manifest, transcription, transcribe_params, job["segments_path"], job["video_id"],
+                              source=job.get("transcript_source"))
+            transcript = transcription["text"]
+        job["transcript"] = transcript
+        job["transcript_txt_path"] = save_transcript_stage(manifest, job["segments_path"], job["output_folder"],
+                                                           job["file_basename"], video_id=job["video_id"])
+        job["status"] = "transcribed"
+        return True
+
+    # 非同步 LLM 模式：在獨立執行緒中執行事件迴圈，各 LLM worker 將請求交給同一個 client
+    async_loop = None
+    async_client = None
+    if async_llm and gemini_api_key and llm_provider == "gemini":
+        async_loop = asyncio.new_event_loop()
+        threading.Thread(target=async_loop.run_forever, name="llm-event-loop", daemon=True).start()
+
+        async def create_client():
+            return AsyncGeminiClient(gemini_api_key, max_concurrency=llm_workers, **(llm_client_options or {}))
+        async_client = asyncio.run_coroutine_threadsafe(create_client(), async_loop).result()
+
+    def llm_job(job, metrics):
+        transcript = job.pop("transcript")
+        progress = f"({job['index'] + 1}/{len(jobs)})"
+        generate = None
+        if llm_enabled and async_loop:
+            def generate(on_chunk, usage_stats):
+                print(f"[Batch] {progress} 開始 LLM 統整：{job['file_basename']}")
+                return asyncio.run_coroutine_threadsafe(
+                    process_transcript_with_gemini_async(async_client, transcript, video_title=job["basename"],
+                                                         usage_stats=usage_stats),
+                    async_loop
+                ).result()
+        elif llm_enabled:
+            def generate(on_chunk, usage_stats):
+                print(f"[Batch] {progress} 開始 LLM 統整：{job['file_basename']}")
+                return process_transcript_with_gemini(
+                    gemini_api_key,
+                    transcript,
+                    video_title=job["basename"],
+                    on_chunk=on_chunk,
+                    usage_stats=usage_stats,
+                    provider=llm_provider
+                )
+        content, job["gemini_md_path"] = summarize_stage(job["manifest"], transcript, job["basename"],
+                                                         job["output_folder"], job["file_basename"], llm_model,
+                                                         generate, metrics)
+        if not job["gemini_md_path"] and metrics["status"] != "skipped":
+            job["status"] = "failed"
+            job["error"] = "save" if content else "llm"
+            return False
+        job["status"] = "done"
+        return True
+
+    def _sync_notes_to_vault():
+        """批次結束後將所有筆記一次同步到 Obsidian Vault (只寫入有變動的筆記，見 vault_sync.py)。"""
+        notes = [(job["manifest"], job["gemini_md_path"]) for job in jobs
+                 if job["status"] == "done" and job.get("gemini_md_path")]
+        if not notes:
+            return
+        with report.stage("copy_to_obsidian", video="batch") as metrics:
+            synced = sync_to_vault_stage(notes, obsidian_notes_target_folder, metrics)
+        for job in jobs:
+            if job.get("gemini_md_path") in synced:
+                job["obsidian_path"] = synced[job["gemini_md_path"]]
+
+    print(f"[Batch] 共 {len(jobs)} 部影片，併發數：下載 {download_workers} / 轉錄 {transcribe_workers} / LLM {llm_workers}")
+    start_time = time.monotonic()
+    if not chunked_transcription and not isolated_transcription:
+        # 分段模式與子行程模式由各 worker 行程自行載入模型，不需要預先載入
+        warmup_thread.start()
+
+    closers = [
+        _start_stage("download", download_job, download_queue, transcribe_queue, download_workers, transcribe_workers,
+                     report, on_job_update, manifest_stages=("download",)),
+        _start_stage("transcribe", transcribe_job, transcribe_queue, llm_queue, transcribe_workers, llm_workers,
+                     report, on_job_update, manifest_stages=("transcribe", "save_transcript")),
+        _start_stage("llm", llm_job, llm_queue, None, llm_workers, 0, report, on_job_update,
+                     manifest_stages=("summarize",)),
+    ]
+    for job in jobs:
+        download_queue.put(job)
+    for _ in range(download_workers):
+        download_queue.put(_STOP)
+    for closer_thread in closers:
+        closer_thread.join()
+    if obsidian_notes_target_folder:
+        _sync_notes_to_vault()
+
+    elapsed = time.monotonic() - start_time
+    for session in sessions:
+        session.close()
+    for job in jobs:
+        if job["status"] == "done":
+            record_in_download_archive(download_archive, extract_video_id(job["url"]))
+    if not keep_model_warm:
+        release_whisper_models()
+    if async_loop:
+        async_loop.call_soon_threadsafe(async_loop.stop)
+    succeeded = sum(1 for job in jobs if job["status"] == "done")
+    print(f"\n[Batch] 批次處理完成：成功 {succeeded} / {len(jobs)}，耗時 {elapsed:.1f} 秒。")
+    for job in jobs:
+        if job["status"] != "done":
+            print(f"[Batch] - 失敗：{job['basename']} ({job['url']}) 於 {job['error']} 階段")
+    # 批次中所有影片的逐字稿與筆記一次加入搜尋索引
+    indexed_folders = [job["output_folder"] for job in jobs if "output_folder" in job]
+    if SEARCH_INDEX and indexed_folders:
+        with report.stage("index", video="batch") as metrics:
+            index_folders(indexed_folders, metrics)
+    report.write_jsonl(os.path.join(output_directory, "batch_run_report.jsonl"))
+    if prometheus_path:
+        report.write_prometheus(prometheus_path)
+    return jobs
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="批次處理多部 YouTube 影片 (非互動模式)")
+    parser.add_argument("source", help="任務清單文字檔 (每行格式為「網址 [基礎名稱]」)，或播放清單 / 頻道網址")
+    parser.add_argument("--model", default="base", choices=["tiny", "base", "small", "medium", "large"],
+                        help="Whisper 模型大小 (預設 base)")
+    parser.add_argument("--language", default=None, help="音訊語言代碼，例如 zh、en (預設自動偵測)")
+    parser.add_argument("--output-dir", default="downloads", help="輸出資料夾 (預設 downloads)")
+    parser.add_argument("--keep-video", action="store_true", help="保留下載的影片檔")
+    parser.add_argument("--download-workers", type=int, default=2, help="下載階段併發數 (預設 2)")
+    parser.add_argument("--transcribe-workers", type=int, default=1, help="轉錄階段併發數 (預設 1)")
+    parser.add_argument("--llm-workers", type=int, default=2, help="LLM 階段併發數 (預設 2)")
+    parser.add_argument("--chunked", action="store_true", help="將長音訊切段並以多個行程平行轉錄 (適合只有 CPU 的機器)")
+    parser.add_argument("--backend", default=None, choices=list(BACKENDS),
+                        help="轉錄引擎：openai-whisper (預設) 或 faster-whisper (CPU 上以 int8 推論，較快)")
+    parser.add_argument("--vad", action="store_true",
+                        help="轉錄前先以語音活動偵測略過片頭、音樂與靜音，只轉錄語音區段")
+    parser.add_argument("--isolated", action="store_true", default=None,
+                        help="在受監控的子行程中轉錄 (記憶體上限與逾時見 WHISPER_WORKER_MAX_RSS_MB / WHISPER_WORKER_TIMEOUT)")
+    parser.add_argument("--chunk-seconds", type=float, default=600, help="分段轉錄時每段的目標長度 (秒，預設 600)")
+    parser.add_argument("--captions", default=None, choices=CAPTION_POLICIES,
+                        help="影片有字幕時直接作為逐字稿 (off / manual / any，預設依環境變數 CAPTION_POLICY)")
+    parser.add_argument("--llm-provider", default=None, choices=LLM_PROVIDERS,
+                        help="LLM 統整使用的服務：gemini 或 openai-compatible (本地 llama.cpp / vLLM 等，見 LOCAL_LLM_*)，"
+                             "預設依環境變數 LLM_PROVIDER")
+    parser.add_argument("--async-llm", action="store_true", help="LLM 階段使用具限速與自動重試的非同步 Gemini 用戶端")
+    parser.add_argument("--rpm", type=int, default=None, help="非同步 LLM 模式下每分鐘請求數上限")
+    parser.add_argument("--tpm", type=int, default=None, help="非同步 LLM 模式下每分鐘 token 數上限")
+    parser.add_argument("--prometheus", default=None, help="將各階段指標以 Prometheus 文字格式寫入指定檔案")
+    parser.add_argument("--audio-format", default="mp3", choices=AUDIO_FORMATS,
+                        help="下載的音訊格式：mp3 (預設)、native (原生串流不轉檔)、wav16k / flac16k (16 kHz 單聲道，轉錄最快)")
+    parser.add_argument("--force-stage", default=None, choices=STAGES,
+                        help="從指定階段 (含) 開始重新計算，忽略先前完成的結果")
+    parser.add_argument("--ytdlp-api", action="store_true",
+                        help="以 yt-dlp 的 Python API 下載 (每個下載 worker 重用同一個 session，播放清單時建議開啟)")
+    parser.add_argument("--concurrent-fragments", type=int, default=4, help="API 模式下每部影片平行下載的片段數 (預設 4)")
+    parser.add_argument("--download-archive", default=None,
+                        help="下載紀錄檔：略過紀錄中的影片，並記錄處理完成的影片 (頻道增量同步用)")
+    parser.add_argument("--queue-size", type=int, default=2, help="階段之間的佇列容量 (預設 2)")
+    args = parser.parse_args()
+
+    batch_items = load_batch_items(args.source)
+    run_batch_workflow(
+        batch_items,
+        whisper_model_size=args.model,
+        gemini_api_key=os.getenv("GOOGLE_API_KEY"),
+        obsidian_notes_target_folder=os.getenv("path_to_obsidian_workspace"),
+        output_directory=args.output_dir,
+        keep_video_file=args.keep_video,
+        target_language=args.language,
+        download_workers=args.download_workers,
+        transcribe_workers=args.transcribe_workers,
+        llm_workers=args.llm_workers,
+        queue_size=args.queue_size,
+        chunked_transcription=args.chunked,
+        chunk_seconds=args.chunk_seconds,
+        transcription_backend=args.backend,
+        vad=args.vad,
+        isolated_transcription=args.isolated,
+        llm_provider=args.llm_provider,
+        caption_policy=args.captions,
+        async_llm=args.async_llm,
+        prometheus_path=args.prometheus,
+        audio_format=args.audio_format,
+        force_stage=args.force_stage,
+        use_ytdlp_api=args.ytdlp_api,
+        concurrent_fragments=args.concurrent_fragments,
+        download_archive=args.download_archive,
+        llm_client_options={
+            key: value for key, value in
+            (("requests_per_minute", args.rpm), ("tokens_per_minute", args.tpm))
+            if value is not None
+        },
+    )
@@ -0,0 +1,553 @@
+# benchmark.py
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+from datetime import datetime
+
+# 離線基準測試：以 ffmpeg 在本地產生不同長度的合成音訊、用假的 yt-dlp 執行檔取代網路下載、
+# 用 fake_gemini_server.py 取代 Gemini API，量測各階段的延遲與吞吐量。
+# 結果存放在 benchmark_results/<commit>.json，可用 --compare 與其他 commit 的結果比較。
+
+RESULTS_DIR = "benchmark_results"
+
+# 假的 yt-dlp：從 stub://<檔名> 取得合成音訊檔，依 -o 樣板、--audio-format 與 --postprocessor-args 輸出
+# (沒有 --audio-format 時視為原生串流，保留來源檔的副檔名)
+_STUB_YT_DLP = r'''#!{python}
+import os, sys, shutil, subprocess
+args = sys.argv[1:]
+template = args[args.index("-o") + 1]
+url = args[-1]
+source = os.path.join(os.environ["BENCH_STUB_AUDIO_DIR"], url.split("stub://", 1)[1])
+audio_format = args[args.index("--audio-format") + 1] if "--audio-format" in args else os.path.splitext(source)[1][1:]
+extra = []
+if "--postprocessor-args" in args:
+    extra = args[args.index("--postprocessor-args") + 1].split(":", 1)[-1].split()
+target = template.replace("%(ext)s", audio_format)
+os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+if source.endswith("." + audio_format) and not extra:
+    shutil.copyfile(source, target)
+else:
+    subprocess.run(["ffmpeg", "-nostdin", "-loglevel", "error", "-y", "-i", source] + extra + [target], check=True)
+print("[ExtractAudio] Destination: " + target)
+'''
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], check=True,
+                              capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def _measure(fn, repeat):
+    """執行 fn 共 repeat 次，返回 (各次秒數, 最後一次的回傳值)。"""
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return timings, result
+
+def _result(suite, name, params, timings, **extra):
+    entry = {
+        "suite": suite,
+        "name": name,
+        "params": params,
+        "runs": len(timings),
+        "median_seconds": round(statistics.median(timings), 6) if timings else None,
+        "min_seconds": round(min(timings), 6) if timings else None,
+    }
+    entry.update(extra)
+    return entry
+
+def _skipped(suite, name, params, reason):
+    print(f"[Benchmark] 跳過 {suite}/{name}：{reason}")
+    return {"suite": suite, "name": name, "params": params, "skipped": reason}
+
+def generate_synthetic_audio(work_dir, seconds, audio_format="mp3"):
+    """
+    以 ffmpeg 產生合成音訊 (有聲段落與靜音交錯)，返回檔案路徑。
+    """
+    path = os.path.join(work_dir, f"synthetic_{seconds}s.{audio_format}")
+    if os.path.exists(path):
+        return path
+    # 3 秒 440 Hz 音調 + 2 秒靜音，重複到指定長度
+    source = "sine=frequency=440:sample_rate=16000,volume='if(lt(mod(t,5),3),1,0)':eval=frame"
+    subprocess.run(
+        ["ffmpeg", "-nostdin", "-loglevel", "error", "-y", "-f", "lavfi", "-i", source,
+         "-t", str(seconds), "-ac", "1", path],
+        check=True
+    )
+    return path
+
+def _synthetic_transcript(approx_bytes):
+    """產生中英混合的合成逐字稿文字。"""
+    sentence = "今天我們要介紹如何使用這個工具。This is a mixed language sentence. 你學會了嗎？Great! "
+    return sentence * max(1, approx_bytes // len(sentence.encode("utf-8")))
+
+def bench_download(ctx):
+    from download_audio import download_youtube_audio
+    results = []
+    for seconds in ctx["durations"]:
+        # 假的原生串流使用 m4a，模擬 YouTube 的 AAC 音訊
+        source_audio = generate_synthetic_audio(ctx["audio_dir"], seconds, audio_format="m4a")
+        out_dir = os.path.join(ctx["work_dir"], "download_out")
+        for audio_format in ctx["audio_formats"]:
+            params = {"audio_seconds": seconds, "audio_format": audio_format}
+
+            def run():
+                shutil.rmtree(out_dir, ignore_errors=True)
+                return download_youtube_audio(f"stub://{os.path.basename(source_audio)}", f"bench_{seconds}s",
+                                              output_directory=out_dir, audio_format=audio_format)
+
+            timings, info = _measure(run, ctx["repeat"])
+            if not info:
+                results.append(_skipped("download", "download_youtube_audio", params, "假的 yt-dlp 執行失敗"))
+                continue
+            size = os.path.getsize(source_audio)
+            results.append(_result("download", "download_youtube_audio", params, timings,
+                                   output_bytes=os.path.getsize(info["audio_filepath"]),
+                                   mb_per_second=round(size / (1024 * 1024) / statistics.median(timings), 3)))
+    return results
+
+def bench_transcribe(ctx):
+    try:
+        from transcriber import transcribe_audio_locally
+    except ImportError as e:
+        return [_skipped("transcribe", "transcribe_audio_locally", {}, f"缺少套件：{e}")]
+    import importlib.util
+    results = []
+    baseline_rtf = {}
+    for backend in ctx["backends"]:
+        module_name = {"openai-whisper": "whisper", "faster-whisper": "faster_whisper"}.get(backend, backend)
+        if importlib.util.find_spec(module_name) is None:
+            results.append(_skipped("transcribe", "transcribe_audio_locally", {"backend": backend},
+                                    f"缺少套件：{module_name}"))
+            continue
+        for model_name in ctx["models"]:
+            for seconds in ctx["durations"]:
+                # mp3 需要 ffmpeg 解碼；wav 為 16 kHz PCM，走直接讀取的路徑
+                for input_format in ("mp3", "wav"):
+                    params = {"backend": backend, "model": model_name, "audio_seconds": seconds,
+                              "input_format": input_format}
+                    audio = generate_synthetic_audio(ctx["audio_dir"], seconds, audio_format=input_format)
+
+                    def run():
+                        return transcribe_audio_locally(audio, model_name=model_name, backend=backend)
+
+                    # 先執行一次讓模型進入模型池，量測的是「模型已載入」的轉錄時間
+                    run()
+                    timings, _ = _measure(run, ctx["repeat"])
+                    rtf = round(statistics.median(timings) / seconds, 4)
+                    extra = {"real_time_factor": rtf}
+                    # 同一段音訊上與預設引擎 (openai-whisper) 的 RTF 比較
+                    same_audio = (model_name, seconds, input_format)
+                    if backend == "openai-whisper":
+                        baseline_rtf[same_audio] = rtf
+                    elif baseline_rtf.get(same_audio):
+                        extra["speedup_vs_openai_whisper"] = round(baseline_rtf[same_audio] / rtf, 2)
+                    results.append(_result("transcribe", "transcribe_audio_locally", params, timings, **extra))
+    return results
+
+def bench_format(ctx):
+    import tracemalloc
+    from sentence_segmenter import write_sentences
+    from segment_store import write_transcript, iter_transcript_text
+    results = []
+    out_dir = os.path.join(ctx["work_dir"], "format_out")
+    os.makedirs(out_dir, exist_ok=True)
+    try:
+        from workflow_stages import format_and_save_transcript_to_txt
+    except ImportError as e:
+        format_and_save_transcript_to_txt = None
+        results.append(_skipped("format", "format_and_save_transcript_to_txt", {}, f"缺少套件：{e}"))
+    for size_kb in ctx["transcript_sizes_kb"]:
+        text = _synthetic_transcript(size_kb * 1024)
+        mb = len(text.encode("utf-8")) / (1024 * 1024)
+        segments_path = os.path.join(out_dir, f"bench_{size_kb}kb.segments.bin")
+        write_transcript(segments_path, text)
+        # 斷句吞吐量：由記憶體中的字串，以及由 .segments.bin 逐塊串流讀取 (main / batch_runner 實際使用的路徑)
+        sources = {"string": lambda: text, "segments_file": lambda: iter_transcript_text(segments_path)}
+        for source, make_input in sources.items():
+            params = {"transcript_kb": size_kb, "source": source}
+
+            def run():
+                with open(os.path.join(out_dir, f"bench_{size_kb}kb_sentences.txt"), 'w', encoding='utf-8') as f:
+                    return write_sentences(make_input(), f)
+
+            timings, _ = _measure(run, ctx["repeat"])
+            # 串流處理的額外記憶體用量應與逐字稿大小無關
+            tracemalloc.start()
+            run()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            results.append(_result("format", "write_sentences", params, timings,
+                                   mb_per_second=round(mb / statistics.median(timings), 3),
+                                   peak_traced_mb=round(peak / (1024 * 1024), 3)))
+        if format_and_save_transcript_to_txt:
+            params = {"transcript_kb": size_kb}
+            timings, _ = _measure(lambda: format_and_save_transcript_to_txt(text, out_dir, f"bench_{size_kb}kb"),
+                                  ctx["repeat"])
+            results.append(_result("format", "format_and_save_transcript_to_txt", params, timings,
+                                   mb_per_second=round(mb / statistics.median(timings), 3)))
+    return results
+
+def _bench_gemini(ctx):
+    """假的 Gemini 伺服器：非同步用戶端的批次吞吐量與同步 SDK 路徑。"""
+    import asyncio
+    from fake_gemini_server import start_fake_gemini_server
+    results = []
+    server, base_url = start_fake_gemini_server(latency=ctx["llm_latency"])
+    try:
+        try:
+            import async_llm
+        except ImportError as e:
+            return [_skipped("llm", "async_llm", {}, f"缺少套件：{e}")]
+        for count in ctx["llm_batch_sizes"]:
+            params = {"transcripts": count, "server_latency": ctx["llm_latency"]}
+            items = [(_synthetic_transcript(20 * 1024), f"bench {i}") for i in range(count)]
+
+            def run():
+                return asyncio.run(async_llm.process_transcripts_async(
+                    "bench-key", items, base_url=base_url, requests_per_minute=0, tokens_per_minute=0,
+                    max_concurrency=ctx["llm_concurrency"],
+                ))
+
+            timings, outputs = _measure(run, ctx["repeat"])
+            results.append(_result("llm", "process_transcripts_async", params, timings,
+                                   succeeded=sum(1 for o in outputs if o),
+                                   transcripts_per_second=round(count / statistics.median(timings), 3)))
+
+        # 同步 SDK 路徑 (google-generativeai 以 REST 連到假伺服器)
+        os.environ["GEMINI_API_ENDPOINT"] = base_url
+        try:
+            import llm_processor
+        except ImportError as e:
+            results.append(_skipped("llm", "process_transcript_with_gemini", {}, f"缺少套件：{e}"))
+            return results
+        llm_processor.GEMINI_API_ENDPOINT = base_url
+        text = _synthetic_transcript(20 * 1024)
+        timings, output = _measure(lambda: llm_processor.process_transcript_with_gemini("bench-key", text, "bench"), ctx["repeat"])
+        results.append(_result("llm", "process_transcript_with_gemini", {"server_latency": ctx["llm_latency"]},
+                               timings, succeeded=bool(output)))
+    finally:
+        server.shutdown()
+    return results
+
+def _bench_local_llm(ctx):
+    """本地 OpenAI 相容伺服器：多份逐字稿同時送出 (伺服器端合併成批次)，記錄吞吐量與實際建立的連線數。"""
+    from concurrent.futures import ThreadPoolExecutor
+    from fake_openai_server import start_fake_openai_server
+    try:
+        import llm_processor
+        from llm_providers import OpenAICompatibleProvider
+    except ImportError as e:
+        return [_skipped("llm", "openai_compatible", {}, f"缺少套件：{e}")]
+    results = []
+    server, base_url = start_fake_openai_server(latency=ctx["llm_latency"])
+    try:
+        for count in ctx["llm_batch_sizes"]:
+            params = {"transcripts": count, "server_latency": ctx["llm_latency"],
+                      "max_connections": ctx["llm_concurrency"]}
+            provider = OpenAICompatibleProvider(base_url=base_url, max_connections=ctx["llm_concurrency"])
+            llm_processor._local_provider = provider
+            texts = [_synthetic_transcript(20 * 1024) for _ in range(count)]
+
+            def run():
+                with ThreadPoolExecutor(max_workers=count) as executor:
+                    return list(executor.map(
+                        lambda text: llm_processor.process_transcript_with_gemini(
+                            None, text, "bench", map_reduce=False, provider="openai-compatible"),
+                        texts))
+
+            timings, outputs = _measure(run, ctx["repeat"])
+            results.append(_result("llm", "openai_compatible", params, timings,
+                                   succeeded=sum(1 for o in outputs if o),
+                                   transcripts_per_second=round(count / statistics.median(timings), 3),
+                                   connections_opened=provider.pool.connections_opened))
+            provider.pool.close()
+    finally:
+        llm_processor._local_provider = None
+        server.shutdown()
+    return results
+
+def bench_llm(ctx):
+    return _bench_gemini(ctx) + _bench_local_llm(ctx)
+
+def bench_search(ctx):
+    """建立合成資料庫的搜尋索引：完整建立、沒有變動時的增量更新，以及查詢延遲。"""
+    import search_index
+    results = []
+    library = os.path.join(ctx["work_dir"], "search_library")
+    db_path = os.path.join(ctx["work_dir"], "search_index.sqlite3")
+    count = ctx["search_documents"]
+    text = _synthetic_transcript(16 * 1024).replace("。", "。\n")
+    for i in range(count):
+        folder = os.path.join(library, f"video_{i}")
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, f"video_{i}_transcript.txt"), 'w', encoding='utf-8') as f:
+            f.write(f"第 {i} 集 episode{i}\n{text}")
+    params = {"documents": count}
+
+    def build():
+        if os.path.exists(db_path):
+            os.remove(db_path)
+        return search_index.update_index(output_directory=library, db_path=db_path, embeddings=False)
+
+    timings, _ = _measure(build, ctx["repeat"])
+    results.append(_result("search", "update_index_full", params, timings,
+                           documents_per_second=round(count / statistics.median(timings), 1)))
+    timings, stats = _measure(lambda: search_index.update_index(output_directory=library, db_path=db_path,
+                                                                embeddings=False), ctx["repeat"])
+    results.append(_result("search", "update_index_unchanged", params, timings, reindexed=stats["indexed"]))
+    for query in ("如何使用", "mixed language", f"episode{count // 2}"):
+        timings, hits = _measure(lambda: search_index.search(query, limit=10, db_path=db_path), ctx["repeat"])
+        results.append(_result("search", "search", dict(params, query=query), timings, hits=len(hits)))
+    return results
+
+def _progress_flood_worker(conn, options):
+    """
+    假的轉錄子行程 (給 bench_worker 使用)：每 0.1 秒送出一次進度，同時以固定速度增加記憶體用量，
+    模擬 large 模型處理長音訊時持續回報進度、記憶體卻不斷上升的情況。
+    """
+    hoard = []
+    started = time.monotonic()
+    seconds = options["seconds"]
+    while time.monotonic() - started < seconds:
+        hoard.append(b"\x01" * int(options["grow_mb_per_second"] * 0.1 * 1024 * 1024))
+        conn.send(("progress", time.monotonic() - started, seconds))
+        time.sleep(0.1)
+    conn.send(("result", {"text": "", "language": None, "segments": []}))
+    conn.close()
+
+def bench_worker(ctx):
+    """
+    確認子行程轉錄的記憶體上限與逾時在子行程持續回報進度時仍會生效，並量測從超過限制到終止子行程所需的時間。
+    未在預期時間內終止的項目 enforced 為 False (執行 benchmark.py 時視為失敗)。
+    """
+    import transcription_worker
+    results = []
+    cases = [
+        ("memory", {"seconds": 8, "grow_mb_per_second": 100}, {"max_rss_mb": 200, "timeout": 0}),
+        ("timeout", {"seconds": 8, "grow_mb_per_second": 0}, {"max_rss_mb": 0, "timeout": 2}),
+    ]
+    for expected, options, limits in cases:
+        params = dict(limits, expected=expected)
+
+        def run():
+            return transcription_worker._run_attempt(dict(options, model_name="synthetic"), limits["max_rss_mb"],
+                                                     limits["timeout"], None, target=_progress_flood_worker)
+
+        timings, (status, _, peak_mb) = _measure(run, ctx["repeat"])
+        enforced = status == expected and max(timings) < options["seconds"]
+        if not enforced:
+            print(f"[Benchmark] 警告：子行程的 {expected} 限制沒有生效 (狀態 {status}，{max(timings):.1f} 秒)。")
+        results.append(_result("worker", "run_attempt_limits", params, timings,
+                               status=status, peak_rss_mb=peak_mb, enforced=enforced))
+    return results
+
+_HEAVY_MODULES = ("torch", "whisper", "faster_whisper", "google.generativeai")
+
+def _parse_importtime(stderr):
+    """解析 python -X importtime 的輸出，返回 [(巢狀深度, 模組名稱, 累計匯入時間 (us)), ...]。"""
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2  # 每多兩個空白代表被上一層模組匯入
+        entries.append((depth, name.strip(), int(cumulative)))
+    return entries
+
+def bench_startup(ctx):
+    """以 -X importtime 量測各入口模組的匯入時間，並確認輕量的入口不會載入 torch / whisper / Gemini SDK。"""
+    results = []
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    check = f"import sys; print(','.join(m for m in {_HEAVY_MODULES!r} if m in sys.modules))"
+    for module in ctx["startup_modules"]:
+        command = [sys.executable, "-X", "importtime", "-c", f"import {module}; {check}"]
+
+        def run():
+            return subprocess.run(command, cwd=repo_dir, capture_output=True, text=True)
+
+        timings, process = _measure(run, ctx["repeat"])
+        if process.returncode != 0:
+            error = process.stderr.strip().splitlines()[-1] if process.stderr.strip() else process.returncode
+            results.append(_skipped("startup", module, {}, f"匯入失敗：{error}"))
+            continue
+        entries = _parse_importtime(process.stderr)
+        total_us = sum(us for depth, name, us in entries if depth == 0 and name == module)
+        # 入口模組直接匯入的套件中最耗時的幾個
+        direct = sorted((us, name) for depth, name, us in entries if depth == 1)[::-1][:5]
+        results.append(_result("startup", f"import {module}", {}, timings,
+                               import_ms=round(total_us / 1000, 1),
+                               heaviest_imports_ms={name: round(us / 1000, 1) for us, name in direct},
+                               heavy_modules_loaded=[m for m in process.stdout.strip().split(",") if m]))
+    return results
+
+SUITES = {
+    "download": bench_download,
+    "transcribe": bench_transcribe,
+    "format": bench_format,
+    "llm": bench_llm,
+    "startup": bench_startup,
+    "search": bench_search,
+    "worker": bench_worker,
+}
+
+def run_benchmarks(suites, durations=(30, 120), models=("tiny", "base"), repeat=3,
+                   transcript_sizes_kb=(100, 1024, 8192), llm_batch_sizes=(1, 8), llm_latency=0.2,
+                   llm_concurrency=4, audio_formats=("mp3", "native", "wav16k"),
+                   backends=("openai-whisper", "faster-whisper"),
+                   startup_modules=("main", "llm_processor", "job_server", "transcriber", "batch_runner"),
+                   search_documents=500):
+    """
+    執行指定的基準測試並返回結果字典 (含 commit、時間與各項結果)。
+    """
+    if not shutil.which("ffmpeg"):
+        print("[Benchmark] 警告：找不到 ffmpeg，需要合成音訊的項目將會失敗。")
+    work_dir = tempfile.mkdtemp(prefix="ytnotes_bench_")
+    audio_dir = os.path.join(work_dir, "audio")
+    bin_dir = os.path.join(work_dir, "bin")
+    os.makedirs(audio_dir)
+    os.makedirs(bin_dir)
+
+    stub_path = os.path.join(bin_dir, "yt-dlp")
+    with open(stub_path, 'w', encoding='utf-8') as f:
+        f.write(_STUB_YT_DLP.replace("{python}", sys.executable))
+    os.chmod(stub_path, 0o755)
+    original_path = os.environ.get("PATH", "")
+    os.environ["PATH"] = bin_dir + os.pathsep + original_path
+    os.environ["BENCH_STUB_AUDIO_DIR"] = audio_dir
+
+    ctx = {
+        "work_dir": work_dir,
+        "audio_dir": audio_dir,
+        "durations": list(durations),
+        "models": list(models),
+        "repeat": max(1, repeat),
+        "transcript_sizes_kb": list(transcript_sizes_kb),
+        "llm_batch_sizes": list(llm_batch_sizes),
+        "llm_latency": llm_latency,
+        "llm_concurrency": llm_concurrency,
+        "startup_modules": list(startup_modules),
+        "search_documents": search_documents,
+        "audio_formats": list(audio_formats),
+        "backends": list(backends),
+    }
+    results = []
+    try:
+        for suite in suites:
+            print(f"\n[Benchmark] === {suite} ===")
+            try:
+                results.extend(SUITES[suite](ctx))
+            except Exception as e:
+                results.append(_skipped(suite, suite, {}, f"執行失敗：{e}"))
+    finally:
+        os.environ["PATH"] = original_path
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        "commit": _git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "platform": sys.platform,
+        "cpu_count": os.cpu_count(),
+        "results": results,
+    }
+
+def save_results(report, results_dir=RESULTS_DIR):
+    os.makedirs(results_dir, exist_ok=True)
+    path = os.path.join(results_dir, f"{report['commit']}.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n[Benchmark] 結果已儲存至：{path}")
+    return path
+
+def load_results(ref, results_dir=RESULTS_DIR):
+    """以 commit 或檔案路徑載入先前的結果。"""
+    path = ref if os.path.isfile(ref) else os.path.join(results_dir, f"{ref}.json")
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def compare_results(baseline, current, threshold=0.10):
+    """
+    比較兩次結果的中位數時間，變慢超過 threshold (比例) 的項目視為效能退化。
+    返回退化項目的 list。
+    """
+    def key(entry):
+        return (entry["suite"], entry["name"], json.dumps(entry["params"], sort_keys=True))
+
+    baseline_by_key = {key(e): e for e in baseline["results"] if e.get("median_seconds")}
+    regressions = []
+    print(f"\n[Benchmark] 比較 {baseline['commit']} → {current['commit']} (門檻 {threshold:.0%})")
+    for entry in current["results"]:
+        old = baseline_by_key.get(key(entry))
+        if not old or not entry.get("median_seconds"):
+            continue
+        ratio = entry["median_seconds"] / old["median_seconds"]
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  <-- 退化"
+            regressions.append({"entry": entry, "baseline": old, "ratio": ratio})
+        elif ratio < 1 - threshold:
+            flag = "  (改善)"
+        print(f"- {entry['suite']}/{entry['name']} {entry['params']}: "
+              f"{old['median_seconds']:.4f}s → {entry['median_seconds']:.4f}s (x{ratio:.2f}){flag}")
+    return regressions
+
+def _int_list(value):
+    return [int(v) for v in value.split(",") if v.strip()]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="下載 / 轉錄 / 整理流程的離線基準測試")
+    parser.add_argument("--suites", default=",".join(SUITES), help=f"要執行的項目 (預設全部：{','.join(SUITES)})")
+    parser.add_argument("--durations", type=_int_list, default=[30, 120], help="合成音訊長度 (秒)，以逗號分隔")
+    parser.add_argument("--backends", default="openai-whisper,faster-whisper",
+                        help="轉錄項目比較的引擎，以逗號分隔 (faster-whisper 會回報相對 openai-whisper 的加速倍數)")
+    parser.add_argument("--audio-formats", default="mp3,native,wav16k", help="下載項目比較的音訊格式，以逗號分隔")
+    parser.add_argument("--models", default="tiny,base", help="轉錄使用的 Whisper 模型，以逗號分隔")
+    parser.add_argument("--transcript-sizes", type=_int_list, default=[100, 1024, 8192], help="合成逐字稿大小 (KB)，以逗號分隔")
+    parser.add_argument("--llm-batch-sizes", type=_int_list, default=[1, 8], help="LLM 階段同時處理的逐字稿數量")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="假 Gemini 伺服器的模擬延遲 (秒)")
+    parser.add_argument("--search-documents", type=int, default=500, help="搜尋索引項目的合成檔案數")
+    parser.add_argument("--repeat", type=int, default=3, help="每個項目重複次數 (取中位數)")
+    parser.add_argument("--compare", default=None, help="與指定 commit (或結果檔路徑) 比較")
+    parser.add_argument("--threshold", type=float, default=0.10, help="視為退化的變慢比例 (預設 0.10)")
+    parser.add_argument("--no-save", action="store_true", help="不儲存本次結果")
+    args = parser.parse_args()
+
+    selected = [s.strip() for s in args.suites.split(",") if s.strip()]
+    unknown = [s for s in selected if s not in SUITES]
+    if unknown:
+        parser.error(f"未知的項目：{', '.join(unknown)}")
+
+    bench_report = run_benchmarks(
+        selected,
+        durations=args.durations,
+        models=[m.strip() for m in args.models.split(",") if m.strip()],
+        repeat=args.repeat,
+        transcript_sizes_kb=args.transcript_sizes,
+        llm_batch_sizes=args.llm_batch_sizes,
+        llm_latency=args.llm_latency,
+        search_documents=args.search_documents,
+        audio_formats=[f.strip() for f in args.audio_formats.split(",") if f.strip()],
+        backends=[b.strip() for b in args.backends.split(",") if b.strip()],
+    )
+    if not args.no_save:
+        save_results(bench_report)
+    unenforced = [e for e in bench_report["results"] if e.get("enforced") is False]
+    if unenforced:
+        print(f"[Benchmark] {len(unenforced)} 個子行程限制檢查失敗。")
+        sys.exit(1)
+    if args.compare:
+        found = compare_results(load_results(args.compare), bench_report, args.threshold)
+        if found:
+            print(f"[Benchmark] 發現 {len(found)} 個效能退化項目。")
+            sys.exit(1)
@@ -0,0 +1,167 @@
+# captions.py
+import os
+import re
+import html
+
+from download_audio import fetch_video_info, download_caption_track
+
+# 字幕快速路徑：影片已有上傳的字幕 (或 YouTube 自動產生的字幕) 時，直接以字幕作為逐字稿，
+# 不必下載完整音訊再以 Whisper 轉錄 (數分鐘的 CPU 工作縮短為數秒)。字幕品質不足時改走原本的音訊路徑。
+#
+# 可透過環境變數 (或 main.py / batch_runner.py 的 --captions) 設定：
+#   CAPTION_POLICY      off (預設，一律使用 Whisper)、manual (只採用上傳的字幕)、any (也接受原始語言的自動字幕)
+#   CAPTION_MIN_SCORE   字幕分數 (0-1) 達到此值才採用 (預設 0.5)
+CAPTION_POLICIES = ("off", "manual", "any")
+CAPTION_POLICY = os.getenv("CAPTION_POLICY", "off")
+CAPTION_MIN_SCORE = float(os.getenv("CAPTION_MIN_SCORE", "0.5"))
+
+# 依字幕種類給予的基本分數：上傳的字幕通常經過校對；自動字幕沒有標點且常有錯字
+_KIND_SCORES = {"manual": 1.0, "auto": 0.7}
+_OTHER_LANGUAGE_FACTOR = 0.6   # 上傳的字幕不是影片原始語言 (多半是翻譯) 時的折扣
+_FULL_COVERAGE = 0.8           # 字幕涵蓋影片長度的比例達到此值視為完整
+_MAX_CANDIDATES = 2            # 最多下載幾個字幕檔評分
+
+_TIMING = re.compile(r'((?:\d+:)?\d{1,2}:\d{2}\.\d{3})\s+-->\s+((?:\d+:)?\d{1,2}:\d{2}\.\d{3})')
+_TAG = re.compile(r'<[^>]*>')
+_CJK_START = re.compile(r'^[　-鿿＀-￯]')
+
+def _seconds(timestamp):
+    value = 0.0
+    for part in timestamp.split(":"):
+        value = value * 60 + float(part)
+    return value
+
+def parse_vtt(text, rolling=False):
+    """
+    解析 WebVTT 字幕為段落。
+
+    參數:
+    rolling (bool): YouTube 自動字幕以「捲動」方式顯示，每個 cue 會重複上一行再加上新的一行；
+                    設為 True 時只保留每個 cue 新出現的行。
+
+    返回:
+    list: [{"start", "end", "text"}, ...]
+    """
+    segments = []
+    last_line = None
+    for block in re.split(r'\r?\n\s*\r?\n', text):
+        lines = block.strip().splitlines()
+        for index, line in enumerate(lines):
+            match = _TIMING.search(line)
+            if match:
+                break
+        else:
+            continue  # WEBVTT 標頭、NOTE 或 STYLE 區塊
+        start, end = _seconds(match.group(1)), _seconds(match.group(2))
+        cue_lines = [html.unescape(_TAG.sub('', l)).strip() for l in lines[index + 1:]]
+        cue_lines = [l for l in cue_lines if l]
+        if rolling:
+            while cue_lines and cue_lines[0] == last_line:
+                cue_lines.pop(0)
+        if not cue_lines:
+            continue
+        last_line = cue_lines[-1]
+        segments.append({"start": start, "end": max(start, end), "text": " ".join(cue_lines)})
+    return segments
+
+def _primary(language_code):
+    return (language_code or "").split("-")[0].lower()
+
+def rank_caption_tracks(info, language=None, policy=CAPTION_POLICY):
+    """
+    依影片資訊中的字幕清單列出候選字幕 (尚未下載)，依基本分數由高到低排序。
+
+    參數:
+    info (dict): yt-dlp 的影片資訊 (含 "subtitles"、"automatic_captions"、"language")。
+    language (str, optional): 指定的語言代碼 (例如 zh、en)，只考慮此語言的字幕；未指定時以影片原始語言為準。
+
+    返回:
+    list: [{"kind", "language", "url", "prior"}, ...]
+    """
+    if policy not in CAPTION_POLICIES:
+        raise ValueError(f"未知的字幕策略 '{policy}'，可用選項：{', '.join(CAPTION_POLICIES)}")
+    if policy == "off":
+        return []
+    wanted = _primary(language or info.get("language"))
+    sources = [("manual", info.get("subtitles") or {})]
+    if policy == "any":
+        sources.append(("auto", info.get("automatic_captions") or {}))
+
+    candidates = []
+    for kind, tracks in sources:
+        for code, formats in tracks.items():
+            if code == "live_chat":
+                continue
+            vtt = next((f for f in formats if f.get("ext") == "vtt" and f.get("url")), None)
+            if not vtt:
+                continue
+            matches = not wanted or _primary(code) == wanted
+            if kind == "auto":
+                # 自動字幕清單包含上百種機器翻譯，只接受原始語言 (新版 yt-dlp 標記為 <語言>-orig)
+                if not (code.endswith("-orig") or (info.get("language") and code == info["language"])):
+                    continue
+                if not matches:
+                    continue
+                prior = _KIND_SCORES["auto"]
+            elif matches:
+                prior = _KIND_SCORES["manual"]
+            elif language:
+                continue  # 指定了語言時，其他語言的字幕一律不採用
+            else:
+                prior = _KIND_SCORES["manual"] * _OTHER_LANGUAGE_FACTOR
+            candidates.append({"kind": kind, "language": code.replace("-orig", ""), "url": vtt["url"], "prior": prior})
+    return sorted(candidates, key=lambda c: c["prior"], reverse=True)
+
+def score_captions(segments, duration, prior):
+    """字幕分數 = 基本分數 × 涵蓋率 (字幕時間跨度占影片長度的比例，達 _FULL_COVERAGE 即視為完整)。"""
+    if not segments:
+        return 0.0
+    if not duration:
+        return prior
+    covered = sum(seg["end"] - seg["start"] for seg in segments)
+    # 自動字幕的 cue 之間常有空隙，改以首尾跨度估計
+    covered = max(covered, segments[-1]["end"] - segments[0]["start"])
+    return round(prior * min(1.0, covered / duration / _FULL_COVERAGE), 3)
+
+def _to_transcription(segments, track, score):
+    """將字幕段落整理成與 Whisper 轉錄結果相同的格式 (段落文字相接即為全文)。"""
+    for seg in segments:
+        if not _CJK_START.match(seg["text"]):
+            seg["text"] = " " + seg["text"]
+    return {
+        "text": "".join(seg["text"] for seg in segments),
+        "language": _primary(track["language"]),
+        "segments": segments,
+        "captions": {"kind": track["kind"], "language": track["language"], "score": score},
+    }
+
+def fetch_captions(video_url, language=None, policy=CAPTION_POLICY, min_score=CAPTION_MIN_SCORE):
+    """
+    取得影片的字幕並評分，分數足夠時返回可直接取代 Whisper 轉錄的結果。
+
+    返回:
+    dict: {"text", "language", "segments", "captions": {"kind", "language", "score"}}；
+          沒有合適的字幕 (或 policy 為 off) 時返回 None，呼叫端應改走音訊路徑。
+    """
+    if policy == "off":
+        return None
+    info = fetch_video_info(video_url)
+    if not info:
+        return None
+    candidates = rank_caption_tracks(info, language, policy)
+    if not candidates:
+        print("[Captions] 沒有符合策略的字幕，改以 Whisper 轉錄。")
+        return None
+    for track in candidates[:_MAX_CANDIDATES]:
+        if track["prior"] < min_score:
+            break
+        content = download_caption_track(track["url"])
+        if not content:
+            continue
+        segments = parse_vtt(content, rolling=track["kind"] == "auto")
+        score = score_captions(segments, info.get("duration"), track["prior"])
+        print(f"[Captions] {track['kind']} 字幕 ({track['language']})：{len(segments)} 段，分數 {score:.2f}")
+        if score >= min_score:
+            return _to_transcription(segments, track, score)
+    print(f"[Captions] 字幕分數未達 {min_score}，改以 Whisper 轉錄。")
+    return None
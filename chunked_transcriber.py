@@ -0,0 +1,232 @@
+# chunked_transcriber.py
+import os
+import re
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from transcriber import load_audio
+from transcription_backends import SAMPLE_RATE, get_backend
+from vad import apply_vad, remap_segments
+
+_FRAME_SECONDS = 0.03                     # 靜音偵測時的音框長度
+
+# 每個 worker 行程各自持有的引擎與模型 (由 _init_worker 載入)
+_worker_backend = None
+_worker_model = None
+_worker_compute_type = None
+
+def find_chunk_boundaries(audio, chunk_seconds=600, search_seconds=30):
+    """
+    在長音訊中尋找切段位置：以 chunk_seconds 為目標長度，
+    在目標位置前後 search_seconds 的範圍內挑選能量最低 (最安靜) 的音框作為切點。
+
+    參數:
+    audio (np.ndarray): 16 kHz 單聲道 float32 音訊。
+    chunk_seconds (float): 每段的目標長度 (秒)。
+    search_seconds (float): 在目標切點附近搜尋靜音的範圍 (秒)。
+
+    返回:
+    list: 切點的樣本索引，第一個為 0、最後一個為 len(audio)。
+    """
+    total = len(audio)
+    chunk_samples = int(chunk_seconds * SAMPLE_RATE)
+    if total <= chunk_samples:
+        return [0, total]
+
+    frame = max(1, int(_FRAME_SECONDS * SAMPLE_RATE))
+    n_frames = total // frame
+    # 每個音框的 RMS 能量
+    energy = np.sqrt(np.mean(audio[:n_frames * frame].reshape(n_frames, frame) ** 2, axis=1))
+
+    boundaries = [0]
+    search = int(search_seconds * SAMPLE_RATE)
+    target = chunk_samples
+    while target < total - chunk_samples // 4:
+        lo = max(boundaries[-1] + chunk_samples // 2, target - search) // frame
+        hi = min(total, target + search) // frame
+        hi = min(hi, n_frames)
+        if hi > lo:
+            cut = (lo + int(np.argmin(energy[lo:hi]))) * frame + frame // 2
+        else:
+            cut = target
+        boundaries.append(cut)
+        target = cut + chunk_samples
+    boundaries.append(total)
+    return boundaries
+
+def _init_worker(model_name, device, num_threads, backend_name=None):
+    """ProcessPool 的初始化函數：每個 worker 行程載入一次自己的模型。"""
+    global _worker_backend, _worker_model, _worker_compute_type
+    _worker_backend = get_backend(backend_name)
+    if num_threads:
+        _worker_backend.set_cpu_threads(num_threads)
+    _worker_compute_type = _worker_backend.compute_type(device)
+    _worker_model = _worker_backend.load_model(model_name, device, _worker_compute_type, cpu_threads=num_threads)
+
+def _transcribe_chunk(index, audio_chunk, offset_seconds, language):
+    """在 worker 行程中轉錄單一片段，並將時間戳記平移回整個檔案的時間軸。"""
+    result = _worker_backend.transcribe(_worker_model, audio_chunk, language=language,
+                                        compute_type=_worker_compute_type, word_timestamps=True)
+    segments = []
+    for seg in result.get("segments", []):
+        words = [
+            {
+                "word": w["word"],
+                "start": w["start"] + offset_seconds,
+                "end": w["end"] + offset_seconds,
+            }
+            for w in seg.get("words", [])
+        ]
+        segments.append({
+            "start": seg["start"] + offset_seconds,
+            "end": seg["end"] + offset_seconds,
+            "text": seg["text"],
+            "avg_logprob": seg.get("avg_logprob"),
+            "no_speech_prob": seg.get("no_speech_prob"),
+            "words": words,
+        })
+    return index, result.get("language"), segments
+
+def _normalize_word(word):
+    return re.sub(r'[\W_]+', '', word).lower()
+
+def _trim_overlap(previous_words, current_words, boundary_seconds, max_match_words=8):
+    """
+    處理兩個相鄰片段的重疊區：以切點為界，前一段保留切點前的字、後一段保留切點後的字；
+    若時間戳記略有偏移導致切點兩側出現相同的字，再以文字比對移除後一段開頭的重複字。
+    """
+    kept_prev = [w for w in previous_words if (w["start"] + w["end"]) / 2 < boundary_seconds]
+    kept_curr = [w for w in current_words if (w["start"] + w["end"]) / 2 >= boundary_seconds]
+
+    tail = [_normalize_word(w["word"]) for w in kept_prev[-max_match_words:]]
+    head = [_normalize_word(w["word"]) for w in kept_curr[:max_match_words]]
+    for size in range(min(len(tail), len(head)), 0, -1):
+        if tail[-size:] == head[:size] and any(tail[-size:]):
+            kept_curr = kept_curr[size:]
+            break
+    return kept_prev, kept_curr
+
+def _words_to_segments(words):
+    """將字依原始的段落編號重新組回段落。"""
+    segments = []
+    for w in words:
+        if segments and segments[-1]["_id"] == w["_segment"]:
+            seg = segments[-1]
+            seg["end"] = w["end"]
+            seg["text"] += w["word"]
+        else:
+            segments.append({"_id": w["_segment"], "start": w["start"], "end": w["end"], "text": w["word"]})
+    for seg in segments:
+        del seg["_id"]
+        seg["text"] = seg["text"].strip()
+    return [seg for seg in segments if seg["text"]]
+
+def stitch_chunk_segments(chunk_results, boundaries_seconds):
+    """
+    將各片段的轉錄結果依時間順序接合，並移除重疊區中重複的字。
+
+    參數:
+    chunk_results (list): 依片段順序排列的段落 list (每個段落需含 "words")。
+    boundaries_seconds (list): 每個片段「不含重疊區」的起點 (秒)，與 chunk_results 等長。
+
+    返回:
+    list: 接合後的段落，每個段落為 {"start", "end", "text"}。
+    """
+    stitched = []
+    segment_id = 0
+    for index, segments in enumerate(chunk_results):
+        words = []
+        for seg in segments:
+            seg_words = seg["words"] or [{"word": seg["text"], "start": seg["start"], "end": seg["end"]}]
+            for w in seg_words:
+                words.append(dict(w, _segment=segment_id))
+            segment_id += 1
+        if index == 0 or not stitched:
+            stitched.extend(words)
+            continue
+        # 只需要與前一段落在重疊區附近的字比對
+        boundary = boundaries_seconds[index]
+        split_at = len(stitched)
+        while split_at > 0 and stitched[split_at - 1]["end"] > boundary - 60:
+            split_at -= 1
+        kept_prev, kept_curr = _trim_overlap(stitched[split_at:], words, boundary)
+        stitched = stitched[:split_at] + kept_prev + kept_curr
+    return _words_to_segments(stitched)
+
+def transcribe_in_chunks(audio_file_path, model_name="base", target_language=None,
+                         chunk_seconds=600, overlap_seconds=5, num_workers=None, device="cpu", backend=None,
+                         vad=False, on_progress=None):
+    """
+    將長音訊在靜音處切成多個片段 (相鄰片段保留 overlap_seconds 的重疊)，
+    以多個行程平行轉錄 (每個 worker 持有自己的模型)，再依時間軸接合。
+
+    參數:
+    audio_file_path (str): 音訊檔案路徑。
+    chunk_seconds (float): 每個片段的目標長度 (秒)。
+    overlap_seconds (float): 相鄰片段的重疊長度 (秒)，用來避免在切點處漏字。
+    num_workers (int, optional): 平行 worker 數量，預設依 CPU 核心數決定。
+    device (str): 執行裝置，此模式主要針對只有 CPU 的機器。
+    backend (str, optional): 轉錄引擎 (見 transcription_backends)。
+    vad (bool): 是否只轉錄語音區段 (見 vad.py)；切段在去除靜音後的音訊上進行。
+    on_progress (callable, optional): 每完成一個片段呼叫 on_progress(已完成片段的總秒數, 總秒數)。
+
+    返回:
+    dict: {"text": 全文, "language": 語言代碼, "segments": [{"start", "end", "text"}, ...]}
+    """
+    audio = load_audio(audio_file_path, backend)
+    timeline = None
+    if vad:
+        audio, timeline = apply_vad(audio)
+    boundaries = find_chunk_boundaries(audio, chunk_seconds=chunk_seconds)
+    overlap = int(overlap_seconds * SAMPLE_RATE)
+
+    cpu_count = os.cpu_count() or 1
+    if num_workers is None:
+        # 每個 worker 至少分配 2 個執行緒，避免 PyTorch 執行緒互搶
+        num_workers = max(1, min(len(boundaries) - 1, cpu_count // 2))
+    num_workers = max(1, min(num_workers, len(boundaries) - 1))
+    threads_per_worker = max(1, cpu_count // num_workers)
+
+    duration = len(audio) / SAMPLE_RATE
+    print(f"[Transcriber] 音訊長度 {duration:.0f} 秒，切成 {len(boundaries) - 1} 個片段，"
+          f"使用 {num_workers} 個 worker (每個 {threads_per_worker} 執行緒) 平行轉錄。")
+
+    chunk_results = [None] * (len(boundaries) - 1)
+    languages = []
+    # 使用 spawn 避免在已載入 PyTorch 的行程中 fork 造成 OpenMP 死結
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=num_workers, mp_context=context,
+                             initializer=_init_worker,
+                             initargs=(model_name, device, threads_per_worker, backend)) as executor:
+        futures = []
+        for i in range(len(boundaries) - 1):
+            start = max(0, boundaries[i] - overlap)
+            end = boundaries[i + 1]
+            futures.append(executor.submit(_transcribe_chunk, i, audio[start:end], start / SAMPLE_RATE, target_language))
+        del audio
+        done_seconds = 0.0
+        for future in as_completed(futures):
+            index, language, segments = future.result()
+            chunk_results[index] = segments
+            if language:
+                languages.append(language)
+            print(f"[Transcriber] 片段 {index + 1}/{len(chunk_results)} 轉錄完成。")
+            done_seconds += (boundaries[index + 1] - boundaries[index]) / SAMPLE_RATE
+            if on_progress:
+                on_progress(done_seconds, duration)
+
+    boundaries_seconds = [b / SAMPLE_RATE for b in boundaries[:-1]]
+    segments = remap_segments(stitch_chunk_segments(chunk_results, boundaries_seconds), timeline)
+    # 以空白連接各段落，與 Whisper 的 result["text"] 形式一致 (段落文字相接即為全文)
+    for seg in segments:
+        if not re.match(r'^[　-鿿＀-￯]', seg["text"]):
+            seg["text"] = " " + seg["text"]
+    text = "".join(seg["text"] for seg in segments)
+    language = target_language or (Counter(languages).most_common(1)[0][0] if languages else None)
+    result = {"text": text, "language": language, "segments": segments}
+    if timeline is not None:
+        result["vad"] = timeline.stats()
+    return result
@@ -1,6 +1,11 @@
 import subprocess
 import os
 import re
+import json
+import shutil
+import tempfile
+import threading
+import urllib.request
 
 def sanitize_for_path(name):
     """
@@ -18,14 +23,162 @@ def sanitize_for_path(name):
         return "untitled"
     return name
 
-def download_youtube_audio(video_url, desired_basename, output_directory="downloads", keep_video_file=False):
+def extract_video_id(video_url):
+    """
+    從 YouTube 網址中取出影片 ID (例如 watch?v=xxxx、youtu.be/xxxx、shorts/xxxx)。
+    無法辨識時返回 None。
+    """
+    if not video_url:
+        return None
+    match = re.search(
+        r'(?:v=|/shorts/|/live/|/embed/|youtu\.be/)([A-Za-z0-9_-]{11})',
+        video_url
+    )
+    if match:
+        return match.group(1)
+    return None
+
+# 支援的音訊輸出格式：
+#   mp3      轉檔為最高音質 MP3 (預設，與舊版行為相同)
+#   native   保留 YouTube 原生的音訊串流 (m4a / opus)，只做封裝轉換，不重新編碼
+#   wav16k   直接輸出 16 kHz 單聲道 PCM WAV，轉錄時不需要再解碼
+#   flac16k  直接輸出 16 kHz 單聲道 FLAC (無損壓縮，檔案比 WAV 小)
+AUDIO_FORMATS = ("mp3", "native", "wav16k", "flac16k")
+# native 格式下 yt-dlp 可能產生的音訊副檔名
+_NATIVE_AUDIO_EXTENSIONS = (".m4a", ".opus", ".webm", ".ogg", ".aac", ".mp3")
+
+def _audio_format_arguments(audio_format):
+    """返回指定音訊格式對應的 yt-dlp 參數與預期的副檔名 (native 時副檔名未知，返回 None)。"""
+    if audio_format == "native":
+        return ["-f", "bestaudio/best", "-x"], None
+    if audio_format in ("wav16k", "flac16k"):
+        codec = audio_format[:-3]
+        return [
+            "-f", "bestaudio/best", "-x",
+            "--audio-format", codec,
+            # 由 yt-dlp 呼叫的 ffmpeg 直接重取樣為 Whisper 使用的 16 kHz 單聲道
+            "--postprocessor-args", "ExtractAudio:-ar 16000 -ac 1",
+        ], "." + codec
+    return [
+        "-x",             # 提取音訊
+        "--audio-format", "mp3", # 指定音訊格式為 mp3
+        "--audio-quality", "0",  # 最佳音質
+    ], ".mp3"
+
+def _audio_extensions(audio_format):
+    """返回音訊格式可能產生的副檔名。"""
+    if audio_format == "native":
+        return _NATIVE_AUDIO_EXTENSIONS
+    return (_audio_format_arguments(audio_format)[1],)
+
+def output_folder_for_video(output_directory, desired_basename, video_id=None):
+    """
+    返回影片的輸出資料夾。有影片 ID 時資料夾名稱為「<基礎名稱> [<影片ID>]」(與 yt-dlp 預設的檔名樣板相同)，
+    不同影片即使基礎名稱相同也不會寫入同一個資料夾；基礎名稱就是影片 ID 或沒有影片 ID (非 YouTube 網址) 時只用基礎名稱。
+    資料夾內的檔名仍以基礎名稱開頭。
+    """
+    sanitized_basename = sanitize_for_path(desired_basename)
+    if not video_id or sanitized_basename == video_id:
+        return os.path.join(output_directory, sanitized_basename)
+    return os.path.join(output_directory, f"{sanitized_basename} [{video_id}]")
+
+def find_output_folders(output_directory, desired_basename):
+    """
+    列出基礎名稱對應的既有輸出資料夾 (<基礎名稱> 或 <基礎名稱> [<影片ID>])，
+    供沒有提供網址 (無法得知影片 ID) 時找回先前的輸出。
+
+    返回:
+    list: [(資料夾路徑, 影片 ID 或 None), ...]，依名稱排序。
+    """
+    sanitized_basename = sanitize_for_path(desired_basename)
+    if not os.path.isdir(output_directory):
+        return []
+    pattern = re.compile(re.escape(sanitized_basename) + r"(?: \[([A-Za-z0-9_-]{11})\])?$")
+    found = []
+    for name in sorted(os.listdir(output_directory)):
+        match = pattern.match(name)
+        folder = os.path.join(output_directory, name)
+        if match and os.path.isdir(folder):
+            found.append((folder, match.group(1)))
+    return found
+
+def find_downloaded_audio(output_directory, video_id, audio_format):
+    """
+    在 output_directory 中尋找同一部影片 (依影片 ID) 先前已下載、格式相同的音訊，找到時可完全跳過 yt-dlp。
+    同一部影片以其他基礎名稱下載過 (資料夾名稱不同) 時也能找到。
+
+    返回:
+    str: 音訊檔路徑，找不到時返回 None。
+    """
+    if not video_id or not os.path.isdir(output_directory):
+        return None
+    suffix = f" [{video_id}]"
+    for name in sorted(os.listdir(output_directory)):
+        if name == video_id:
+            basename = name
+        elif name.endswith(suffix):
+            basename = name[:-len(suffix)]
+        else:
+            continue
+        for ext in _audio_extensions(audio_format):
+            candidate = os.path.join(output_directory, name, basename + ext)
+            if os.path.isfile(candidate):
+                return candidate
+    return None
+
+def _promote_staged_files(staging_folder, video_specific_folder, sanitized_basename):
+    """
+    將暫存資料夾中下載完成的檔案以 os.replace 移入影片資料夾 (同一個檔案系統，改名是原子操作)，
+    yt-dlp 的中繼檔 (<基礎名稱>.f<格式代碼>.<副檔名>) 與未完成的 .part 檔留在暫存資料夾中隨之刪除。
+
+    返回:
+    list: 移入影片資料夾的檔案路徑。
+    """
+    intermediate_file_pattern = re.compile(r"^" + re.escape(sanitized_basename) + r"\.f\d+\..+$")
+    promoted = []
+    for filename in sorted(os.listdir(staging_folder)):
+        staged_path = os.path.join(staging_folder, filename)
+        if (not os.path.isfile(staged_path) or intermediate_file_pattern.match(filename)
+                or filename.endswith((".part", ".ytdl", ".temp"))):
+            continue
+        final_path = os.path.join(video_specific_folder, filename)
+        os.replace(staged_path, final_path)
+        promoted.append(final_path)
+    return promoted
+
+def _reused_download_info(audio_path, audio_format, video_specific_folder, sanitized_basename):
+    print(f"[Downloader] 已有同一部影片 ({audio_format}) 的音訊，跳過下載：{audio_path}")
+    return {
+        "audio_filepath": audio_path,
+        "audio_format": audio_format,
+        "mp3_filepath": audio_path,
+        "output_folder": video_specific_folder,
+        "basename": sanitized_basename,
+        "reused": True,
+    }
+
+def download_youtube_audio(video_url, desired_basename, output_directory="downloads", keep_video_file=False,
+                           audio_format="mp3", reuse_existing=True):
     """
     下載指定 YouTube 影片的音訊，並使用使用者指定的基礎名稱儲存。
     可選擇是否保留原始下載的影片檔，並會嘗試清理中繼檔案。
+    輸出資料夾依影片 ID 區分 (見 output_folder_for_video)；yt-dlp 先寫入這次下載專用的暫存資料夾，
+    完成後才將檔案移入輸出資料夾，多個下載同時進行時不會互相覆寫或刪除對方的檔案。
+    同一部影片已有相同格式的音訊時 (見 find_downloaded_audio) 不會執行 yt-dlp。
+
+    參數:
+    audio_format (str): 音訊輸出格式，見 AUDIO_FORMATS。非 mp3 的格式可省去 MP3 重新編碼的 CPU 成本。
+    reuse_existing (bool): 為 False 時一律重新下載 (例如 --force-stage download)，不沿用既有的音訊。
 
     返回:
-    dict: 包含 "mp3_filepath", "output_folder", "basename" 的字典，如果失敗則返回 None。
+    dict: 包含 "audio_filepath", "audio_format", "output_folder", "basename" 的字典，如果失敗則返回 None。
+          為了相容舊程式，"mp3_filepath" 同樣指向下載的音訊檔 (不一定是 MP3)。
+          沿用先前下載的音訊時另有 "reused": True。
     """
+    if audio_format not in AUDIO_FORMATS:
+        print(f"[Downloader] 錯誤：不支援的音訊格式 '{audio_format}'，可用格式：{', '.join(AUDIO_FORMATS)}")
+        return None
+
     sanitized_basename = sanitize_for_path(desired_basename)
     if not sanitized_basename or (sanitized_basename == "untitled" and desired_basename.strip() != "untitled"):
         print(f"警告：提供的基礎名稱 '{desired_basename}' 清理後變為 '{sanitized_basename}'。")
@@ -33,29 +186,43 @@ def download_youtube_audio(video_url, desired_basename, output_directory="downlo
              print("錯誤：基礎名稱無效，無法下載。")
              return None
 
-    video_specific_folder = os.path.join(output_directory, sanitized_basename)
+    video_id = extract_video_id(video_url)
+    video_specific_folder = output_folder_for_video(output_directory, sanitized_basename, video_id)
 
-    # 建立基礎儲存下載檔案的資料夾 (如果不存在)
-    if not os.path.exists(output_directory):
-        os.makedirs(output_directory)
-        print(f"[Downloader] 已建立基礎資料夾：{output_directory}")
+    if reuse_existing and not keep_video_file:
+        existing_audio = find_downloaded_audio(output_directory, video_id, audio_format)
+        if existing_audio:
+            return _reused_download_info(existing_audio, audio_format, video_specific_folder, sanitized_basename)
 
-    # 建立影片專用的子資料夾 (如果不存在)
-    if not os.path.exists(video_specific_folder):
-        os.makedirs(video_specific_folder)
-        print(f"[Downloader] 已建立影片專用資料夾：{video_specific_folder}")
-    
-    output_template_path = os.path.join(video_specific_folder, sanitized_basename + ".%(ext)s")
-    expected_mp3_path = os.path.join(video_specific_folder, sanitized_basename + ".mp3")
+    # 建立基礎資料夾與影片專用的子資料夾 (如果不存在)；多個下載 worker 可能同時建立，exist_ok 避免競爭時失敗
+    try:
+        if not os.path.exists(output_directory):
+            os.makedirs(output_directory, exist_ok=True)
+            print(f"[Downloader] 已建立基礎資料夾：{output_directory}")
+        if not os.path.exists(video_specific_folder):
+            os.makedirs(video_specific_folder, exist_ok=True)
+            print(f"[Downloader] 已建立影片專用資料夾：{video_specific_folder}")
+        # 這次下載專用的暫存資料夾 (放在影片資料夾內，確保與目的地在同一個檔案系統)
+        staging_folder = tempfile.mkdtemp(prefix=".download-", dir=video_specific_folder)
+    except OSError as e:
+        print(f"[Downloader] 錯誤：無法建立輸出資料夾 {video_specific_folder} - {e}")
+        return None
+    output_template_path = os.path.join(staging_folder, sanitized_basename + ".%(ext)s")
+    format_arguments, expected_extension = _audio_format_arguments(audio_format)
+    expected_audio_path = (
+        os.path.join(video_specific_folder, sanitized_basename + expected_extension)
+        if expected_extension else None
+    )
 
     command = [
         "yt-dlp",
         "--no-progress",  # 不顯示下載進度條
         "--console-title", # 在視窗標題顯示進度 (如果適用)
-        "-x",             # 提取音訊
-        "--audio-format", "mp3", # 指定音訊格式為 mp3
-        "--audio-quality", "0",  # 最佳音質
     ]
+    if keep_video_file and format_arguments[:2] == ["-f", "bestaudio/best"]:
+        # 保留影片時需要下載完整的影音格式，不能只選音訊串流
+        format_arguments = format_arguments[2:]
+    command.extend(format_arguments)
 
     if keep_video_file:
         command.append("-k") # 或 --keep-video
@@ -82,11 +249,23 @@ def download_youtube_audio(video_url, desired_basename, output_directory="downlo
             for line in process.stdout.splitlines():
                 if "Destination:" in line or "Deleting" in line or "ERROR:" in line or "WARNING:" in line or "Keeping video" in line or "Merging formats" in line:
                     print(line)
-        
-        if os.path.exists(expected_mp3_path):
-            print(f"\n[Downloader] 音訊成功下載並儲存於：{expected_mp3_path}")
+
+        _promote_staged_files(staging_folder, video_specific_folder, sanitized_basename)
+
+        if expected_audio_path is None:
+            # native 格式：依 yt-dlp 實際產生的副檔名尋找音訊檔
+            for ext in _NATIVE_AUDIO_EXTENSIONS:
+                candidate = os.path.join(video_specific_folder, sanitized_basename + ext)
+                if os.path.isfile(candidate):
+                    expected_audio_path = candidate
+                    break
+
+        if expected_audio_path and os.path.exists(expected_audio_path):
+            print(f"\n[Downloader] 音訊成功下載並儲存於：{expected_audio_path}")
             download_result_info = {
-                "mp3_filepath": expected_mp3_path,
+                "audio_filepath": expected_audio_path,
+                "audio_format": audio_format,
+                "mp3_filepath": expected_audio_path,
                 "output_folder": video_specific_folder,
                 "basename": sanitized_basename
             }
@@ -97,7 +276,7 @@ def download_youtube_audio(video_url, desired_basename, output_directory="downlo
                 for ext in clean_video_extensions:
                     normalized_ext = ext if ext.startswith('.') else '.' + ext
                     video_file_path_to_check = os.path.join(video_specific_folder, sanitized_basename + normalized_ext)
-                    if os.path.exists(video_file_path_to_check) and os.path.isfile(video_file_path_to_check) and video_file_path_to_check != expected_mp3_path:
+                    if os.path.exists(video_file_path_to_check) and os.path.isfile(video_file_path_to_check) and video_file_path_to_check != expected_audio_path:
                          found_video_files.append(video_file_path_to_check)
                 
                 if found_video_files:
@@ -108,7 +287,7 @@ def download_youtube_audio(video_url, desired_basename, output_directory="downlo
                     print("\n[Downloader] 已選擇保留影片，但未自動偵測到「乾淨」的影片檔案。")
                     print("[Downloader] yt-dlp 可能下載了非預期副檔名的影片，或所有影片檔都帶有格式代碼。")
         else:
-            print(f"\n[Downloader] 警告：預期的 MP3 檔案 '{expected_mp3_path}' 未在指定位置找到。")
+            print(f"\n[Downloader] 警告：預期的音訊檔案 '{expected_audio_path or sanitized_basename}' 未在指定位置找到。")
             # download_result_info 保持為 None
 
     except subprocess.CalledProcessError as e:
@@ -131,31 +310,202 @@ def download_youtube_audio(video_url, desired_basename, output_directory="downlo
         print(f"[Downloader] 發生未預期的錯誤：{e}")
         return None
     finally:
-        # 清理中繼檔案的邏輯
-        if os.path.isdir(video_specific_folder):
-            print("\n[Downloader] 檢查並清理中繼檔案...")
-            intermediate_file_pattern = re.compile(
-                r"^" + re.escape(sanitized_basename) + r"\.f\d+\..+$"
-            )
-            cleaned_count = 0
-            try:
-                for filename_in_folder in os.listdir(video_specific_folder):
-                    full_file_path = os.path.join(video_specific_folder, filename_in_folder)
-                    if os.path.isfile(full_file_path) and intermediate_file_pattern.match(filename_in_folder):
-                        try:
-                            os.remove(full_file_path)
-                            print(f"- 已刪除中繼檔案：{full_file_path}")
-                            cleaned_count += 1
-                        except OSError as e_remove:
-                            print(f"- 無法刪除檔案 {full_file_path}: {e_remove}")
-            except Exception as e_listdir:
-                 print(f"[Downloader] 讀取資料夾內容時發生錯誤：{e_listdir}")
-
-            if cleaned_count == 0:
-                print("[Downloader] 沒有找到符合模式需要清理的中繼檔案。")
-        
+        # 中繼檔案與未完成的檔案只會留在這次下載的暫存資料夾中，直接整個刪除，不會動到其他下載的檔案
+        leftover_files = os.listdir(staging_folder) if os.path.isdir(staging_folder) else []
+        shutil.rmtree(staging_folder, ignore_errors=True)
+        if leftover_files:
+            print(f"\n[Downloader] 已清理 {len(leftover_files)} 個中繼檔案。")
+
     return download_result_info
 
+
+# ---------------------------------------------------------------------------
+# 字幕快速路徑 (見 captions.py)：只讀取影片資訊與字幕檔，不下載音訊
+# ---------------------------------------------------------------------------
+
+def fetch_video_info(video_url):
+    """
+    以 yt-dlp -J 取得影片資訊 (標題、長度、語言、上傳的字幕與自動字幕清單)，不下載任何檔案。
+
+    返回:
+    dict: yt-dlp 的影片資訊，失敗時返回 None。
+    """
+    command = ["yt-dlp", "-J", "--skip-download", "--no-warnings", "--no-playlist", video_url]
+    try:
+        process = subprocess.run(command, check=True, capture_output=True, text=True, encoding='utf-8')
+        return json.loads(process.stdout)
+    except subprocess.CalledProcessError as e:
+        print(f"[Downloader] 無法取得影片資訊 (返回碼 {e.returncode})：{(e.stderr or '').strip()[-300:]}")
+    except FileNotFoundError:
+        print("[Downloader] 錯誤：找不到 'yt-dlp' 命令。請確認 yt-dlp 已安裝並加入到系統 PATH。")
+    except ValueError as e:
+        print(f"[Downloader] 無法解析 yt-dlp 輸出的影片資訊：{e}")
+    return None
+
+def download_caption_track(track_url, timeout=30):
+    """下載單一字幕檔 (影片資訊中的字幕網址)，返回文字內容，失敗時返回 None。"""
+    try:
+        with urllib.request.urlopen(track_url, timeout=timeout) as response:
+            return response.read().decode("utf-8", "replace")
+    except (OSError, ValueError) as e:
+        print(f"[Downloader] 下載字幕失敗：{e}")
+        return None
+
+# ---------------------------------------------------------------------------
+# 播放清單 / 頻道模式：透過 yt-dlp 的 Python API 在同一個行程中展開與下載
+# ---------------------------------------------------------------------------
+
+_ARCHIVE_LOCK = threading.Lock()
+
+def is_playlist_url(url):
+    """判斷網址是否為播放清單或頻道 (而不是單一影片)。"""
+    if not url or extract_video_id(url):
+        return False
+    return bool(re.search(r'[?&]list=|/playlist\b|/@[^/?#]+|/channel/|/c/|/user/', url))
+
+def _ytdlp_options(audio_format, keep_video_file=False, concurrent_fragments=4):
+    """將 AUDIO_FORMATS 對應為 yt-dlp Python API 的參數 (與 _audio_format_arguments 的命令列參數相同)。"""
+    extract_audio = {"key": "FFmpegExtractAudio"}
+    options = {
+        "format": "bestaudio/best",
+        "quiet": True,
+        "no_warnings": True,
+        "noprogress": True,
+        # 同一部影片的 DASH 片段平行下載
+        "concurrent_fragment_downloads": max(1, concurrent_fragments),
+    }
+    if audio_format == "native":
+        extract_audio["preferredcodec"] = "best"
+    elif audio_format in ("wav16k", "flac16k"):
+        extract_audio["preferredcodec"] = audio_format[:-3]
+        options["postprocessor_args"] = {"extractaudio": ["-ar", "16000", "-ac", "1"]}
+    else:
+        extract_audio.update({"preferredcodec": "mp3", "preferredquality": "0"})
+    options["postprocessors"] = [extract_audio]
+    if keep_video_file:
+        del options["format"]
+        options["keepvideo"] = True
+        options["merge_output_format"] = "mp4/webm/mkv"
+    return options
+
+class YtDlpSession:
+    """
+    以單一 yt-dlp (Python API) 實例連續下載多部影片，省去每部影片都重新啟動 yt-dlp 行程與初始化 extractor 的成本，
+    並重用同一個 HTTP 連線池。YoutubeDL 物件不是執行緒安全的，多個下載 worker 應各自持有一個 session。
+    """
+
+    def __init__(self, output_directory="downloads", audio_format="mp3", keep_video_file=False, concurrent_fragments=4):
+        if audio_format not in AUDIO_FORMATS:
+            raise ValueError(f"不支援的音訊格式 '{audio_format}'，可用格式：{', '.join(AUDIO_FORMATS)}")
+        import yt_dlp  # 只有播放清單 / API 模式需要，延後載入
+        self.output_directory = output_directory
+        self.audio_format = audio_format
+        self.keep_video_file = keep_video_file
+        self._download_error = yt_dlp.utils.DownloadError
+        self._ydl = yt_dlp.YoutubeDL(_ytdlp_options(audio_format, keep_video_file, concurrent_fragments))
+
+    def download_audio(self, video_url, desired_basename, reuse_existing=True):
+        """
+        下載單一影片的音訊，資料夾與檔名規則、暫存資料夾與沿用既有音訊的行為 (reuse_existing) 都與 download_youtube_audio 相同。
+
+        返回:
+        dict: 與 download_youtube_audio 相同格式的字典，失敗時返回 None。
+        """
+        sanitized_basename = sanitize_for_path(desired_basename)
+        video_id = extract_video_id(video_url)
+        video_specific_folder = output_folder_for_video(self.output_directory, sanitized_basename, video_id)
+        if reuse_existing and not self.keep_video_file:
+            existing_audio = find_downloaded_audio(self.output_directory, video_id, self.audio_format)
+            if existing_audio:
+                return _reused_download_info(existing_audio, self.audio_format, video_specific_folder,
+                                             sanitized_basename)
+        try:
+            os.makedirs(video_specific_folder, exist_ok=True)
+            staging_folder = tempfile.mkdtemp(prefix=".download-", dir=video_specific_folder)
+        except OSError as e:
+            print(f"[Downloader] (API) 錯誤：無法建立輸出資料夾 {video_specific_folder} - {e}")
+            return None
+        # 每部影片的輸出路徑不同，下載前更新此 session 的輸出樣板
+        self._ydl.params["outtmpl"] = {"default": os.path.join(staging_folder, sanitized_basename + ".%(ext)s")}
+        print(f"[Downloader] (API) 正在下載：{video_url} → {video_specific_folder}")
+        try:
+            info = self._ydl.extract_info(video_url, download=True)
+            _promote_staged_files(staging_folder, video_specific_folder, sanitized_basename)
+        except self._download_error as e:
+            print(f"[Downloader] (API) 下載失敗：{video_url} - {e}")
+            return None
+        finally:
+            shutil.rmtree(staging_folder, ignore_errors=True)
+        downloads = (info or {}).get("requested_downloads") or []
+        audio_path = downloads[-1].get("filepath") if downloads else None
+        if audio_path:
+            audio_path = os.path.join(video_specific_folder, os.path.basename(audio_path))
+        if not audio_path or not os.path.isfile(audio_path):
+            print(f"[Downloader] (API) 警告：找不到 '{sanitized_basename}' 的音訊檔案。")
+            return None
+        print(f"[Downloader] (API) 音訊成功下載並儲存於：{audio_path}")
+        return {
+            "audio_filepath": audio_path,
+            "audio_format": self.audio_format,
+            "mp3_filepath": audio_path,
+            "output_folder": video_specific_folder,
+            "basename": sanitized_basename,
+        }
+
+    def close(self):
+        self._ydl.close()
+
+def expand_playlist(playlist_url, max_depth=2):
+    """
+    展開播放清單或頻道中的所有影片 (只讀取清單，不下載)。頻道網址會先展開為各分頁 (影片、Shorts、直播) 再展開。
+
+    返回:
+    list: 每個元素為 {"url", "video_id", "title"} 的字典，依清單順序排列並去除重複。
+    """
+    import yt_dlp
+    entries = []
+    seen = set()
+
+    def collect(info, depth):
+        for entry in info.get("entries") or []:
+            if not entry:
+                continue
+            if entry.get("_type") == "playlist" or (entry.get("_type") == "url" and entry.get("ie_key") == "YoutubeTab"):
+                if depth < max_depth:
+                    nested = entry if entry.get("entries") is not None else ydl.extract_info(entry["url"], download=False)
+                    collect(nested, depth + 1)
+                continue
+            video_id = entry.get("id")
+            if not video_id or video_id in seen:
+                continue
+            seen.add(video_id)
+            url = entry.get("url") or ""
+            if not url.startswith("http"):
+                url = f"https://www.youtube.com/watch?v={video_id}"
+            entries.append({"url": url, "video_id": video_id, "title": entry.get("title")})
+
+    with yt_dlp.YoutubeDL({"extract_flat": "in_playlist", "quiet": True, "no_warnings": True}) as ydl:
+        info = ydl.extract_info(playlist_url, download=False)
+        collect(info or {}, 0)
+    print(f"[Downloader] 播放清單 / 頻道 {playlist_url} 共展開 {len(entries)} 部影片。")
+    return entries
+
+def load_download_archive(archive_path):
+    """讀取下載紀錄檔 (與 yt-dlp --download-archive 格式相同，每行「extractor 影片ID」)，返回已處理的影片 ID 集合。"""
+    if not archive_path or not os.path.exists(archive_path):
+        return set()
+    with open(archive_path, 'r', encoding='utf-8') as f:
+        return {line.split()[-1] for line in f if line.strip()}
+
+def record_in_download_archive(archive_path, video_id, extractor="youtube"):
+    """將影片 ID 附加到下載紀錄檔。"""
+    if not archive_path or not video_id:
+        return
+    with _ARCHIVE_LOCK:
+        os.makedirs(os.path.dirname(archive_path) or ".", exist_ok=True)
+        with open(archive_path, 'a', encoding='utf-8') as f:
+            f.write(f"{extractor} {video_id}\n")
+
 if __name__ == '__main__':
     print("--- 正在單獨測試 download_audio.py ---")
     test_url = input("請輸入測試用的 YouTube 連結：")
@@ -0,0 +1,136 @@
+# fake_gemini_server.py
+import json
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# 本地假的 Gemini REST API，用來在離線環境下驗證 async_llm.py 的限速、重試與逾時行為。
+# 實作 POST /v1beta/models/<model>:generateContent 與 :streamGenerateContent (SSE)，回應格式與官方 API 相同；
+# 另外支援 POST /v1beta/cachedContents (context caching)，之後帶有 cachedContent 的請求會回報 cachedContentTokenCount。
+
+def _parts_text(content):
+    return "".join(part.get("text", "") for part in (content or {}).get("parts", []))
+
+class _FakeGeminiHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass  # 不在終端機印出每個請求
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+
+        path = self.path.split("?")[0]
+        if path.endswith("/cachedContents"):
+            self._create_cached_content(body)
+            return
+
+        with server.state_lock:
+            server.request_times.append(time.monotonic())
+            request_number = len(server.request_times)
+            # 依設定的失敗序列回應錯誤碼 (例如 [429, 503] 代表前兩個請求分別失敗)
+            status = server.fail_statuses[request_number - 1] if request_number <= len(server.fail_statuses) else 200
+
+        streaming = path.endswith(":streamGenerateContent")
+        if not (streaming or path.endswith(":generateContent")):
+            status = 404
+        if server.latency:
+            time.sleep(server.latency)
+
+        if status != 200:
+            payload = {"error": {"code": status, "message": "fake error", "status": "UNAVAILABLE"}}
+            self._send_json(status, payload, extra_headers={"Retry-After": "0"} if status == 429 else None)
+            return
+
+        prompt = "".join(_parts_text(content) for content in body.get("contents", []))
+        prompt = _parts_text(body.get("systemInstruction") or body.get("system_instruction")) + prompt
+        with server.state_lock:
+            cached_text = server.cached_contents.get(body.get("cachedContent"), "")
+        text = server.response_text or f"## 假的 Gemini 回應\n\n(收到 {len(cached_text + prompt)} 個字元的提示詞)"
+        usage = {
+            "promptTokenCount": max(1, len(cached_text + prompt) // 4),
+            "candidatesTokenCount": max(1, len(text) // 4),
+        }
+        if cached_text:
+            usage["cachedContentTokenCount"] = len(cached_text) // 4
+        payload = {
+            "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP"}],
+            "usageMetadata": usage,
+        }
+        if streaming:
+            self._send_stream(text, payload["usageMetadata"])
+        else:
+            self._send_json(200, payload)
+
+    def _create_cached_content(self, body):
+        text = _parts_text(body.get("systemInstruction") or body.get("system_instruction"))
+        text += "".join(_parts_text(content) for content in body.get("contents", []))
+        with self.server.state_lock:
+            name = f"cachedContents/fake-{len(self.server.cached_contents) + 1}"
+            self.server.cached_contents[name] = text
+        self._send_json(200, {
+            "name": name,
+            "model": body.get("model"),
+            "usageMetadata": {"totalTokenCount": max(1, len(text) // 4)},
+        })
+
+    def _send_stream(self, text, usage, pieces=4):
+        """以 Server-Sent Events 分幾段送出回應 (對應 ?alt=sse)。"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        step = max(1, len(text) // pieces)
+        chunks = [text[i:i + step] for i in range(0, len(text), step)]
+        for index, chunk in enumerate(chunks):
+            event = {"candidates": [{"content": {"role": "model", "parts": [{"text": chunk}]}}]}
+            if index == len(chunks) - 1:
+                event["candidates"][0]["finishReason"] = "STOP"
+                event["usageMetadata"] = usage
+            self.wfile.write(f"data: {json.dumps(event, ensure_ascii=False)}\r\n\r\n".encode("utf-8"))
+            self.wfile.flush()
+
+    def _send_json(self, status, payload, extra_headers=None):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (extra_headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+def start_fake_gemini_server(port=0, latency=0.0, fail_statuses=None, response_text=None):
+    """
+    在背景執行緒啟動假的 Gemini 伺服器。
+
+    參數:
+    port (int): 監聽的埠號，0 代表自動挑選可用的埠。
+    latency (float): 每個請求的模擬延遲 (秒)。
+    fail_statuses (list): 前幾個請求要回應的錯誤碼，例如 [429, 500]。
+    response_text (str, optional): 固定的回應文字。
+
+    返回:
+    tuple: (server, base_url)。server.request_times 記錄每個請求抵達的時間，
+           使用完畢後呼叫 server.shutdown()。
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), _FakeGeminiHandler)
+    server.daemon_threads = True
+    server.state_lock = threading.Lock()
+    server.request_times = []
+    server.latency = latency
+    server.fail_statuses = list(fail_statuses or [])
+    server.response_text = response_text
+    server.cached_contents = {}  # 名稱 -> 快取的文字
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+if __name__ == '__main__':
+    fake_server, url = start_fake_gemini_server(port=8765)
+    print(f"[Fake Gemini] 假的 Gemini 伺服器已啟動：{url} (按 Ctrl+C 結束)")
+    print(f"[Fake Gemini] 使用方式：設定環境變數 GEMINI_API_ENDPOINT={url}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        fake_server.shutdown()
@@ -0,0 +1,141 @@
+# fake_openai_server.py
+import json
+import time
+import zlib
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# 本地假的 OpenAI 相容伺服器 (模擬 llama.cpp server / vLLM)，用來在離線環境下驗證 llm_providers.py 的連線池與串流。
+# 實作 POST /v1/chat/completions (含 stream=True 的 SSE) 與 /v1/embeddings，使用 HTTP/1.1 keep-alive，
+# server.connections 記錄實際建立過的 TCP 連線，可用來確認連線有被重複使用。
+
+_EMBEDDING_DIM = 64
+
+def _fake_embedding(text):
+    """以字元雜湊產生的假向量：包含相同字元的文字會有較高的相似度。"""
+    vector = [0.0] * _EMBEDDING_DIM
+    for char in text:
+        if not char.isspace():
+            vector[zlib.crc32(char.lower().encode("utf-8")) % _EMBEDDING_DIM] += 1.0
+    return vector
+
+class _FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive：同一條連線可以送出多個請求
+
+    def log_message(self, format, *args):
+        pass  # 不在終端機印出每個請求
+
+    def setup(self):
+        super().setup()
+        with self.server.state_lock:
+            self.server.connections += 1
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+
+        with server.state_lock:
+            server.request_times.append(time.monotonic())
+        if self.path.split("?")[0] == "/v1/embeddings":
+            inputs = body.get("input")
+            inputs = [inputs] if isinstance(inputs, str) else inputs or []
+            self._send_json(200, {
+                "object": "list",
+                "model": body.get("model"),
+                "data": [{"object": "embedding", "index": i, "embedding": _fake_embedding(text)}
+                         for i, text in enumerate(inputs)],
+                "usage": {"prompt_tokens": sum(len(text) // 4 for text in inputs), "total_tokens": 0},
+            })
+            return
+        if self.path.split("?")[0] != "/v1/chat/completions":
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+        if server.latency:
+            time.sleep(server.latency)
+
+        prompt = "".join(message.get("content") or "" for message in body.get("messages", []))
+        text = server.response_text or f"## 假的本地 LLM 回應\n\n(收到 {len(prompt)} 個字元的提示詞)"
+        usage = {
+            "prompt_tokens": max(1, len(prompt) // 4),
+            "completion_tokens": max(1, len(text) // 4),
+            "total_tokens": max(1, len(prompt) // 4) + max(1, len(text) // 4),
+        }
+        if body.get("stream"):
+            include_usage = (body.get("stream_options") or {}).get("include_usage")
+            self._send_stream(body.get("model"), text, usage if include_usage else None)
+            return
+        self._send_json(200, {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "model": body.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": usage,
+        })
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+
+    def _send_stream(self, model, text, usage, pieces=4):
+        """以 chunked transfer encoding 送出 Server-Sent Events，連線在回應結束後仍可重複使用。"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        step = max(1, len(text) // pieces)
+        events = [
+            {"object": "chat.completion.chunk", "model": model,
+             "choices": [{"index": 0, "delta": {"content": text[i:i + step]}, "finish_reason": None}]}
+            for i in range(0, len(text), step)
+        ]
+        events[-1]["choices"][0]["finish_reason"] = "stop"
+        if usage:
+            events.append({"object": "chat.completion.chunk", "model": model, "choices": [], "usage": usage})
+        for event in events:
+            self._write_chunk(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8"))
+        self._write_chunk(b"data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+def start_fake_openai_server(port=0, latency=0.0, response_text=None):
+    """
+    在背景執行緒啟動假的 OpenAI 相容伺服器。
+
+    參數:
+    port (int): 監聽的埠號，0 代表自動挑選可用的埠。
+    latency (float): 每個請求的模擬延遲 (秒)。
+    response_text (str, optional): 固定的回應文字。
+
+    返回:
+    tuple: (server, base_url)。base_url 已包含 /v1，可直接作為 LOCAL_LLM_BASE_URL；
+           server.request_times 記錄每個請求抵達的時間，server.connections 為建立過的連線數，
+           使用完畢後呼叫 server.shutdown()。
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), _FakeOpenAIHandler)
+    server.daemon_threads = True
+    server.state_lock = threading.Lock()
+    server.request_times = []
+    server.connections = 0
+    server.latency = latency
+    server.response_text = response_text
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+if __name__ == '__main__':
+    fake_server, url = start_fake_openai_server(port=8766)
+    print(f"[Fake OpenAI] 假的本地 LLM 伺服器已啟動：{url} (按 Ctrl+C 結束)")
+    print(f"[Fake OpenAI] 使用方式：設定環境變數 LLM_PROVIDER=openai-compatible LOCAL_LLM_BASE_URL={url}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        fake_server.shutdown()
@@ -0,0 +1,448 @@
+# job_server.py
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+# 常駐模式：在同一個行程中保持 worker 與 Whisper 模型常駐，透過本機 HTTP API 或 SQLite 佇列接收任務，
+# 省去每次執行 main.py 時啟動 Python、匯入 torch / whisper / google.generativeai 與載入模型的數秒成本。
+# 本模組的最上層只使用標準函式庫，submit / status 指令與 HTTP 請求都不需要匯入上述套件，提交任務只需數毫秒；
+# 任務由 batch_runner.run_batch_workflow 處理，產出的檔案與批次模式 (以及 run_workflow) 相同。
+#
+# 可透過環境變數設定：
+#   JOB_SERVER_DB     SQLite 佇列檔案路徑 (預設 downloads/jobs.sqlite3)
+#   JOB_SERVER_PORT   HTTP API 埠號 (預設 8787，只監聽 127.0.0.1)
+JOB_SERVER_DB = os.getenv("JOB_SERVER_DB", os.path.join("downloads", "jobs.sqlite3"))
+JOB_SERVER_PORT = int(os.getenv("JOB_SERVER_PORT", "8787"))
+_POLL_SECONDS = 1.0  # 其他行程直接寫入 SQLite 的任務，最多等待這麼久才會被領取
+
+# 提交任務時可覆寫的 run_batch_workflow 參數
+JOB_OPTIONS = {
+    "model": "whisper_model_size",
+    "language": "target_language",
+    "keep_video": "keep_video_file",
+    "chunked": "chunked_transcription",
+    "backend": "transcription_backend",
+    "vad": "vad",
+    "audio_format": "audio_format",
+    "force_stage": "force_stage",
+    "llm_provider": "llm_provider",
+    "captions": "caption_policy",
+    "isolated": "isolated_transcription",
+}
+# 每部影片會經過的管線階段數 (下載、轉錄、LLM 統整)，用於計算進度
+_PIPELINE_STAGES = ("download", "transcribe", "llm")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    url TEXT NOT NULL,
+    basename TEXT,
+    options TEXT NOT NULL DEFAULT '{}',
+    status TEXT NOT NULL DEFAULT 'queued',
+    stage TEXT,
+    progress REAL NOT NULL DEFAULT 0,
+    error TEXT,
+    result TEXT,
+    worker TEXT,
+    submitted_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id);
+"""
+
+class JobQueue:
+    """
+    以 SQLite 儲存的任務佇列。任務狀態：queued → running → done / failed。
+    使用 WAL 模式，常駐行程與其他行程 (例如 python job_server.py submit) 可同時讀寫同一個檔案。
+    """
+
+    def __init__(self, path=JOB_SERVER_DB):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        # isolation_level=None：自行以 BEGIN IMMEDIATE 控制交易，其餘陳述句自動提交
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._db.row_factory = sqlite3.Row
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript(_SCHEMA)
+
+    @staticmethod
+    def _to_dict(row):
+        if row is None:
+            return None
+        job = dict(row)
+        job["options"] = json.loads(job["options"] or "{}")
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def submit(self, url, basename=None, options=None):
+        """加入一個任務並返回任務編號。"""
+        unknown = set(options or {}) - set(JOB_OPTIONS)
+        if unknown:
+            raise ValueError(f"不支援的任務選項：{', '.join(sorted(unknown))}")
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO jobs (url, basename, options, submitted_at) VALUES (?, ?, ?, ?)",
+                (url, basename, json.dumps(options or {}, ensure_ascii=False), time.time())
+            )
+        return cursor.lastrowid
+
+    def claim(self, worker):
+        """領取最早的 queued 任務並標記為 running；沒有任務時返回 None。"""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT * FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1"
+                ).fetchone()
+                if row is not None:
+                    self._db.execute(
+                        "UPDATE jobs SET status = 'running', worker = ?, started_at = ? WHERE id = ?",
+                        (worker, time.time(), row["id"])
+                    )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        job = self._to_dict(row)
+        job["status"] = "running"
+        return job
+
+    def update_progress(self, job_id, stage, progress):
+        with self._lock:
+            self._db.execute("UPDATE jobs SET stage = ?, progress = ? WHERE id = ?", (stage, progress, job_id))
+
+    def finish(self, job_id, status, result=None, error=None):
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, progress = 1, result = ?, error = ?, finished_at = ? WHERE id = ?",
+                (status, json.dumps(result, ensure_ascii=False) if result is not None else None, error,
+                 time.time(), job_id)
+            )
+
+    def requeue_interrupted(self):
+        """將上次常駐行程結束時仍在執行中的任務放回佇列 (manifest 會讓它們從中斷的階段繼續)。"""
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE jobs SET status = 'queued', stage = NULL, progress = 0, worker = NULL WHERE status = 'running'"
+            )
+        return cursor.rowcount
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row)
+
+    def list(self, status=None, limit=100):
+        query = "SELECT * FROM jobs"
+        params = []
+        if status:
+            query += " WHERE status = ?"
+            params.append(status)
+        query += " ORDER BY id DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._db.execute(query, params).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def counts(self):
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+def _job_result(job):
+    """從 run_batch_workflow 的任務字典中取出要回報的欄位 (不含 manifest 等物件)。"""
+    keys = ("basename", "url", "status", "error", "output_folder", "transcript_txt_path",
+            "gemini_md_path", "obsidian_path")
+    return {key: job.get(key) for key in keys if job.get(key) is not None}
+
+class JobServer:
+    """
+    常駐的任務處理器：啟動時匯入處理流程並預先載入 Whisper 模型，
+    之後 num_workers 個 worker 執行緒持續從佇列領取任務 (多個 worker 可讓下一部影片的下載與目前的轉錄重疊)。
+    """
+
+    def __init__(self, job_queue, num_workers=1, defaults=None):
+        self.queue = job_queue
+        self.num_workers = max(1, num_workers)
+        self.defaults = dict(defaults or {})
+        self.warm = False
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = []
+        self._batch_runner = None
+
+    def warm_up(self):
+        """匯入 torch / whisper / LLM 套件並將 Whisper 模型載入模型池 (每個常駐行程只需一次)。"""
+        started = time.perf_counter()
+        import batch_runner
+        from transcriber import preload_whisper_model
+        self._batch_runner = batch_runner
+        if not self.defaults.get("chunked_transcription"):
+            preload_whisper_model(self.defaults.get("whisper_model_size", "base"),
+                                  self.defaults.get("transcription_backend"))
+        self.warm = True
+        print(f"[Job Server] 暖機完成，耗時 {time.perf_counter() - started:.1f} 秒。")
+
+    def start(self):
+        recovered = self.queue.requeue_interrupted()
+        if recovered:
+            print(f"[Job Server] 將 {recovered} 個中斷的任務放回佇列。")
+        self.warm_up()
+        for i in range(self.num_workers):
+            thread = threading.Thread(target=self._worker_loop, args=(f"worker-{i + 1}",),
+                                      name=f"job-worker-{i + 1}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def notify(self):
+        """有新任務時喚醒等待中的 worker (不需等到下一次輪詢)。"""
+        self._wakeup.set()
+
+    def stop(self, timeout=None):
+        """停止領取新任務，等待執行中的任務完成。"""
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _worker_loop(self, worker_name):
+        while not self._stopping.is_set():
+            job = self.queue.claim(worker_name)
+            if job is None:
+                self._wakeup.wait(_POLL_SECONDS)
+                self._wakeup.clear()
+                continue
+            self.run_job(job)
+
+    def run_job(self, job):
+        job_id = job["id"]
+        print(f"[Job Server] 開始處理任務 #{job_id}：{job['url']}")
+        started = time.perf_counter()
+        try:
+            options = dict(self.defaults)
+            for key, value in job["options"].items():
+                options[JOB_OPTIONS[key]] = value
+            items = self._batch_runner.load_batch_items([(job["url"], job["basename"])])
+            total_steps = len(items) * len(_PIPELINE_STAGES)
+            finished_steps = set()
+            progress_lock = threading.Lock()
+
+            def on_job_update(batch_job, stage_name, passed):
+                with progress_lock:
+                    if passed is not None:
+                        finished_steps.add((batch_job["index"], stage_name))
+                    progress = len(finished_steps) / total_steps if total_steps else 1.0
+                label = stage_name if passed is None else f"{stage_name}:{'ok' if passed else 'failed'}"
+                if len(items) > 1:
+                    label = f"{batch_job['basename']} {label}"
+                self.queue.update_progress(job_id, label, round(progress, 3))
+
+            results = self._batch_runner.run_batch_workflow(
+                items, keep_model_warm=True, download_workers=1, transcribe_workers=1, llm_workers=1,
+                on_job_update=on_job_update, **options
+            )
+            failed = [r for r in results if r["status"] != "done"]
+            if not results:
+                self.queue.finish(job_id, "failed", result=[], error="沒有任何影片需要處理")
+            elif failed:
+                error = "; ".join(f"{r['basename']}: {r['error']}" for r in failed)
+                self.queue.finish(job_id, "failed", result=[_job_result(r) for r in results], error=error)
+            else:
+                self.queue.finish(job_id, "done", result=[_job_result(r) for r in results])
+        except Exception as e:
+            print(f"[Job Server] 任務 #{job_id} 發生未預期的錯誤：{e}")
+            self.queue.finish(job_id, "failed", error=str(e))
+        print(f"[Job Server] 任務 #{job_id} 結束，耗時 {time.perf_counter() - started:.1f} 秒。")
+
+class _JobAPIHandler(BaseHTTPRequestHandler):
+    """
+    POST /jobs          {"url": ..., "basename": ..., "options": {...}} → 202 {"id": ..., "status": "queued"}
+    GET  /jobs          最近的任務 (?status=queued|running|done|failed&limit=100)
+    GET  /jobs/<id>     單一任務的狀態、目前階段、進度與產出的檔案
+    GET  /health        worker 數量、是否已暖機與各狀態的任務數
+    """
+
+    def log_message(self, format, *args):
+        pass  # 不在終端機印出每個請求
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        path = parts.path.rstrip("/")
+        job_queue = self.server.job_queue
+        if path == "/health":
+            job_server = self.server.job_server
+            self._send_json(200, {
+                "workers": job_server.num_workers if job_server else 0,
+                "warm": bool(job_server and job_server.warm),
+                "jobs": job_queue.counts(),
+            })
+        elif path == "/jobs":
+            query = parse_qs(parts.query)
+            try:
+                limit = int(query.get("limit", ["100"])[0])
+            except ValueError:
+                self._send_json(400, {"error": "limit 必須是整數"})
+                return
+            self._send_json(200, {"jobs": job_queue.list(query.get("status", [None])[0], limit)})
+        elif path.startswith("/jobs/") and path[len("/jobs/"):].isdigit():
+            job = job_queue.get(int(path[len("/jobs/"):]))
+            if job is None:
+                self._send_json(404, {"error": "找不到此任務"})
+            else:
+                self._send_json(200, job)
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if urlsplit(self.path).path.rstrip("/") != "/jobs":
+            self._send_json(404, {"error": "not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            url = (body.get("url") or "").strip()
+            if not url:
+                raise ValueError("缺少 url")
+            job_id = self.server.job_queue.submit(url, body.get("basename"), body.get("options"))
+        except (ValueError, AttributeError) as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        if self.server.job_server:
+            self.server.job_server.notify()
+        self._send_json(202, {"id": job_id, "status": "queued"})
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+def start_http_api(job_queue, job_server=None, port=JOB_SERVER_PORT):
+    """
+    在背景執行緒啟動 HTTP API (只監聽 127.0.0.1)。
+
+    返回:
+    tuple: (server, base_url)，使用完畢後呼叫 server.shutdown()。
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), _JobAPIHandler)
+    server.daemon_threads = True
+    server.job_queue = job_queue
+    server.job_server = job_server
+    thread = threading.Thread(target=server.serve_forever, name="job-api", daemon=True)
+    thread.start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+def serve(db_path=JOB_SERVER_DB, port=JOB_SERVER_PORT, num_workers=1, defaults=None):
+    """啟動常駐模式：暖機、開始處理佇列並提供 HTTP API，直到 Ctrl+C。"""
+    job_queue = JobQueue(db_path)
+    job_server = JobServer(job_queue, num_workers=num_workers, defaults=defaults)
+    # 先開放 API，暖機期間提交的任務會在暖機完成後依序處理
+    http_server, base_url = start_http_api(job_queue, job_server, port)
+    print(f"[Job Server] HTTP API 已啟動：{base_url} (任務佇列：{db_path})")
+    job_server.start()
+    print(f"[Job Server] {job_server.num_workers} 個 worker 已就緒 (按 Ctrl+C 結束)。")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("\n[Job Server] 正在結束，等待執行中的任務完成...")
+    finally:
+        http_server.shutdown()
+        job_server.stop()
+        job_queue.close()
+
+def _print_job(job):
+    line = f"#{job['id']} [{job['status']}] {job['url']}"
+    if job["status"] == "running":
+        line += f" ({job['stage'] or '等待中'}，{job['progress']:.0%})"
+    if job["error"]:
+        line += f" 錯誤：{job['error']}"
+    print(line)
+    for item in job["result"] or []:
+        for key in ("transcript_txt_path", "gemini_md_path", "obsidian_path"):
+            if item.get(key):
+                print(f"    {key}: {item[key]}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="常駐模式：保持模型常駐，透過 HTTP API 或 SQLite 佇列接收任務")
+    parser.add_argument("--db", default=JOB_SERVER_DB, help=f"SQLite 佇列檔案 (預設 {JOB_SERVER_DB})")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve", help="啟動常駐行程")
+    serve_parser.add_argument("--port", type=int, default=JOB_SERVER_PORT, help=f"HTTP API 埠號 (預設 {JOB_SERVER_PORT})")
+    serve_parser.add_argument("--workers", type=int, default=1, help="同時處理的任務數 (預設 1)")
+    serve_parser.add_argument("--model", default="base", choices=["tiny", "base", "small", "medium", "large"],
+                              help="預設的 Whisper 模型 (啟動時預先載入)")
+    serve_parser.add_argument("--backend", default=None, help="預設的轉錄引擎 (openai-whisper 或 faster-whisper)")
+    serve_parser.add_argument("--output-dir", default="downloads", help="輸出資料夾 (預設 downloads)")
+    serve_parser.add_argument("--vad", action="store_true", help="預設在轉錄前略過非語音部分")
+    serve_parser.add_argument("--ytdlp-api", action="store_true", help="下載改用 yt-dlp 的 Python API")
+
+    submit_parser = subparsers.add_parser("submit", help="將任務直接寫入 SQLite 佇列 (常駐行程會自動領取)")
+    submit_parser.add_argument("url", help="影片、播放清單或頻道網址")
+    submit_parser.add_argument("basename", nargs="?", default=None, help="檔案基礎名稱 (預設使用影片 ID)")
+    submit_parser.add_argument("--option", action="append", default=[], metavar="KEY=VALUE",
+                               help=f"覆寫任務選項 ({', '.join(JOB_OPTIONS)})，可重複指定")
+
+    status_parser = subparsers.add_parser("status", help="查看任務狀態")
+    status_parser.add_argument("job_id", nargs="?", type=int, default=None, help="任務編號 (省略時列出最近的任務)")
+
+    args = parser.parse_args()
+    if args.command == "serve":
+        from dotenv import load_dotenv
+        load_dotenv()
+        serve(args.db, args.port, args.workers, defaults={
+            "whisper_model_size": args.model,
+            "transcription_backend": args.backend,
+            "output_directory": args.output_dir,
+            "vad": args.vad,
+            "use_ytdlp_api": args.ytdlp_api,
+            "gemini_api_key": os.getenv("GOOGLE_API_KEY"),
+            "obsidian_notes_target_folder": os.getenv("path_to_obsidian_workspace"),
+        })
+    elif args.command == "submit":
+        job_options = {}
+        for option in args.option:
+            key, separator, value = option.partition("=")
+            if not separator or not key:
+                parser.error(f"選項 '{option}' 的格式應為 KEY=VALUE")
+            # true / false / 數字以 JSON 解析，其餘當作字串
+            try:
+                job_options[key] = json.loads(value)
+            except ValueError:
+                job_options[key] = value
+        queue_db = JobQueue(args.db)
+        try:
+            print(f"[Job Server] 已加入任務 #{queue_db.submit(args.url, args.basename, job_options)}")
+        except ValueError as e:
+            print(f"[Job Server] 無法加入任務：{e}")
+            sys.exit(1)
+        finally:
+            queue_db.close()
+    else:
+        queue_db = JobQueue(args.db)
+        jobs = [queue_db.get(args.job_id)] if args.job_id else queue_db.list(limit=20)
+        for queued_job in jobs:
+            if queued_job:
+                _print_job(queued_job)
+            else:
+                print(f"[Job Server] 找不到任務 #{args.job_id}")
+        queue_db.close()
@@ -1,7 +1,13 @@
 # llm_processor.py
-import google.generativeai as genai
 import os
+import re
+import time
+import datetime
+import threading
 import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from prompt_templates import instructions, render_request
 
 # ---------------------------------------------------------------------------
 # 如果希望此檔案在獨立執行時也能讀取 .env，則需要取消註解以下兩行
@@ -13,72 +19,339 @@ import traceback
 # 或者，更推薦的做法是，在 if __name__ == '__main__': 區塊內處理 .env 的載入，
 # 這樣就不會影響 main.py (如果 main.py 已經有 load_dotenv())
 
-def process_transcript_with_gemini(api_key, transcript_text, video_title=""):
+GEMINI_MODEL_NAME = 'gemini-1.5-flash-latest'
+
+# 設定 GEMINI_API_ENDPOINT (例如 http://127.0.0.1:8765) 可將請求導向其他端點，
+# 例如 fake_gemini_server.py 提供的本地假伺服器 (離線測試與基準測試使用)；
+# 同步 SDK 與 async_llm 的 REST 用戶端都使用此設定
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT")
+
+_USAGE_LOCK = threading.Lock()
+
+# 逐字稿估計超過此 token 數時，自動改用 map-reduce 分段統整
+MAP_REDUCE_THRESHOLD_TOKENS = int(os.getenv("GEMINI_MAP_REDUCE_THRESHOLD_TOKENS", "30000"))
+
+# Gemini context caching：固定的整理指示以 CachedContent 建立一次，之後的請求只需送出影片標題與逐字稿。
+# 快取的內容只有整理指示 (每部影片的逐字稿都不同，無法共用)，且 API 只接受：
+#   1. 固定版本的模型名稱 (例如 gemini-1.5-flash-002)，不接受 -latest 等別名；
+#   2. 達到最低 token 數的內容 (Gemini 1.5 為 32,768 tokens)。
+# 兩個條件都符合時 (見 context_cache_supported) 才會呼叫建立快取的 API，否則直接以 system instruction 送出指示，
+# 不會發出注定失敗的請求。prompts/ 內建的指示只有數 KB，需以 PROMPTS_DIR 提供夠長的指示 (例如附上大量範例) 才會啟用。
+#   GEMINI_CONTEXT_CACHE             設為 0 停用
+#   GEMINI_CONTEXT_CACHE_TTL         快取存活秒數 (預設 3600，到期前會自動重建)
+#   GEMINI_CONTEXT_CACHE_MIN_TOKENS  可快取的最低 token 數 (預設 32768，依使用的模型調整)
+GEMINI_CONTEXT_CACHE = os.getenv("GEMINI_CONTEXT_CACHE", "1") == "1"
+GEMINI_CONTEXT_CACHE_TTL = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL", "3600"))
+GEMINI_CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("GEMINI_CONTEXT_CACHE_MIN_TOKENS", "32768"))
+_PINNED_MODEL_VERSION = re.compile(r"-\d{3}$")  # 固定版本的模型名稱以三位數版本號結尾
+
+# 每個行程只呼叫一次 genai.configure，GenerativeModel 依提示詞種類各建立一次
+_MODELS = {}                 # 種類 -> (GenerativeModel, 到期時間 (monotonic) 或 None)
+_MODELS_LOCK = threading.Lock()
+_configured_for = None       # (api_key, endpoint)
+
+def _genai():
+    """google.generativeai 的匯入需要數百毫秒到數秒，只在實際呼叫 Gemini 時才載入 (只下載或使用本地 LLM 時不需要)。"""
+    import google.generativeai as genai
+    return genai
+
+def build_gemini_request(transcript_text, video_title=""):
+    """返回 (固定的整理指示, 影片標題與逐字稿)。"""
+    return instructions("note"), render_request("note", video_title=video_title, transcript=transcript_text)
+
+def build_map_request(chunk_text, video_title, chunk_index, chunk_count):
+    """map 階段：整理逐字稿其中一個片段。返回 (固定指示, 片段內容)。"""
+    return instructions("map"), render_request(
+        "map", video_title=video_title, chunk_index=chunk_index, chunk_count=chunk_count, chunk_text=chunk_text
+    )
+
+def build_reduce_request(partial_notes, video_title=""):
+    """reduce 階段：將各片段筆記合併成最終 5 個區塊格式。返回 (固定指示, 分段筆記)。"""
+    joined_notes = "\n\n".join(
+        f"### 第 {i} 段筆記\n{note}" for i, note in enumerate(partial_notes, start=1)
+    )
+    return instructions("reduce"), render_request("reduce", video_title=video_title, notes=joined_notes)
+
+def build_gemini_prompt(transcript_text, video_title=""):
     """
-    使用 Gemini API 處理逐字稿文字，根據設計好的 prompt 進行整理。
-    (函數內容與之前相同，此處省略以節省篇幅，請保留你之前的函數內容)
+    組合送給 Gemini 的完整提示詞 (整理指示 + 逐字稿)，也用來計算 LLM 快取的鍵值。
     """
-    if not api_key:
-        print("[LLM Processor] 錯誤：未提供 Gemini API 金鑰。")
-        return None
-    if not transcript_text:
-        print("[LLM Processor] 錯誤：沒有逐字稿內容可以處理。")
-        return None
+    return "\n\n".join(build_gemini_request(transcript_text, video_title))
 
-    try:
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-1.5-flash-latest')
-        prompt = f"""
-        作為一個專業的影片內容分析師和筆記整理專家，請仔細閱讀以下來自 YouTube 影片「{video_title}」的逐字稿。
-        你的任務是將這份逐字稿整理成一份結構清晰、重點突出、易於理解的文檔。
+def build_map_prompt(chunk_text, video_title, chunk_index, chunk_count):
+    return "\n\n".join(build_map_request(chunk_text, video_title, chunk_index, chunk_count))
+
+def build_reduce_prompt(partial_notes, video_title=""):
+    return "\n\n".join(build_reduce_request(partial_notes, video_title))
+
+def estimate_tokens(text):
+    """
+    粗略估計文字的 token 數：CJK 字元約 1 字 1 token，其他字元約 4 字元 1 token。
+    (只用於切段與判斷是否需要 map-reduce，不需要精確值，也不必呼叫 API)
+    """
+    if not text:
+        return 0
+    cjk_count = len(re.findall(r'[\u3040-\u30ff\u3400-\u9fff\uac00-\ud7af\uf900-\ufaff]', text))
+    return cjk_count + (len(text) - cjk_count) // 4 + 1
 
-        請依照以下格式和要求進行整理：
+def split_transcript_into_chunks(transcript_text, max_tokens_per_chunk=8000):
+    """
+    將逐字稿沿句子邊界切成多個片段，每個片段的估計 token 數不超過 max_tokens_per_chunk。
+    單一句子本身就超過上限時，會被硬切成多段。
 
-        1.  **影片核心宗旨**：
-            用一到兩句話總結這部影片最核心的主題或目的是什麼。
+    返回:
+    list: 片段文字的 list。
+    """
+    sentences = [s for s in re.split(r'(?<=[。．.！？!?])\s*', transcript_text) if s.strip()]
+    chunks = []
+    current = []
+    current_tokens = 0
+    for sentence in sentences:
+        sentence_tokens = estimate_tokens(sentence)
+        if sentence_tokens > max_tokens_per_chunk:
+            # 過長的句子 (例如沒有標點的逐字稿) 依字元數硬切
+            step = max(1, len(sentence) * max_tokens_per_chunk // sentence_tokens)
+            pieces = [sentence[i:i + step] for i in range(0, len(sentence), step)]
+        else:
+            pieces = [sentence]
+        for piece in pieces:
+            piece_tokens = estimate_tokens(piece)
+            if current and current_tokens + piece_tokens > max_tokens_per_chunk:
+                chunks.append(" ".join(current))
+                current = []
+                current_tokens = 0
+            current.append(piece)
+            current_tokens += piece_tokens
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
 
-        2.  **內容摘要 (Summary)**：
-            * 提供一段約 200-300 字的流暢敘述性摘要，概括影片的主要內容和流程。
+def context_cache_supported(system_instruction, model_name=GEMINI_MODEL_NAME):
+    """整理指示是否可以建立 context cache：已啟用、模型名稱為固定版本，且估計 token 數達到最低要求。"""
+    return (GEMINI_CONTEXT_CACHE and bool(system_instruction)
+            and _PINNED_MODEL_VERSION.search(model_name) is not None
+            and estimate_tokens(system_instruction) >= GEMINI_CONTEXT_CACHE_MIN_TOKENS)
 
-        3.  **重點條列 (Key Takeaways)**：
-            * 以條列方式 (bullet points) 列出影片中所有提到的重要觀點、關鍵資訊或技巧。
-            * 每個條列點應簡潔，但有完整資訊，如技巧的使用流程、技巧的快捷鍵等等。
+def _configure(api_key):
+    global _configured_for
+    target = (api_key, GEMINI_API_ENDPOINT)
+    if _configured_for == target:
+        return
+    genai = _genai()
+    if GEMINI_API_ENDPOINT:
+        genai.configure(api_key=api_key, transport="rest", client_options={"api_endpoint": GEMINI_API_ENDPOINT})
+    else:
+        genai.configure(api_key=api_key)
+    _configured_for = target
+    _MODELS.clear()  # 金鑰或端點變更時，之前建立的模型與快取都不再適用
 
-        4.  **詳細大綱 (Detailed Outline)**：
-            * 根據影片內容的邏輯順序，產生一個結構化的層次大綱 (例如使用 1., 1.1, 1.1.1, 2. 等標號)。
-            * 大綱應能反映影片的段落和主要討論點。
+def _create_model(kind):
+    """建立指定種類的模型：可以快取時使用 context cache，否則 (或建立失敗時) 以 system instruction 附帶整理指示。"""
+    genai = _genai()
+    system_instruction = instructions(kind)
+    if context_cache_supported(system_instruction):
+        try:
+            from google.generativeai import caching
+            cache = caching.CachedContent.create(
+                model=GEMINI_MODEL_NAME,
+                display_name=f"ytnotes-{kind}-instructions",
+                system_instruction=system_instruction,
+                ttl=datetime.timedelta(seconds=GEMINI_CONTEXT_CACHE_TTL),
+            )
+            print(f"[LLM Processor] 已建立 '{kind}' 整理指示的 Gemini context cache：{cache.name}")
+            # 提早 60 秒視為到期，避免請求送出時快取剛好失效
+            return genai.GenerativeModel.from_cached_content(cached_content=cache), \
+                time.monotonic() + GEMINI_CONTEXT_CACHE_TTL - 60
+        except Exception as e:
+            print(f"[LLM Processor] 無法建立 '{kind}' 的 context cache ({e})，改為每次請求附帶整理指示。")
+    return genai.GenerativeModel(GEMINI_MODEL_NAME, system_instruction=system_instruction), None
 
-        5.  **延伸思考或建議行動 (Further Thoughts / Actionable Steps) (可選)**：
-            * 如果影片內容具有啟發性或知識性，可以提出 1-2 個相關的延伸思考問題。
-            * 如果影片是教學或指南性質，可以列出 1-3 個觀眾看完影片後可以採取的具體行動步驟。
-            * 如果此部分不適用，可以省略或註明「無」。
+def get_gemini_model(api_key, kind="note"):
+    """
+    取得指定提示詞種類 ("note" / "map" / "reduce") 的 GenerativeModel。
+    同一個行程中只設定一次 API 金鑰、每種模型只建立一次 (context cache 到期時重新建立)。
+    """
+    with _MODELS_LOCK:
+        _configure(api_key)
+        model, expires_at = _MODELS.get(kind, (None, None))
+        if model is None or (expires_at is not None and time.monotonic() >= expires_at):
+            model, expires_at = _create_model(kind)
+            _MODELS[kind] = (model, expires_at)
+        return model
 
-        請確保你的輸出是純文字格式，並且各個區塊標題清晰 (例如使用粗體或 ## 標記)。
+def _stream_text(model, prompt, generation_config, on_chunk):
+    """以串流方式送出請求，每收到一段文字就呼叫 on_chunk，並印出首個 token 的延遲與進度。"""
+    start_time = time.monotonic()
+    response = model.generate_content(prompt, generation_config=generation_config, stream=True)
+    received = []
+    received_chars = 0
+    for chunk in response:
+        if not chunk.parts:
+            continue
+        text = chunk.text
+        if not received:
+            print(f"[LLM Processor] 首個 token 延遲 (time to first token)：{time.monotonic() - start_time:.2f} 秒")
+        received.append(text)
+        received_chars += len(text)
+        on_chunk(text)
+        print(f"\r[LLM Processor] 串流接收中... 已接收 {received_chars} 字元", end="", flush=True)
+    if received:
+        print(f"\n[LLM Processor] 串流接收完成，共 {received_chars} 字元，耗時 {time.monotonic() - start_time:.2f} 秒。")
+        return "".join(received), response
+    return None, response
 
-        以下是影片逐字稿內容：
-        ---
-        {transcript_text}
-        ---
+def _record_usage(response, usage_stats):
+    """將回應中的 token 用量累加到 usage_stats (prompt_tokens / response_tokens / requests)。"""
+    if usage_stats is None:
+        return
+    usage = getattr(response, 'usage_metadata', None)
+    with _USAGE_LOCK:
+        usage_stats["requests"] = usage_stats.get("requests", 0) + 1
+        if usage:
+            usage_stats["prompt_tokens"] = usage_stats.get("prompt_tokens", 0) + (usage.prompt_token_count or 0)
+            usage_stats["response_tokens"] = usage_stats.get("response_tokens", 0) + (usage.candidates_token_count or 0)
+            cached = getattr(usage, "cached_content_token_count", 0) or 0
+            if cached:
+                # prompt_tokens 已包含這部分，但快取中的 token 以較低的費率計費
+                usage_stats["cached_tokens"] = usage_stats.get("cached_tokens", 0) + cached
 
-        請開始整理這份逐字稿：
-        """
-        print(f"[LLM Processor] 正在向 Gemini API (模型: {model.model_name}) 發送請求...")
-        generation_config = genai.types.GenerationConfig(max_output_tokens=8192)
+def _generate_text(model, prompt, max_output_tokens=8192, on_chunk=None, usage_stats=None):
+    """
+    送出單一請求並返回文字結果；回應為空或被阻擋時返回 None。
+    提供 on_chunk 時改用串流模式，每收到一段文字就呼叫 on_chunk(text)。
+    """
+    generation_config = _genai().types.GenerationConfig(max_output_tokens=max_output_tokens)
+    if on_chunk:
+        streamed_text, response = _stream_text(model, prompt, generation_config, on_chunk)
+        _record_usage(response, usage_stats)
+        if streamed_text:
+            return streamed_text
+    else:
         response = model.generate_content(prompt, generation_config=generation_config)
-        
-        if response.parts:
-            processed_text = response.text
-            print("[LLM Processor] 已成功從 Gemini API 獲取回應。")
-            return processed_text
+        _record_usage(response, usage_stats)
+
+    if response.parts:
+        return response.text
+    print("[LLM Processor] 警告：Gemini API 回應為空或不完整。")
+    if hasattr(response, 'prompt_feedback') and response.prompt_feedback:
+         print(f"[LLM Processor] Prompt Feedback: {response.prompt_feedback}")
+         if response.prompt_feedback.block_reason:
+             print(f"[LLM Processor] 內容可能因以下原因被阻擋: {response.prompt_feedback.block_reason_message}")
+    return None
+
+class GeminiProvider:
+    """Gemini (google-generativeai SDK)；整理指示透過 get_gemini_model 的 context cache / system instruction 送出。"""
+    name = "gemini"
+    requires_api_key = True
+    model_label = GEMINI_MODEL_NAME
+    max_connections = None
+
+    def __init__(self, api_key):
+        self.api_key = api_key
+
+    def generate(self, kind, system_instruction, prompt, max_output_tokens=8192, on_chunk=None, usage_stats=None):
+        return _generate_text(get_gemini_model(self.api_key, kind), prompt, max_output_tokens=max_output_tokens,
+                              on_chunk=on_chunk, usage_stats=usage_stats)
+
+LLM_PROVIDERS = ("gemini", "openai-compatible")
+# 統整使用的 LLM：gemini (預設) 或 openai-compatible (本地 llama.cpp / vLLM 等，見 llm_providers.py)
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini")
+_local_provider = None
+_local_provider_lock = threading.Lock()
+
+def get_llm_provider(name=None, api_key=None):
+    """
+    依名稱取得 LLM provider，未指定時使用 LLM_PROVIDER。
+    本地 provider 在行程中只建立一次，讓所有請求共用同一個連線池。
+    """
+    global _local_provider
+    name = name or LLM_PROVIDER
+    if name == "gemini":
+        return GeminiProvider(api_key)
+    if name == "openai-compatible":
+        with _local_provider_lock:
+            if _local_provider is None:
+                from llm_providers import OpenAICompatibleProvider
+                _local_provider = OpenAICompatibleProvider()
+            return _local_provider
+    raise ValueError(f"未知的 LLM provider '{name}'，可用選項：{', '.join(LLM_PROVIDERS)}")
+
+def llm_model_label(name=None):
+    """LLM 快取與 manifest 使用的模型識別 (Gemini 維持原本的模型名稱，既有的快取仍然有效)。"""
+    return get_llm_provider(name).model_label
+
+def _map_reduce(engine, transcript_text, video_title, chunk_token_budget, max_parallel,
+                on_chunk=None, usage_stats=None):
+    chunks = split_transcript_into_chunks(transcript_text, chunk_token_budget)
+    # 本地伺服器 (llama.cpp --parallel、vLLM) 會將同時抵達的請求合併成批次推論，併發數以連線池大小為準
+    max_parallel = engine.max_connections or max_parallel
+    print(f"[LLM Processor] 逐字稿已切成 {len(chunks)} 段，以 {max_parallel} 個併發請求進行 map 階段...")
+
+    def summarize_chunk(args):
+        index, chunk_text = args
+        system_instruction, request = build_map_request(chunk_text, video_title, index, len(chunks))
+        note = engine.generate("map", system_instruction, request, max_output_tokens=4096, usage_stats=usage_stats)
+        print(f"[LLM Processor] 第 {index}/{len(chunks)} 段整理{'完成' if note else '失敗'}。")
+        return note
+
+    with ThreadPoolExecutor(max_workers=max(1, max_parallel)) as executor:
+        partial_notes = list(executor.map(summarize_chunk, enumerate(chunks, start=1)))
+
+    if not all(partial_notes):
+        print("[LLM Processor] 部分片段整理失敗，無法合併成完整的筆記。")
+        return None
+
+    print("[LLM Processor] 正在進行 reduce 階段，合併各段筆記...")
+    system_instruction, request = build_reduce_request(partial_notes, video_title)
+    return engine.generate("reduce", system_instruction, request, on_chunk=on_chunk, usage_stats=usage_stats)
+
+def process_transcript_with_gemini(api_key, transcript_text, video_title="", map_reduce="auto",
+                                   chunk_token_budget=8000, max_parallel=4, on_chunk=None, usage_stats=None,
+                                   provider=None):
+    """
+    使用 LLM (預設為 Gemini API) 處理逐字稿文字，根據設計好的 prompt 進行整理。
+
+    參數:
+    map_reduce (bool | str): True 強制使用 map-reduce 分段統整，False 一律單次請求；
+                             "auto" 在逐字稿估計超過 MAP_REDUCE_THRESHOLD_TOKENS 時才使用。
+    chunk_token_budget (int): map-reduce 模式下每個片段的估計 token 上限。
+    max_parallel (int): map-reduce 模式下 map 階段的併發請求數。
+    on_chunk (callable, optional): 提供時以串流模式接收回應，每收到一段文字就呼叫 on_chunk(text)
+                                   (map-reduce 模式只串流最後的 reduce 階段)。
+    usage_stats (dict, optional): 提供時會累加請求數與 prompt / response token 用量。
+    provider (str, optional): "gemini" 或 "openai-compatible" (本地 LLM 伺服器，不需要 api_key)，
+                              未指定時使用環境變數 LLM_PROVIDER。
+
+    返回:
+    str: 整理後的 Markdown 內容，失敗時返回 None。
+    """
+    engine = get_llm_provider(provider, api_key)
+    if engine.requires_api_key and not api_key:
+        print("[LLM Processor] 錯誤：未提供 Gemini API 金鑰。")
+        return None
+    if not transcript_text:
+        print("[LLM Processor] 錯誤：沒有逐字稿內容可以處理。")
+        return None
+
+    if map_reduce == "auto":
+        map_reduce = estimate_tokens(transcript_text) > MAP_REDUCE_THRESHOLD_TOKENS
+
+    try:
+        print(f"[LLM Processor] 正在向 {engine.name} (模型: {engine.model_label}) 發送請求...")
+        if map_reduce:
+            processed_text = _map_reduce(engine, transcript_text, video_title, chunk_token_budget,
+                                         max_parallel, on_chunk, usage_stats)
         else:
-            print("[LLM Processor] 警告：Gemini API 回應為空或不完整。")
-            if hasattr(response, 'prompt_feedback') and response.prompt_feedback:
-                 print(f"[LLM Processor] Prompt Feedback: {response.prompt_feedback}")
-                 if response.prompt_feedback.block_reason:
-                     print(f"[LLM Processor] 內容可能因以下原因被阻擋: {response.prompt_feedback.block_reason_message}")
-            return None
+            # Gemini 的整理指示已在模型上 (context cache 或 system instruction)，請求只包含影片標題與逐字稿
+            system_instruction, request = build_gemini_request(transcript_text, video_title)
+            processed_text = engine.generate("note", system_instruction, request,
+                                             on_chunk=on_chunk, usage_stats=usage_stats)
+
+        if processed_text:
+            print(f"[LLM Processor] 已成功從 {engine.name} 獲取回應。")
+        return processed_text
     except Exception as e:
-        print(f"[LLM Processor] 與 Gemini API 互動時發生錯誤：{e}")
+        print(f"[LLM Processor] 與 {engine.name} 互動時發生錯誤：{e}")
         traceback.print_exc()
         return None
 
@@ -0,0 +1,196 @@
+# llm_providers.py
+import os
+import json
+import queue
+import threading
+import http.client
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+# 相容 OpenAI Chat Completions API 的本地 LLM 伺服器 (llama.cpp server、vLLM、Ollama 等)，
+# 讓統整步驟不需連網、不受 Gemini 配額限制，吞吐量只取決於本機硬體。
+# 可透過環境變數設定：
+#   LOCAL_LLM_BASE_URL          伺服器位址 (預設 http://127.0.0.1:8080/v1)
+#   LOCAL_LLM_MODEL             模型名稱 (預設 local-model；llama.cpp 會忽略此欄位)
+#   LOCAL_LLM_API_KEY           伺服器需要金鑰時設定 (以 Bearer token 送出)
+#   LOCAL_LLM_MAX_CONNECTIONS   連線池上限，也是同時送出的請求數上限 (預設 8)
+#   LOCAL_LLM_TIMEOUT           單一請求的逾時秒數 (預設 600)
+LOCAL_LLM_BASE_URL = os.getenv("LOCAL_LLM_BASE_URL", "http://127.0.0.1:8080/v1")
+LOCAL_LLM_MODEL = os.getenv("LOCAL_LLM_MODEL", "local-model")
+LOCAL_LLM_API_KEY = os.getenv("LOCAL_LLM_API_KEY", "")
+LOCAL_LLM_MAX_CONNECTIONS = int(os.getenv("LOCAL_LLM_MAX_CONNECTIONS", "8"))
+LOCAL_LLM_TIMEOUT = float(os.getenv("LOCAL_LLM_TIMEOUT", "600"))
+
+_USAGE_LOCK = threading.Lock()
+
+class LLMProviderError(Exception):
+    """本地 LLM 請求失敗 (status 為 HTTP 狀態碼，連線錯誤時為 None)。"""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+class HTTPConnectionPool:
+    """
+    簡單的 HTTP keep-alive 連線池：連線在請求之間重複使用，省去每次建立 TCP 連線的成本；
+    同時借出的連線數不超過 max_connections，超過時等待其他請求歸還。
+    """
+
+    def __init__(self, base_url, max_connections=8, timeout=600.0):
+        parts = urlsplit(base_url)
+        self.scheme = parts.scheme or "http"
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port
+        self.base_path = parts.path.rstrip("/")
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max(1, max_connections))
+        self.connections_opened = 0
+
+    def _new_connection(self):
+        connection_class = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+        self.connections_opened += 1
+        return connection_class(self.host, self.port, timeout=self.timeout)
+
+    @contextmanager
+    def connection(self):
+        """借出一條連線；區塊正常結束時歸還到連線池，發生錯誤時關閉。"""
+        with self._slots:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._new_connection()
+            try:
+                yield conn
+            except BaseException:
+                conn.close()
+                raise
+            self._idle.put(conn)
+
+    def _send(self, conn, path, body, headers):
+        """送出請求並取得回應；閒置的 keep-alive 連線可能已被伺服器關閉，此時以新連線重試一次。"""
+        for attempt in range(2):
+            try:
+                conn.request("POST", self.base_path + path, body=body, headers=headers)
+                return conn.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                if attempt:
+                    raise
+                conn.close()  # http.client 會在下一次 request 時自動重新連線
+                self.connections_opened += 1
+
+    def post_json(self, path, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        headers = dict(headers or {}, **{"Content-Type": "application/json"})
+        try:
+            with self.connection() as conn:
+                response = self._send(conn, path, body, headers)
+                data = response.read()
+                if response.will_close:
+                    conn.close()
+        except (OSError, http.client.HTTPException) as e:
+            raise LLMProviderError(f"連線錯誤：{e}")
+        if response.status != 200:
+            raise LLMProviderError(f"HTTP {response.status}: {data.decode('utf-8', 'replace')[:200]}", response.status)
+        return json.loads(data.decode("utf-8"))
+
+    def post_stream(self, path, payload, headers=None):
+        """送出串流請求，逐一產生 Server-Sent Events 的 data 內容 (已解析為 dict)。"""
+        body = json.dumps(payload).encode("utf-8")
+        headers = dict(headers or {}, **{"Content-Type": "application/json", "Accept": "text/event-stream"})
+        try:
+            with self.connection() as conn:
+                response = self._send(conn, path, body, headers)
+                if response.status != 200:
+                    data = response.read()
+                    raise LLMProviderError(f"HTTP {response.status}: {data.decode('utf-8', 'replace')[:200]}",
+                                           response.status)
+                for raw_line in response:
+                    line = raw_line.decode("utf-8").strip()
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        continue
+                    yield json.loads(data)
+                if response.will_close:
+                    conn.close()
+        except (OSError, http.client.HTTPException) as e:
+            raise LLMProviderError(f"連線錯誤：{e}")
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+def _add_usage(usage_stats, usage):
+    if usage_stats is None:
+        return
+    usage = usage or {}
+    with _USAGE_LOCK:
+        usage_stats["requests"] = usage_stats.get("requests", 0) + 1
+        usage_stats["prompt_tokens"] = usage_stats.get("prompt_tokens", 0) + (usage.get("prompt_tokens") or 0)
+        usage_stats["response_tokens"] = usage_stats.get("response_tokens", 0) + (usage.get("completion_tokens") or 0)
+
+class OpenAICompatibleProvider:
+    """透過 /chat/completions 呼叫本地 LLM；同一個行程中的所有請求共用一個連線池。"""
+    name = "openai-compatible"
+    requires_api_key = False
+
+    def __init__(self, base_url=LOCAL_LLM_BASE_URL, model=LOCAL_LLM_MODEL, api_key=LOCAL_LLM_API_KEY,
+                 max_connections=LOCAL_LLM_MAX_CONNECTIONS, timeout=LOCAL_LLM_TIMEOUT):
+        self.model = model
+        self.api_key = api_key
+        self.max_connections = max_connections
+        self.pool = HTTPConnectionPool(base_url, max_connections=max_connections, timeout=timeout)
+
+    @property
+    def model_label(self):
+        """用於 LLM 快取與 manifest 的模型識別 (與 Gemini 的快取分開)。"""
+        return f"{self.name}:{self.model}"
+
+    def generate(self, kind, system_instruction, prompt, max_output_tokens=8192, on_chunk=None, usage_stats=None):
+        """
+        送出單一請求並返回文字結果，失敗時拋出 LLMProviderError。
+        提供 on_chunk 時以串流模式接收，每收到一段文字就呼叫 on_chunk(text)。
+        kind (note / map / reduce) 只用於 Gemini 的模型快取，這裡不需要。
+        """
+        payload = {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": system_instruction},
+                {"role": "user", "content": prompt},
+            ],
+            "max_tokens": max_output_tokens,
+        }
+        headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+        if not on_chunk:
+            data = self.pool.post_json("/chat/completions", payload, headers)
+            _add_usage(usage_stats, data.get("usage"))
+            choices = data.get("choices") or []
+            return (choices[0].get("message") or {}).get("content") if choices else None
+
+        payload["stream"] = True
+        payload["stream_options"] = {"include_usage": True}
+        received = []
+        usage = None
+        for event in self.pool.post_stream("/chat/completions", payload, headers):
+            usage = event.get("usage") or usage
+            for choice in event.get("choices") or []:
+                text = (choice.get("delta") or {}).get("content")
+                if text:
+                    received.append(text)
+                    on_chunk(text)
+        _add_usage(usage_stats, usage)
+        return "".join(received) or None
+
+    def embed(self, texts):
+        """透過 /embeddings 取得每段文字的向量 (供 search_index.py 的向量索引使用)，失敗時拋出 LLMProviderError。"""
+        headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+        data = self.pool.post_json("/embeddings", {"model": self.model, "input": list(texts)}, headers)
+        items = sorted(data.get("data") or [], key=lambda item: item.get("index", 0))
+        if len(items) != len(texts):
+            raise LLMProviderError(f"收到 {len(items)} 個向量，預期 {len(texts)} 個")
+        return [item["embedding"] for item in items]
@@ -1,234 +1,288 @@
 # main.py
-import re
 import os
-import shutil # 用於複製檔案
 
 # 載入環境變數 (從 .env 檔案)
 from dotenv import load_dotenv
 load_dotenv() # 確保這行在腳本較早的位置被執行
 
 # 從其他模組導入函數
-from download_audio import download_youtube_audio, sanitize_for_path 
-from transcriber import transcribe_audio_locally
-from llm_processor import process_transcript_with_gemini
+from download_audio import sanitize_for_path, extract_video_id, output_folder_for_video, find_output_folders
+from transcription_backends import get_backend
+from llm_processor import process_transcript_with_gemini, get_llm_provider, llm_model_label
+from run_report import RunReport
+from workflow_manifest import STAGES, WorkflowManifest
+from segment_store import read_transcript_text
+from captions import CAPTION_POLICIES, CAPTION_POLICY
+from search_index import SEARCH_INDEX, index_folders
+from transcription_worker import WHISPER_WORKER
+from workflow_stages import (
+    segments_path_for, transcribe_params_for, lookup_cached_transcript, fetch_caption_transcript, download_stage,
+    transcribe_stage, record_transcript, save_transcript_stage, summarize_stage, sync_to_vault_stage,
+)
 
-def format_and_save_transcript_to_txt(transcript_text, output_folder, base_filename_stem):
-    """
-    將逐字稿格式化 (句末換行) 並儲存到 .txt 檔案。
-    """
-    if not transcript_text:
-        print("[Saver-TXT] 錯誤：沒有逐字稿內容可以儲存。")
-        return None
-    formatted_text = re.sub(r'([。．\.])\s*', r'\1\n', transcript_text)
-    lines = formatted_text.split('\n')
-    cleaned_lines = [line.strip() for line in lines if line.strip()]
-    final_formatted_text = '\n'.join(cleaned_lines)
-    if not os.path.isdir(output_folder):
-        print(f"[Saver-TXT] 警告：輸出資料夾 {output_folder} 不存在，嘗試建立。")
-        try:
-            os.makedirs(output_folder, exist_ok=True)
-        except OSError as e:
-            print(f"[Saver-TXT] 錯誤：無法建立資料夾 {output_folder} - {e}")
-            return None
-    transcript_filename = f"{base_filename_stem}_transcript.txt"
-    transcript_filepath = os.path.join(output_folder, transcript_filename)
-    try:
-        with open(transcript_filepath, 'w', encoding='utf-8') as f:
-            f.write(final_formatted_text)
-        print(f"[Saver-TXT] 原始逐字稿已成功儲存至：{transcript_filepath}")
-        return transcript_filepath
-    except IOError as e:
-        print(f"[Saver-TXT] 錯誤：無法將原始逐字稿儲存至檔案 {transcript_filepath} - {e}")
-        return None
-
-def save_text_to_markdown(content_text, output_folder, base_filename_stem, suffix="_gemini_output.md"):
-    """
-    將文字內容直接儲存到 Markdown (.md) 檔案。
-    """
-    if not content_text:
-        print("[Saver-MD] 錯誤：沒有內容可以儲存到 Markdown 檔案。")
-        return None
-    if not os.path.isdir(output_folder):
-        print(f"[Saver-MD] 警告：輸出資料夾 {output_folder} 不存在，嘗試建立。")
-        try:
-            os.makedirs(output_folder, exist_ok=True)
-        except OSError as e:
-            print(f"[Saver-MD] 錯誤：無法建立資料夾 {output_folder} - {e}")
-            return None
-    markdown_filename = f"{base_filename_stem}{suffix}"
-    markdown_filepath = os.path.join(output_folder, markdown_filename)
-    try:
-        with open(markdown_filepath, 'w', encoding='utf-8') as f:
-            f.write(content_text)
-        print(f"[Saver-MD] Gemini 處理結果已成功儲存至：{markdown_filepath}")
-        return markdown_filepath
-    except IOError as e:
-        print(f"[Saver-MD] 錯誤：無法將 Gemini 處理結果儲存至檔案 {markdown_filepath} - {e}")
-        return None
-
-def copy_file_to_destination(source_filepath, destination_folder):
+# transcriber (torch / whisper) 與 google.generativeai 的匯入需要數秒，只在實際轉錄 / 呼叫 Gemini 時才載入，
+# 只下載或只統整既有逐字稿的子指令不需支付這些成本。
+WHISPER_MODELS = ("tiny", "base", "small", "medium", "large")
+# 子指令 → 執行到哪個階段為止 (之前已完成的階段依 manifest 直接沿用)
+COMMAND_LAST_STAGE = {
+    "download": "download",
+    "transcribe": "save_transcript",
+    "summarize": "copy_to_obsidian",
+    "full": "copy_to_obsidian",
+}
+
+def run_workflow(force_stage=None, youtube_link=None, desired_name=None, should_keep_video=None,
+                 whisper_model_size=None, last_stage=None, require_transcript=False, interactive=True,
+                 caption_policy=None):
     """
-    將指定的來源檔案複製到目標資料夾。
+    執行完整流程：下載、轉錄、儲存逐字稿、Gemini 統整、複製到 Obsidian。
+    同一部影片重新執行時，會依 manifest 從上次未完成的階段繼續；force_stage 可指定從某階段開始重新計算。
+
+    參數:
+    youtube_link / desired_name / should_keep_video / whisper_model_size: 未提供時，interactive 為 True 會以互動方式詢問，
+        否則分別使用 (無網址、影片 ID、不保留影片、base)。
+    last_stage (str, optional): 完成此階段後即結束 (見 STAGES)，None 代表執行全部階段。
+    require_transcript (bool): 只使用已存在的逐字稿 (任何模型轉錄的皆可)，沒有時直接結束，不會下載或轉錄。
+    interactive (bool): 是否詢問缺少的參數與 Gemini API 金鑰。
+    caption_policy (str, optional): 字幕快速路徑的策略 (off / manual / any，見 captions.py)，預設依 CAPTION_POLICY。
     """
-    if not source_filepath or not os.path.exists(source_filepath):
-        print(f"[Copier] 錯誤：來源檔案 '{source_filepath}' 不存在或無效。")
-        return None
-    if not destination_folder: # 檢查 destination_folder 是否為 None 或空字串
-        print(f"[Copier] 錯誤：未提供有效的目標資料夾路徑。")
-        return None
-    if not os.path.isdir(destination_folder):
-        print(f"[Copier] 錯誤：目標資料夾 '{destination_folder}' 不存在或不是一個有效的資料夾。")
-        print("[Copier] 請確認 Obsidian Vault 的路徑是否已在 .env 中正確設定，並且該資料夾已存在。")
-        return None
-    try:
-        filename = os.path.basename(source_filepath)
-        destination_filepath = os.path.join(destination_folder, filename)
-        shutil.copy2(source_filepath, destination_filepath)
-        print(f"[Copier] 檔案已成功複製到：{destination_filepath}")
-        return destination_filepath
-    except Exception as e:
-        print(f"[Copier] 複製檔案 '{source_filepath}' 到 '{destination_folder}' 時發生錯誤：{e}")
-        return None
-
-def run_workflow():
     print("--- YouTube 影音轉逐字稿自動化流程開始 ---")
-    
+
+    def wants(stage):
+        return last_stage is None or STAGES.index(stage) <= STAGES.index(last_stage)
+
     # 獲取 API 金鑰和路徑設定
     gemini_api_key = os.getenv("GOOGLE_API_KEY")
     obsidian_notes_target_folder = os.getenv("path_to_obsidian_workspace") # 從 .env 讀取 Obsidian 路徑
 
-    if not gemini_api_key:
+    # LLM_PROVIDER=openai-compatible 時使用本地 LLM 伺服器，不需要 Gemini API 金鑰
+    llm_needs_key = get_llm_provider().requires_api_key
+    if not gemini_api_key and llm_needs_key and interactive and wants("summarize"):
         print("[Main Workflow] 警告：未能在環境變數或 .env 檔案中找到 GOOGLE_API_KEY。")
         user_provided_key = input("請手動輸入您的 Gemini API 金鑰 (或直接按 Enter 跳過 LLM 步驟)：").strip()
         if user_provided_key:
             gemini_api_key = user_provided_key
         else:
             print("[Main Workflow] 未提供 Gemini API 金鑰，LLM 處理步驟將被跳過。")
+    llm_enabled = bool(gemini_api_key) or not llm_needs_key
+    llm_model = llm_model_label()
 
     if obsidian_notes_target_folder:
         print(f"[Main Workflow] Obsidian Notes 目標資料夾已設定為: {obsidian_notes_target_folder}")
-    else:
+    elif wants("copy_to_obsidian"):
         print("[Main Workflow] 警告: 未在 .env 檔案中找到 'path_to_obsidian_workspace' 設定。檔案將不會複製到 Obsidian。")
 
 
-    youtube_link = input("請輸入 YouTube 影片的網址： ")
-    if not youtube_link.strip():
-        print("未輸入 YouTube 網址，流程結束。")
-        return
+    if youtube_link is None and interactive:
+        youtube_link = input("請輸入 YouTube 影片的網址： ")
+        if not youtube_link.strip():
+            print("未輸入 YouTube 網址，流程結束。")
+            return
+    youtube_link = (youtube_link or "").strip()
 
-    desired_name = input("請輸入您希望的檔案基礎名稱 (將用於資料夾和檔名)： ")
-    if not desired_name.strip():
+    if desired_name is None and interactive:
+        desired_name = input("請輸入您希望的檔案基礎名稱 (將用於資料夾和檔名)： ")
+    desired_name = (desired_name or extract_video_id(youtube_link) or "").strip()
+    if not desired_name:
         print("未輸入有效的檔案基礎名稱，流程結束。")
         return
 
-    keep_video_input = input("是否要保留下載的主要影片檔案 (MP4/WebM等)？ (y/N，預設為 N)： ")
-    should_keep_video = keep_video_input.strip().lower() == 'y'
+    if should_keep_video is None and interactive and wants("download"):
+        keep_video_input = input("是否要保留下載的主要影片檔案 (MP4/WebM等)？ (y/N，預設為 N)： ")
+        should_keep_video = keep_video_input.strip().lower() == 'y'
+    should_keep_video = bool(should_keep_video)
 
-    whisper_model_size = input("請輸入您希望運行的語音轉文字模型大小 (tiny/ base/ small/ medium/ large)： ")
-    models = {"tiny", "base", "small", "medium", "large"}
-    if whisper_model_size not in models:
+    if whisper_model_size is None and interactive and wants("transcribe") and not require_transcript:
+        whisper_model_size = input("請輸入您希望運行的語音轉文字模型大小 (tiny/ base/ small/ medium/ large)： ")
+    whisper_model_size = whisper_model_size or "base"
+    if whisper_model_size not in WHISPER_MODELS:
         print("未輸入有效的模型類別，流程結束。")
         return
     
     base_download_dir = "downloads" 
+    target_lang = None 
+    # 下載的音訊格式 (mp3 / native / wav16k / flac16k)，可在 .env 以 AUDIO_FORMAT 設定
+    audio_format = os.getenv("AUDIO_FORMAT", "mp3")
+    video_id = extract_video_id(youtube_link)
+    # 有字幕時直接以字幕作為逐字稿 (見 captions.py)
+    caption_policy = caption_policy or CAPTION_POLICY
+    # 轉錄引擎 (openai-whisper / faster-whisper) 可在 .env 以 WHISPER_BACKEND 設定；
+    # WHISPER_VAD=1：轉錄前先以語音活動偵測略過片頭、音樂與靜音 (見 vad.py)
+    transcribe_params = transcribe_params_for(whisper_model_size, target_lang, backend=get_backend().name,
+                                              vad=os.getenv("WHISPER_VAD", "0") == "1",
+                                              caption_policy=caption_policy)
+    report = RunReport(desired_name)
 
-    # --- 步驟 1: 下載音訊 ---
-    print("\n--- 步驟 1: 開始下載音訊 ---")
-    download_info = download_youtube_audio(
-        youtube_link, 
-        desired_name, 
-        output_directory=base_download_dir,
-        keep_video_file=should_keep_video
-    )
+    file_basename = sanitize_for_path(desired_name)
+    # 資料夾依影片 ID 區分 (<基礎名稱> [<影片ID>])，不同影片使用相同的基礎名稱也不會互相覆寫
+    video_output_folder = output_folder_for_video(base_download_dir, file_basename, video_id)
+    if video_id is None and not youtube_link:
+        # 沒有網址時依基礎名稱找回先前的資料夾；同名的影片不只一部時需要網址才能區分
+        existing_folders = find_output_folders(base_download_dir, file_basename)
+        if len(existing_folders) > 1:
+            print(f"[Main Workflow] 基礎名稱 '{file_basename}' 對應到多個影片資料夾，請以 --url 指定影片：")
+            for folder, _ in existing_folders:
+                print(f"- {folder}")
+            return
+        if existing_folders:
+            video_output_folder, video_id = existing_folders[0]
+    # 各階段的狀態與產出檔案記錄在 <基礎名稱>_manifest.json，重新執行時從未完成的階段繼續
+    manifest = WorkflowManifest(video_output_folder, file_basename, force_stage=force_stage)
+    # 轉錄結果 (含段落時間戳記) 存為 <基礎名稱>.segments.bin，之後的 txt / srt / vtt / Markdown 都由此產生
+    segments_path = segments_path_for(video_output_folder, file_basename)
+    transcript = None
 
-    if not download_info:
-        print("[Main Workflow] 音訊下載失敗或未找到檔案，流程中止。")
-        return
+    if ((require_transcript and manifest.is_complete("transcribe"))
+            or manifest.is_complete("transcribe", **transcribe_params)):
+        transcript = read_transcript_text(manifest.artifact("transcribe", "segments"))
+        print("\n--- 步驟 1、2: 已有先前完成的逐字稿，跳過下載與語音轉文字 ---")
 
-    mp3_file_path = download_info["mp3_filepath"]
-    video_output_folder = download_info["output_folder"] 
-    file_basename = download_info["basename"]          
+    # --- 步驟 0: 查詢逐字稿快取 (命中時跳過下載與轉錄) ---
+    cached_transcript = None
+    if transcript is None:
+        cached_transcript = lookup_cached_transcript(manifest, transcribe_params, video_id=video_id)
 
-    print(f"[Main Workflow] 音訊檔案已成功處理。主要 MP3 檔案：{mp3_file_path}")
+    # --- 步驟 0.1: 字幕快速路徑 (字幕品質足夠時跳過下載音訊與 Whisper) ---
+    caption_transcript = None
+    if (transcript is None and not cached_transcript and caption_policy != "off" and youtube_link
+            and wants("transcribe") and not require_transcript):
+        print(f"\n--- 步驟 1: 檢查影片字幕 (策略：{caption_policy}) ---")
+        with report.stage("captions", video=desired_name) as metrics:
+            caption_transcript = fetch_caption_transcript(youtube_link, transcribe_params, metrics)
+            metrics["status"] = "ok" if caption_transcript else "fallback"
 
-    # --- 步驟 2: 音訊轉逐字稿 ---
-    print("\n--- 步驟 2: 開始進行語音轉文字 ---")
-    print(f"[Main Workflow] 將使用 Whisper 模型：'{whisper_model_size}'")
-    target_lang = None 
+    if transcript is not None:
+        pass
+    elif caption_transcript:
+        transcript = caption_transcript["text"]
+        record_transcript(manifest, caption_transcript, transcribe_params, segments_path, video_id,
+                          source=f"captions:{caption_transcript['captions']['kind']}")
+        print("[Main Workflow] 已使用影片字幕作為逐字稿，跳過下載與語音轉文字。")
+    elif cached_transcript:
+        transcript = cached_transcript["text"]
+        record_transcript(manifest, cached_transcript, transcribe_params, segments_path, video_id)
+        print("\n--- 步驟 1、2: 已從快取取得逐字稿，跳過下載與語音轉文字 ---")
+    elif require_transcript:
+        print(f"[Main Workflow] 找不到 '{desired_name}' 已完成的逐字稿，請先執行 transcribe。流程結束。")
+        return
+    else:
+        # --- 步驟 1: 下載音訊 ---
+        if not youtube_link:
+            audio_file_path = None
+            if manifest.is_complete("download", audio_format=audio_format):
+                audio_file_path = manifest.artifact("download", "audio")
+                print(f"\n--- 步驟 1: 沿用先前下載的音訊：{audio_file_path} ---")
+            else:
+                print("[Main Workflow] 沒有先前下載的音訊，需要提供 YouTube 網址。流程結束。")
+                return
+        else:
+            print("\n--- 步驟 1: 下載音訊 ---")
+            with report.stage("download", video=desired_name) as metrics:
+                audio_file_path = download_stage(manifest, youtube_link, desired_name, base_download_dir,
+                                                 video_output_folder, audio_format=audio_format,
+                                                 keep_video_file=should_keep_video, metrics=metrics)
+            if not audio_file_path:
+                print("[Main Workflow] 音訊下載失敗或未找到檔案，流程中止。")
+                return
+            if metrics["status"] == "resumed":
+                print(f"[Main Workflow] 沿用先前下載的音訊：{audio_file_path}")
+            else:
+                print(f"[Main Workflow] 音訊檔案已成功處理。主要音訊檔案：{audio_file_path}")
+        if not wants("transcribe"):
+            _finish_run(report, video_output_folder, file_basename)
+            return
 
-    transcript = transcribe_audio_locally(
-        mp3_file_path, 
-        model_name=whisper_model_size, 
-        target_language=target_lang
-    )
+        # --- 步驟 2: 音訊轉逐字稿 ---
+        print("\n--- 步驟 2: 開始進行語音轉文字 ---")
+        print(f"[Main Workflow] 將使用 Whisper 模型：'{whisper_model_size}'")
+        with report.stage("transcribe", video=desired_name, model=whisper_model_size) as metrics:
+            # WHISPER_WORKER=1：在受監控的子行程中轉錄 (記憶體上限、逾時、進度回報，見 transcription_worker.py)
+            transcription = transcribe_stage(manifest, audio_file_path, transcribe_params, video_id=video_id,
+                                             isolated=WHISPER_WORKER, metrics=metrics)
+        if not transcription:
+            print("[Main Workflow] 語音轉文字失敗，流程中止。")
+            return
 
-    if not transcript:
-        print("[Main Workflow] 語音轉文字失敗，流程中止。")
-        return
+        worker = transcription.get("worker")
+        if worker and (worker["model"] != whisper_model_size or worker["chunked"]):
+            # 子行程因記憶體不足改用了較小的模型 / 分段模式：下次執行時仍會以原本的設定重新轉錄
+            print(f"[Main Workflow] 注意：逐字稿由模型 '{worker['model']}' 產生 (原設定 '{whisper_model_size}')。")
+        transcript = transcription["text"]
+        record_transcript(manifest, transcription, transcribe_params, segments_path, video_id)
     
+    if not wants("transcribe"):
+        print("[Main Workflow] 已有逐字稿，不需要下載音訊。")
+        _finish_run(report, video_output_folder, file_basename)
+        return
+
     print("\n--- 原始逐字稿內容 (預覽前 300 字元) ---")
     preview_length = 300
     print(transcript[:preview_length] + "..." if len(transcript) > preview_length else transcript)
 
-    # --- 步驟 3: 儲存原始逐字稿至 TXT 檔案 ---
+    # --- 步驟 3: 儲存原始逐字稿至 TXT 檔案 (並由段落檔產生字幕與附時間連結的 Markdown) ---
     print("\n--- 步驟 3: 儲存格式化逐字稿至 TXT 檔案 ---")
-    transcript_txt_path = format_and_save_transcript_to_txt(
-        transcript,
-        video_output_folder, 
-        file_basename        
-    )
-    if transcript_txt_path:
+    with report.stage("save_transcript", video=desired_name) as metrics:
+        transcript_txt_path = save_transcript_stage(manifest, segments_path, video_output_folder, file_basename,
+                                                    video_id=video_id, metrics=metrics)
+        metrics["transcript_chars"] = len(transcript)
+    if metrics["status"] == "resumed":
+        print(f"[Main Workflow] 格式化逐字稿已存在，跳過：{transcript_txt_path}")
+    elif transcript_txt_path:
         print(f"[Main Workflow] 原始逐字稿文字檔處理完成。")
     else:
         print("[Main Workflow] 儲存原始逐字稿文字檔失敗。")
+    if not wants("summarize"):
+        _finish_run(report, video_output_folder, file_basename)
+        return
 
-    # --- 步驟 4: LLM (Gemini) 資料統整 ---
-    gemini_processed_content = None
-    gemini_md_path = None # 初始化 gemini_md_path
-    if gemini_api_key:
-        print("\n--- 步驟 4: LLM (Gemini) 資料統整 ---")
-        video_title_for_llm = desired_name 
-        
-        gemini_processed_content = process_transcript_with_gemini(
-            gemini_api_key,
-            transcript, 
-            video_title=video_title_for_llm
-        )
-
-        if gemini_processed_content:
-            print("\n--- Gemini 處理後內容 (預覽前 500 字元) ---")
-            preview_llm_length = 500
-            print(gemini_processed_content[:preview_llm_length] + "..." if len(gemini_processed_content) > preview_llm_length else gemini_processed_content)
-            
-            print("\n--- 步驟 4.1: 儲存 Gemini 處理結果至 Markdown 檔案 ---")
-            gemini_md_path = save_text_to_markdown( # 將回傳值賦給 gemini_md_path
-                gemini_processed_content,
-                video_output_folder,
-                file_basename 
+    # --- 步驟 4: LLM (Gemini) 資料統整 (以串流方式邊接收邊寫入 Markdown 檔案) ---
+    print(f"\n--- 步驟 4: LLM ({llm_model}) 資料統整 ---")
+    generate = None
+    if llm_enabled:
+        def generate(on_chunk, usage_stats):
+            return process_transcript_with_gemini(
+                gemini_api_key,
+                transcript,
+                video_title=desired_name,
+                on_chunk=on_chunk,
+                usage_stats=usage_stats
             )
-            if gemini_md_path:
-                print(f"[Main Workflow] Gemini 輸出 Markdown 檔案處理完成。")
-            else:
-                print("[Main Workflow] 儲存 Gemini 輸出 Markdown 檔案失敗。")
+    with report.stage("llm", video=desired_name, model=llm_model) as metrics:
+        gemini_processed_content, gemini_md_path = summarize_stage(
+            manifest, transcript, desired_name, video_output_folder, file_basename, llm_model, generate, metrics
+        )
+    if metrics["status"] == "resumed":
+        print(f"[Main Workflow] Gemini 筆記已存在，跳過：{gemini_md_path}")
+    elif metrics["status"] == "skipped":
+        print("[Main Workflow] 跳過 LLM (Gemini) 資料統整步驟 (未提供 API 金鑰)。")
+    elif gemini_processed_content:
+        print("\n--- Gemini 處理後內容 (預覽前 500 字元) ---")
+        preview_llm_length = 500
+        print(gemini_processed_content[:preview_llm_length] + "..." if len(gemini_processed_content) > preview_llm_length else gemini_processed_content)
+        if gemini_md_path:
+            print(f"[Main Workflow] Gemini 輸出 Markdown 檔案處理完成。")
         else:
-            print("[Main Workflow] Gemini 處理失敗或沒有內容返回。")
+            print("[Main Workflow] 儲存 Gemini 輸出 Markdown 檔案失敗。")
     else:
-        print("\n[Main Workflow] 跳過 LLM (Gemini) 資料統整步驟 (未提供 API 金鑰)。")
+        print("[Main Workflow] Gemini 處理失敗或沒有內容返回。")
 
-    # --- 步驟 4.2 (或步驟 6 的一部分): 複製 Markdown 檔案到 Obsidian Vault ---
+    # --- 步驟 4.2 (或步驟 6 的一部分): 同步 Markdown 檔案到 Obsidian Vault ---
     copied_to_obsidian_path = None # 初始化
-    if gemini_md_path and os.path.exists(gemini_md_path) and obsidian_notes_target_folder:
-        print("\n--- 步驟 4.2: 複製 Markdown 檔案至 Obsidian Vault ---")
-        print(f"[Main Workflow] 準備將檔案 '{gemini_md_path}' 複製到 Obsidian 資料夾: {obsidian_notes_target_folder}")
-        copied_to_obsidian_path = copy_file_to_destination(gemini_md_path, obsidian_notes_target_folder)
-
-        if copied_to_obsidian_path:
-            print(f"[Main Workflow] 檔案已成功複製到 Obsidian Vault。")
-        else:
+    if gemini_md_path and obsidian_notes_target_folder:
+        print("\n--- 步驟 4.2: 同步 Markdown 檔案至 Obsidian Vault ---")
+        with report.stage("copy_to_obsidian", video=desired_name) as metrics:
+            copied_to_obsidian_path = sync_to_vault_stage(
+                [(manifest, gemini_md_path)], obsidian_notes_target_folder, metrics
+            ).get(gemini_md_path)
+        if not copied_to_obsidian_path:
             print("[Main Workflow] 複製檔案到 Obsidian Vault 失敗。")
+        elif metrics["status"] == "resumed":
+            print(f"[Main Workflow] 筆記先前已複製到 Obsidian Vault，跳過：{copied_to_obsidian_path}")
+        else:
+            print(f"[Main Workflow] 檔案已同步到 Obsidian Vault：{copied_to_obsidian_path}")
     elif gemini_md_path and not obsidian_notes_target_folder:
         print("[Main Workflow] 已產生 Gemini Markdown 檔案，但未設定 Obsidian 目標資料夾，跳過複製步驟。")
-    elif gemini_api_key and not gemini_md_path :
+    elif llm_enabled and not gemini_md_path :
          print("[Main Workflow] 未能產生 Gemini Markdown 檔案，無法複製到 Obsidian。")
 
     # --- 步驟 6: (更新) 同步至 Obsidian 狀態 ---
@@ -240,7 +294,88 @@ def run_workflow():
     elif transcript_txt_path: 
          print(f"原始逐字稿 TXT 檔案 ({transcript_txt_path}) 已準備好，可供參考。")
 
+    _finish_run(report, video_output_folder, file_basename)
+
+def _finish_run(report, video_output_folder, file_basename):
+    # 將這部影片的逐字稿與筆記加入搜尋索引 (只處理有變動的檔案)
+    if SEARCH_INDEX and os.path.isdir(video_output_folder):
+        with report.stage("index", video=file_basename) as metrics:
+            index_folders([video_output_folder], metrics)
+    # 各階段的計時與資源用量 (JSONL，每次執行附加一行)
+    report.write_jsonl(os.path.join(video_output_folder, f"{file_basename}_run_report.jsonl"))
+
     print("\n--- 流程執行完畢 ---")
 
 if __name__ == "__main__":
-    run_workflow()
\ No newline at end of file
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(
+        description="YouTube 影音轉逐字稿與筆記。不指定子指令時以互動模式執行完整流程。"
+    )
+    parser.add_argument("--force-stage", default=None, choices=STAGES,
+                        help="從指定階段 (含) 開始重新計算，忽略先前完成的結果")
+    parser.add_argument("--captions", default=None, choices=CAPTION_POLICIES,
+                        help="影片有字幕時直接作為逐字稿：off (一律使用 Whisper)、manual (只用上傳的字幕)、"
+                             "any (也接受自動字幕)，預設依環境變數 CAPTION_POLICY (off)")
+    subparsers = parser.add_subparsers(dest="command")
+
+    download_parser = subparsers.add_parser("download", help="只下載音訊 (不匯入 Whisper 與 Gemini 套件)")
+    download_parser.add_argument("url", help="YouTube 影片網址")
+    download_parser.add_argument("name", nargs="?", default=None, help="檔案基礎名稱 (預設使用影片 ID)")
+    download_parser.add_argument("--keep-video", action="store_true", help="保留下載的影片檔")
+
+    transcribe_parser = subparsers.add_parser("transcribe", help="轉錄並儲存逐字稿 (沿用已下載的音訊，沒有時先下載)")
+    transcribe_parser.add_argument("name", help="檔案基礎名稱 (與下載時相同)")
+    transcribe_parser.add_argument("--url", default=None, help="YouTube 影片網址 (尚未下載音訊時需要)")
+    transcribe_parser.add_argument("--model", default="base", choices=WHISPER_MODELS, help="Whisper 模型 (預設 base)")
+
+    summarize_parser = subparsers.add_parser("summarize", help="以 LLM 統整既有的逐字稿並複製到 Obsidian (不匯入 Whisper)")
+    summarize_parser.add_argument("name", help="檔案基礎名稱 (與轉錄時相同)")
+    summarize_parser.add_argument("--url", default=None, help="YouTube 影片網址 (同一個基礎名稱有多部影片時用來區分)")
+
+    full_parser = subparsers.add_parser("full", help="執行完整流程 (未提供的參數以互動方式詢問)")
+    full_parser.add_argument("url", nargs="?", default=None, help="YouTube 影片網址")
+    full_parser.add_argument("name", nargs="?", default=None, help="檔案基礎名稱")
+    full_parser.add_argument("--keep-video", action="store_true", default=None, help="保留下載的影片檔")
+    full_parser.add_argument("--model", default=None, choices=WHISPER_MODELS, help="Whisper 模型")
+
+    subparsers.add_parser("index", help="增量更新 downloads 底下所有逐字稿與筆記的搜尋索引")
+
+    search_parser = subparsers.add_parser("search", help="在所有逐字稿與筆記中搜尋")
+    search_parser.add_argument("query", help="查詢文字 (多個詞之間為 AND)")
+    search_parser.add_argument("--limit", type=int, default=10, help="結果數上限 (預設 10)")
+    search_parser.add_argument("--vector", action="store_true", help="以向量相似度搜尋 (需先以 SEARCH_EMBEDDINGS=1 建立索引)")
+
+    args = parser.parse_args()
+    if args.command == "download":
+        run_workflow(force_stage=args.force_stage, youtube_link=args.url, desired_name=args.name,
+                     should_keep_video=args.keep_video, last_stage=COMMAND_LAST_STAGE["download"], interactive=False,
+                     caption_policy=args.captions)
+    elif args.command == "transcribe":
+        run_workflow(force_stage=args.force_stage, youtube_link=args.url, desired_name=args.name,
+                     whisper_model_size=args.model, last_stage=COMMAND_LAST_STAGE["transcribe"], interactive=False,
+                     caption_policy=args.captions)
+    elif args.command == "summarize":
+        run_workflow(force_stage=args.force_stage, youtube_link=args.url, desired_name=args.name, require_transcript=True,
+                     last_stage=COMMAND_LAST_STAGE["summarize"], interactive=False, caption_policy=args.captions)
+    elif args.command == "full":
+        run_workflow(force_stage=args.force_stage, youtube_link=args.url, desired_name=args.name,
+                     should_keep_video=args.keep_video, whisper_model_size=args.model, caption_policy=args.captions)
+    elif args.command == "index":
+        from search_index import update_index
+        started = time.perf_counter()
+        index_stats = update_index()
+        print(f"[Search Index] 掃描 {index_stats['scanned']} 個檔案：重新索引 {index_stats['indexed']}、"
+              f"未變動 {index_stats['unchanged']}、移除 {index_stats['removed']}、新增向量 {index_stats['embedded']} "
+              f"({time.perf_counter() - started:.2f} 秒)")
+    elif args.command == "search":
+        from search_index import search
+        started = time.perf_counter()
+        hits = search(args.query, limit=args.limit, mode="vector" if args.vector else "text")
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        for hit in hits:
+            print(f"[{hit['score']:.3f}] {hit['video']} ({hit['kind']}) {hit['path']}\n    {hit['snippet']}")
+        print(f"共 {len(hits)} 筆結果 ({elapsed_ms:.1f} ms)。")
+    else:
+        run_workflow(force_stage=args.force_stage, caption_policy=args.captions)
\ No newline at end of file
@@ -0,0 +1,33 @@
+# prompt_templates.py
+import os
+import string
+import functools
+
+# 提示詞樣板放在 prompts/ 資料夾 (可用環境變數 PROMPTS_DIR 指向自訂的資料夾)，使用 string.Template 的 ${名稱} 語法。
+# 每種請求分成兩部分：
+#   <種類>_instructions.txt  固定的整理指示 (不含影片標題與逐字稿)，作為 system instruction 送出，
+#                            可放進 Gemini 的 context cache，批次中重複的請求不需每次重新計費
+#   <種類>_request.txt       每個請求不同的部分 (影片標題、逐字稿或分段筆記)
+# 種類：note (單次整理)、map (整理單一片段)、reduce (合併各片段筆記)；
+# 指示中的 ${note_format} 會替換為 note_format.txt (最終筆記的 5 個區塊格式)。
+PROMPTS_DIR = os.getenv("PROMPTS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompts"))
+PROMPT_KINDS = ("note", "map", "reduce")
+
+@functools.lru_cache(maxsize=None)
+def load_template(name):
+    """讀取並編譯 prompts/<name>.txt (每個行程只讀取一次)。"""
+    path = os.path.join(PROMPTS_DIR, f"{name}.txt")
+    with open(path, 'r', encoding='utf-8') as f:
+        return string.Template(f.read())
+
+@functools.lru_cache(maxsize=None)
+def instructions(kind):
+    """返回指定種類的固定整理指示 (已展開 ${note_format})。"""
+    if kind not in PROMPT_KINDS:
+        raise ValueError(f"未知的提示詞種類 '{kind}'，可用種類：{', '.join(PROMPT_KINDS)}")
+    note_format = load_template("note_format").template.strip()
+    return load_template(f"{kind}_instructions").substitute(note_format=note_format).strip()
+
+def render_request(kind, **values):
+    """以 values 填入指定種類的請求樣板。"""
+    return load_template(f"{kind}_request").substitute(values).strip()
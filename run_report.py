@@ -0,0 +1,191 @@
+# run_report.py
+import os
+import json
+import time
+import uuid
+import threading
+import subprocess
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource  # 僅 Linux / macOS 提供
+except ImportError:
+    resource = None
+
+try:
+    import psutil  # 選用套件，Windows 上用來取得記憶體峰值
+except ImportError:
+    psutil = None
+
+def _peak_rss_mb():
+    """目前行程 (不含子行程) 到目前為止的記憶體峰值 (MB)，無法取得時返回 None。"""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux 單位為 KB，macOS 為 bytes
+        return peak / (1024 * 1024) if os.uname().sysname == "Darwin" else peak / 1024
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / (1024 * 1024)
+    return None
+
+def _children_cpu_seconds():
+    """已結束的子行程 (yt-dlp、ffmpeg 等) 累計的 CPU 時間。"""
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+def probe_audio_duration(audio_file_path):
+    """使用 ffprobe 取得音訊長度 (秒)，失敗時返回 None。"""
+    try:
+        process = subprocess.run(
+            ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", audio_file_path],
+            check=True, capture_output=True, text=True, encoding='utf-8'
+        )
+        return float(process.stdout.strip())
+    except (OSError, ValueError, subprocess.CalledProcessError):
+        return None
+
+def folder_size_bytes(folder):
+    """資料夾內所有檔案的總大小 (不含子資料夾)。"""
+    if not folder or not os.path.isdir(folder):
+        return 0
+    total = 0
+    for entry in os.scandir(folder):
+        if entry.is_file():
+            total += entry.stat().st_size
+    return total
+
+class RunReport:
+    """
+    收集一次執行 (單一影片或整個批次) 中各階段的計時與資源用量，
+    並輸出為 JSONL 報告或 Prometheus 文字格式。
+    """
+
+    def __init__(self, run_name=""):
+        self.run_id = uuid.uuid4().hex[:12]
+        self.run_name = run_name
+        self.started_at = datetime.now().isoformat(timespec="seconds")
+        self._start = time.perf_counter()
+        self.stages = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, stage_name, video=None, **fields):
+        """
+        量測一個階段：牆上時間、CPU 時間 (本行程與子行程)、記憶體峰值。
+        with 區塊內可對 yield 出的字典加入額外指標 (例如 audio_seconds、bytes_downloaded、tokens)。
+        """
+        metrics = {"stage": stage_name, "video": video}
+        metrics.update(fields)
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        thread_cpu_start = time.thread_time()
+        children_start = _children_cpu_seconds()
+        status = "ok"
+        try:
+            yield metrics
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            metrics["status"] = metrics.get("status", status)
+            metrics["wall_seconds"] = round(time.perf_counter() - wall_start, 4)
+            # 批次模式下各階段並行，cpu_seconds 為整個行程的 CPU 時間 (包含其他階段)，
+            # thread_cpu_seconds 只計算執行此階段的執行緒
+            metrics["cpu_seconds"] = round(time.process_time() - cpu_start, 4)
+            metrics["thread_cpu_seconds"] = round(time.thread_time() - thread_cpu_start, 4)
+            metrics["children_cpu_seconds"] = round(_children_cpu_seconds() - children_start, 4)
+            metrics["peak_rss_mb"] = _peak_rss_mb()
+            audio_seconds = metrics.get("audio_seconds")
+            if stage_name == "transcribe" and audio_seconds and metrics["wall_seconds"] > 0:
+                # real-time factor：處理時間 / 音訊長度，小於 1 代表比即時播放更快
+                metrics["real_time_factor"] = round(metrics["wall_seconds"] / audio_seconds, 4)
+            with self._lock:
+                self.stages.append(metrics)
+
+    def to_dict(self):
+        return {
+            "run_id": self.run_id,
+            "run_name": self.run_name,
+            "started_at": self.started_at,
+            # 從建立報告到輸出為止的實際經過時間 (批次模式下各階段重疊，會小於各階段加總)
+            "total_wall_seconds": round(time.perf_counter() - self._start, 4),
+            "stage_wall_seconds_sum": round(sum(s["wall_seconds"] for s in self.stages), 4),
+            "stages": self.stages,
+        }
+
+    def write_jsonl(self, report_path):
+        """將本次執行的報告以一行 JSON 附加到 report_path。返回檔案路徑，失敗時返回 None。"""
+        try:
+            os.makedirs(os.path.dirname(report_path) or ".", exist_ok=True)
+            with open(report_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(self.to_dict(), ensure_ascii=False) + "\n")
+            print(f"[Run Report] 執行報告已寫入：{report_path}")
+            return report_path
+        except OSError as e:
+            print(f"[Run Report] 錯誤：無法寫入執行報告 {report_path} - {e}")
+            return None
+
+    def to_prometheus(self, prefix="ytnotes"):
+        """以 Prometheus 文字格式輸出各階段指標 (每部影片每個階段一組樣本，以及各階段的加總)。"""
+        numeric_fields = [
+            ("wall_seconds", "Wall-clock time spent in the stage."),
+            ("cpu_seconds", "Process CPU time spent while the stage ran."),
+            ("children_cpu_seconds", "CPU time of child processes (yt-dlp, ffmpeg)."),
+            ("peak_rss_mb", "Peak resident set size of the process in MB."),
+            ("audio_seconds", "Duration of the processed audio."),
+            ("real_time_factor", "Transcription time divided by audio duration."),
+            ("speech_seconds", "Audio sent to Whisper after voice activity detection."),
+            ("vad_skipped_seconds", "Non-speech audio skipped by voice activity detection."),
+            ("bytes_downloaded", "Bytes written by the download stage."),
+            ("prompt_tokens", "Prompt tokens sent to the LLM."),
+            ("response_tokens", "Response tokens returned by the LLM."),
+        ]
+
+        def escape(value):
+            return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+        lines = []
+        for field, help_text in numeric_fields:
+            samples = [s for s in self.stages if isinstance(s.get(field), (int, float))]
+            if not samples:
+                continue
+            metric = f"{prefix}_stage_{field}"
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} gauge")
+            totals = {}
+            for s in samples:
+                labels = f'run_id="{self.run_id}",stage="{escape(s["stage"])}",video="{escape(s.get("video") or "")}"'
+                lines.append(f"{metric}{{{labels}}} {s[field]}")
+                totals[s["stage"]] = totals.get(s["stage"], 0) + s[field]
+            if field in ("wall_seconds", "cpu_seconds", "children_cpu_seconds", "audio_seconds",
+                         "speech_seconds", "vad_skipped_seconds",
+                         "bytes_downloaded", "prompt_tokens", "response_tokens"):
+                total_metric = f"{metric}_sum"
+                lines.append(f"# TYPE {total_metric} gauge")
+                for stage_name, total in totals.items():
+                    lines.append(f'{total_metric}{{run_id="{self.run_id}",stage="{escape(stage_name)}"}} {round(total, 4)}')
+        status_counts = {}
+        for s in self.stages:
+            key = (s["stage"], s.get("status", "ok"))
+            status_counts[key] = status_counts.get(key, 0) + 1
+        if status_counts:
+            lines.append(f"# TYPE {prefix}_stage_runs gauge")
+            for (stage_name, status), count in status_counts.items():
+                lines.append(f'{prefix}_stage_runs{{run_id="{self.run_id}",stage="{escape(stage_name)}",status="{status}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, metrics_path):
+        """將 Prometheus 文字格式寫入檔案 (可給 node_exporter 的 textfile collector 讀取)。"""
+        try:
+            tmp_path = metrics_path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(self.to_prometheus())
+            os.replace(tmp_path, metrics_path)
+            print(f"[Run Report] Prometheus 指標已寫入：{metrics_path}")
+            return metrics_path
+        except OSError as e:
+            print(f"[Run Report] 錯誤：無法寫入 Prometheus 指標 {metrics_path} - {e}")
+            return None
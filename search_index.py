@@ -0,0 +1,369 @@
+# search_index.py
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+
+import numpy as np
+
+# 逐字稿與筆記的全文檢索索引 (SQLite FTS5)，以及選用的向量索引 (memory-map 的 float32 矩陣)。
+# 每部影片處理完成後只更新有變動的檔案 (先比對大小與修改時間，不同時再比對內容雜湊)，
+# `python main.py search <查詢>` 可在整個資料庫中以毫秒級的時間查詢。
+# 可透過環境變數設定：
+#   SEARCH_INDEX             0 停用處理完成後的自動索引 (預設 1)
+#   SEARCH_INDEX_DB          索引資料庫路徑 (預設 downloads/search_index.sqlite3)
+#   SEARCH_CHUNK_CHARS       每個索引片段的字元數上限 (預設 800，查詢結果以片段為單位)
+#   SEARCH_EMBEDDINGS        1 時另外建立向量索引，向量由 LOCAL_LLM_BASE_URL 的 /embeddings 產生 (預設 0)
+#   SEARCH_EMBEDDING_MODEL   向量模型名稱 (預設與 LOCAL_LLM_MODEL 相同)
+SEARCH_INDEX = os.getenv("SEARCH_INDEX", "1") == "1"
+SEARCH_INDEX_DB = os.getenv("SEARCH_INDEX_DB", os.path.join("downloads", "search_index.sqlite3"))
+SEARCH_CHUNK_CHARS = int(os.getenv("SEARCH_CHUNK_CHARS", "800"))
+SEARCH_EMBEDDINGS = os.getenv("SEARCH_EMBEDDINGS", "0") == "1"
+SEARCH_EMBEDDING_MODEL = os.getenv("SEARCH_EMBEDDING_MODEL", os.getenv("LOCAL_LLM_MODEL", "local-model"))
+
+# 索引的檔案種類：檔名結尾 → 種類
+INDEXED_SUFFIXES = {"_transcript.txt": "transcript", "_gemini_output.md": "note"}
+_EMBED_BATCH = 32
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    path TEXT PRIMARY KEY,
+    video TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    sha256 TEXT NOT NULL,
+    first_chunk INTEGER NOT NULL,
+    chunk_count INTEGER NOT NULL,
+    indexed_at REAL NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS chunks USING fts5(body, path UNINDEXED, video UNINDEXED, kind UNINDEXED);
+CREATE TABLE IF NOT EXISTS vectors (chunk_id INTEGER PRIMARY KEY, row INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+# FTS5 的 unicode61 斷詞器會把連續的中日韓文字視為一個詞，無法查詢其中的詞語；
+# 索引與查詢時在每個中日韓字元前後加上空白，讓每個字成為一個詞，查詢的詞語則以片語 (相鄰的字) 比對。
+_CJK_CHAR = re.compile(r'[　-鿿＀-￯]')
+_CJK_UNSPACE = re.compile(r' ?(\[?[　-鿿＀-￯]\]?) ?')
+
+_INDEX_LOCK = threading.Lock()
+_embedder = None
+
+def _spaced(text):
+    return _CJK_CHAR.sub(r' \g<0> ', text)
+
+def _unspaced(text):
+    return _CJK_UNSPACE.sub(r'\1', text)
+
+def _vectors_path(db_path):
+    return f"{db_path}.vectors.f32"
+
+def _connect(db_path):
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+def _sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def split_chunks(text, max_chars=SEARCH_CHUNK_CHARS):
+    """依行將文字切成不超過 max_chars 個字元的片段 (過長的單行直接截斷)。"""
+    chunks = []
+    current = ""
+    for line in text.splitlines():
+        line = line.strip()
+        while len(line) > max_chars:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(line[:max_chars])
+            line = line[max_chars:]
+        if not line:
+            continue
+        if current and len(current) + 1 + len(line) > max_chars:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n{line}" if current else line
+    if current:
+        chunks.append(current)
+    return chunks
+
+def _find_documents(folders):
+    """列出資料夾中需要索引的檔案：[(路徑, 影片名稱, 種類), ...]。"""
+    found = []
+    for folder in folders:
+        try:
+            names = sorted(os.listdir(folder))
+        except OSError:
+            continue
+        for name in names:
+            for suffix, kind in INDEXED_SUFFIXES.items():
+                if name.endswith(suffix):
+                    video = os.path.basename(os.path.normpath(folder))
+                    found.append((os.path.normpath(os.path.join(folder, name)), video, kind))
+    return found
+
+def _library_folders(output_directory):
+    try:
+        names = sorted(os.listdir(output_directory))
+    except OSError:
+        return []
+    return [os.path.join(output_directory, name) for name in names
+            if not name.startswith(".") and os.path.isdir(os.path.join(output_directory, name))]
+
+def _delete_document(conn, path):
+    # 每個檔案的片段以連續的 rowid 寫入，依範圍刪除 (FTS5 的 UNINDEXED 欄位無法以索引查詢)
+    row = conn.execute("SELECT first_chunk, chunk_count FROM documents WHERE path = ?", (path,)).fetchone()
+    if not row:
+        return
+    last_chunk = row[0] + row[1] - 1
+    conn.execute("DELETE FROM vectors WHERE chunk_id BETWEEN ? AND ?", (row[0], last_chunk))
+    conn.execute("DELETE FROM chunks WHERE rowid BETWEEN ? AND ?", (row[0], last_chunk))
+    conn.execute("DELETE FROM documents WHERE path = ?", (path,))
+
+def update_index(folders=None, output_directory="downloads", db_path=None, embeddings=None):
+    """
+    增量更新索引：只重新索引新增或內容有變動的檔案，並移除已刪除的檔案。
+
+    參數:
+    folders (list, optional): 要更新的影片資料夾；未提供時掃描 output_directory 底下的所有影片資料夾。
+    db_path (str, optional): 索引資料庫路徑，預設依 SEARCH_INDEX_DB。
+    embeddings (bool, optional): 是否一併更新向量索引，預設依 SEARCH_EMBEDDINGS。
+
+    返回:
+    dict: {"scanned", "indexed", "unchanged", "removed", "embedded"} 各項檔案 / 片段數。
+    """
+    db_path = db_path or SEARCH_INDEX_DB
+    embeddings = SEARCH_EMBEDDINGS if embeddings is None else embeddings
+    scan_all = folders is None
+    folders = _library_folders(output_directory) if scan_all else [os.path.normpath(f) for f in folders]
+    stats = {"scanned": 0, "indexed": 0, "unchanged": 0, "removed": 0, "embedded": 0}
+
+    with _INDEX_LOCK:
+        conn = _connect(db_path)
+        try:
+            known = {row[0]: row[1:] for row in conn.execute("SELECT path, size, mtime, sha256 FROM documents")}
+            seen = set()
+            with conn:
+                for path, video, kind in _find_documents(folders):
+                    stats["scanned"] += 1
+                    seen.add(path)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    previous = known.get(path)
+                    if previous and previous[0] == stat.st_size and previous[1] == stat.st_mtime:
+                        stats["unchanged"] += 1
+                        continue
+                    digest = _sha256_file(path)
+                    if previous and previous[2] == digest:
+                        # 內容沒變 (例如重新寫入同樣的檔案)，只更新大小與修改時間
+                        conn.execute("UPDATE documents SET size = ?, mtime = ? WHERE path = ?",
+                                     (stat.st_size, stat.st_mtime, path))
+                        stats["unchanged"] += 1
+                        continue
+                    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                        text = f.read()
+                    _delete_document(conn, path)
+                    chunks = split_chunks(text)
+                    first_chunk = conn.execute("SELECT COALESCE(MAX(rowid), 0) + 1 FROM chunks").fetchone()[0]
+                    conn.executemany(
+                        "INSERT INTO chunks (rowid, body, path, video, kind) VALUES (?, ?, ?, ?, ?)",
+                        [(first_chunk + i, _spaced(chunk), path, video, kind) for i, chunk in enumerate(chunks)]
+                    )
+                    conn.execute("INSERT INTO documents VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                 (path, video, kind, stat.st_size, stat.st_mtime, digest,
+                                  first_chunk, len(chunks), time.time()))
+                    stats["indexed"] += 1
+
+                # 移除已不存在的檔案 (只檢查本次掃描範圍內的資料夾)
+                for path in known:
+                    if path in seen:
+                        continue
+                    if scan_all or os.path.dirname(path) in folders:
+                        if not os.path.exists(path):
+                            _delete_document(conn, path)
+                            stats["removed"] += 1
+            if embeddings:
+                stats["embedded"] = _update_vectors(conn, db_path)
+        finally:
+            conn.close()
+    return stats
+
+def index_folders(folders, metrics=None):
+    """
+    處理完成後更新影片資料夾的索引 (main.py 與 batch_runner.py 使用)。索引失敗只印出警告，不影響流程。
+
+    參數:
+    metrics (dict, optional): 提供時 (例如 RunReport.stage 的指標字典)，將更新的檔案數加入其中。
+    """
+    try:
+        stats = update_index(folders)
+    except (sqlite3.Error, OSError) as e:
+        print(f"[Search Index] 更新搜尋索引失敗：{e}")
+        if metrics is not None:
+            metrics["status"] = "failed"
+        return None
+    if metrics is not None:
+        metrics.update(stats)
+    if stats["indexed"] or stats["removed"]:
+        print(f"[Search Index] 搜尋索引已更新：{stats['indexed']} 個檔案重新索引，{stats['removed']} 個移除。")
+    return stats
+
+def _get_embedder():
+    global _embedder
+    if _embedder is None:
+        from llm_providers import OpenAICompatibleProvider
+        _embedder = OpenAICompatibleProvider(model=SEARCH_EMBEDDING_MODEL)
+    return _embedder
+
+def _meta(conn, key, default=None):
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else default
+
+def _set_meta(conn, key, value):
+    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+def _reset_vectors(conn, vectors_path):
+    with conn:
+        conn.execute("DELETE FROM vectors")
+        conn.execute("DELETE FROM meta WHERE key IN ('vector_dim', 'vector_rows', 'vector_model')")
+    if os.path.exists(vectors_path):
+        os.remove(vectors_path)
+
+def _compact_vectors(conn, vectors_path, dim, total_rows):
+    """已刪除片段的向量只從對照表移除，檔案中的列在失效列超過一半時才重寫。"""
+    mapping = conn.execute("SELECT chunk_id, row FROM vectors ORDER BY row").fetchall()
+    if total_rows <= 2 * len(mapping):
+        return total_rows
+    matrix = np.memmap(vectors_path, dtype="<f4", mode="r", shape=(total_rows, dim))
+    tmp_path = f"{vectors_path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        for chunk_id, row in mapping:
+            f.write(np.asarray(matrix[row], dtype="<f4").tobytes())
+    del matrix
+    os.replace(tmp_path, vectors_path)
+    with conn:
+        conn.executemany("UPDATE vectors SET row = ? WHERE chunk_id = ?",
+                         [(new_row, chunk_id) for new_row, (chunk_id, _) in enumerate(mapping)])
+        _set_meta(conn, "vector_rows", len(mapping))
+    return len(mapping)
+
+def _update_vectors(conn, db_path):
+    """為尚未有向量的片段產生向量，正規化後附加到向量檔，返回新增的向量數。"""
+    from llm_providers import LLMProviderError
+    vectors_path = _vectors_path(db_path)
+    if _meta(conn, "vector_model") not in (None, SEARCH_EMBEDDING_MODEL):
+        print("[Search Index] 向量模型已變更，重新建立向量索引。")
+        _reset_vectors(conn, vectors_path)
+    dim = int(_meta(conn, "vector_dim", 0))
+    total_rows = int(_meta(conn, "vector_rows", 0))
+    if dim:
+        total_rows = _compact_vectors(conn, vectors_path, dim, total_rows)
+    pending = conn.execute(
+        "SELECT rowid, body FROM chunks WHERE rowid NOT IN (SELECT chunk_id FROM vectors) ORDER BY rowid"
+    ).fetchall()
+    added = 0
+    for start in range(0, len(pending), _EMBED_BATCH):
+        batch = pending[start:start + _EMBED_BATCH]
+        try:
+            vectors = np.asarray(_get_embedder().embed([_unspaced(body) for _, body in batch]), dtype="<f4")
+        except LLMProviderError as e:
+            print(f"[Search Index] 產生向量失敗，下次更新索引時重試：{e}")
+            break
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        if not dim:
+            dim = vectors.shape[1]
+        elif vectors.shape[1] != dim:
+            print(f"[Search Index] 向量維度 ({vectors.shape[1]}) 與既有索引 ({dim}) 不同，略過。")
+            break
+        with open(vectors_path, 'ab') as f:
+            f.write(vectors.tobytes())
+        with conn:
+            conn.executemany("INSERT INTO vectors (chunk_id, row) VALUES (?, ?)",
+                             [(chunk_id, total_rows + i) for i, (chunk_id, _) in enumerate(batch)])
+            total_rows += len(batch)
+            _set_meta(conn, "vector_dim", dim)
+            _set_meta(conn, "vector_rows", total_rows)
+            _set_meta(conn, "vector_model", SEARCH_EMBEDDING_MODEL)
+        added += len(batch)
+    return added
+
+def _fts_query(query):
+    """將使用者輸入轉為 FTS5 查詢：每個詞以片語比對 (避免特殊字元被當成語法)，多個詞之間為 AND。"""
+    terms = []
+    for term in query.split():
+        spaced = " ".join(_spaced(term).split())
+        if spaced:
+            terms.append('"' + spaced.replace('"', '""') + '"')
+    return " ".join(terms)
+
+def search(query, limit=10, mode="text", db_path=None):
+    """
+    查詢索引。
+
+    參數:
+    query (str): 查詢文字。
+    limit (int): 返回的結果數上限。
+    mode (str): "text" (全文檢索，依 BM25 排序) 或 "vector" (以向量的餘弦相似度排序，需先建立向量索引)。
+
+    返回:
+    list: [{"video", "kind", "path", "snippet", "score"}, ...]，依相關程度由高到低排序。
+    """
+    db_path = db_path or SEARCH_INDEX_DB
+    if not os.path.exists(db_path):
+        return []
+    conn = _connect(db_path)
+    try:
+        if mode == "vector":
+            return _vector_search(conn, db_path, query, limit)
+        fts_query = _fts_query(query)
+        if not fts_query:
+            return []
+        rows = conn.execute(
+            "SELECT video, kind, path, snippet(chunks, 0, '[', ']', '…', 24), rank FROM chunks "
+            "WHERE chunks MATCH ? ORDER BY rank LIMIT ?",
+            (fts_query, limit)
+        ).fetchall()
+    finally:
+        conn.close()
+    return [{"video": video, "kind": kind, "path": path, "snippet": _unspaced(snippet).replace("\n", " "),
+             "score": round(-rank, 4)}
+            for video, kind, path, snippet, rank in rows]
+
+def _vector_search(conn, db_path, query, limit):
+    dim = int(_meta(conn, "vector_dim", 0))
+    total_rows = int(_meta(conn, "vector_rows", 0))
+    if not dim or not total_rows:
+        print("[Search Index] 尚未建立向量索引 (設定 SEARCH_EMBEDDINGS=1 後執行 python main.py index)。")
+        return []
+    mapping = conn.execute("SELECT chunk_id, row FROM vectors").fetchall()
+    if not mapping:
+        return []
+    chunk_ids = np.array([chunk_id for chunk_id, _ in mapping])
+    rows = np.array([row for _, row in mapping])
+    query_vector = np.asarray(_get_embedder().embed([query])[0], dtype="<f4")
+    query_vector /= max(float(np.linalg.norm(query_vector)), 1e-12)
+    matrix = np.memmap(_vectors_path(db_path), dtype="<f4", mode="r", shape=(total_rows, dim))
+    scores = (matrix @ query_vector)[rows]
+    top = np.argsort(-scores)[:limit]
+    results = []
+    for i in top:
+        video, kind, path, body = conn.execute(
+            "SELECT video, kind, path, body FROM chunks WHERE rowid = ?", (int(chunk_ids[i]),)
+        ).fetchone()
+        snippet = _unspaced(body).replace("\n", " ")
+        results.append({"video": video, "kind": kind, "path": path,
+                        "snippet": snippet[:120] + ("…" if len(snippet) > 120 else ""),
+                        "score": round(float(scores[i]), 4)})
+    return results
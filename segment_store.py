@@ -0,0 +1,233 @@
+# segment_store.py
+import os
+import sys
+import json
+import codecs
+import struct
+
+import numpy as np
+
+# 逐字稿段落的二進位儲存格式 (<基礎名稱>.segments.bin)，可直接以 memory-map 讀取：
+#
+#   header        "<8sIIQ"：magic、段落數 n、metadata JSON 長度、文字區長度
+#   metadata      UTF-8 JSON (語言、模型等)，補齊到 8 bytes 對齊
+#   starts        float32[n]  段落開始時間 (秒)
+#   ends          float32[n]  段落結束時間 (秒)
+#   avg_logprob   float32[n]  段落 token 的平均 log 機率 (無資料時為 NaN)
+#   no_speech     float32[n]  段落為非語音的機率 (無資料時為 NaN)
+#   text_offsets  uint64[n+1] 每個段落文字在文字區中的起訖位置
+#   text          UTF-8 文字區 (所有段落文字直接相接，"".join 即為完整逐字稿)
+#
+# .txt、.srt、.vtt 與附時間連結的 Markdown 都由此檔案產生，不需要重新處理音訊。
+
+_MAGIC = b"YTSEG\x01\x00\x00"
+_HEADER = struct.Struct("<8sIIQ")
+SEGMENTS_SUFFIX = ".segments.bin"
+
+def _pad8(size):
+    return (8 - size % 8) % 8
+
+def write_segments(file_path, segments, metadata=None):
+    """
+    將段落 list 寫入二進位檔 (先寫暫存檔再改名)。
+
+    參數:
+    segments (list): 每個元素為 {"start", "end", "text"}，可選 "avg_logprob"、"no_speech_prob"。
+    metadata (dict, optional): 一併儲存的資訊，例如 {"language": "zh", "model": "base"}。
+
+    返回:
+    str: 檔案路徑。
+    """
+    n = len(segments)
+    encoded = [seg["text"].encode("utf-8") for seg in segments]
+    offsets = np.zeros(n + 1, dtype="<u8")
+    if n:
+        offsets[1:] = np.cumsum([len(b) for b in encoded])
+    meta_bytes = json.dumps(metadata or {}, ensure_ascii=False).encode("utf-8")
+
+    def column(key):
+        return np.array([np.nan if seg.get(key) is None else seg[key] for seg in segments], dtype="<f4")
+
+    tmp_path = f"{file_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER.pack(_MAGIC, n, len(meta_bytes), int(offsets[-1])))
+        f.write(meta_bytes + b"\0" * _pad8(len(meta_bytes)))
+        for key in ("start", "end", "avg_logprob", "no_speech_prob"):
+            f.write(column(key).tobytes())
+        f.write(offsets.tobytes())
+        f.write(b"".join(encoded))
+    os.replace(tmp_path, file_path)
+    return file_path
+
+class SegmentStore:
+    """
+    以 memory-map 開啟 .segments.bin；時間欄位為 numpy 陣列 (不會整個讀入記憶體)，文字依需要才解碼。
+    """
+
+    def __init__(self, file_path):
+        self.path = file_path
+        raw = np.memmap(file_path, dtype=np.uint8, mode="r")
+        magic, n, meta_len, text_len = _HEADER.unpack(bytes(raw[:_HEADER.size]))
+        if magic != _MAGIC:
+            raise ValueError(f"{file_path} 不是逐字稿段落檔 (magic 不符)")
+        offset = _HEADER.size
+        self.metadata = json.loads(bytes(raw[offset:offset + meta_len]).decode("utf-8") or "{}")
+        offset += meta_len + _pad8(meta_len)
+
+        def take(dtype, count):
+            nonlocal offset
+            size = np.dtype(dtype).itemsize * count
+            array = raw[offset:offset + size].view(dtype)
+            offset += size
+            return array
+
+        self.starts = take("<f4", n)
+        self.ends = take("<f4", n)
+        self.avg_logprob = take("<f4", n)
+        self.no_speech_prob = take("<f4", n)
+        self._offsets = take("<u8", n + 1)
+        self._text = raw[offset:offset + text_len]
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        # 釋放對 memmap 的參考，檔案映射隨之關閉
+        self.starts = self.ends = self.avg_logprob = self.no_speech_prob = self._offsets = self._text = None
+
+    @property
+    def has_timestamps(self):
+        return bool(self.metadata.get("timestamps", True))
+
+    def text(self, index):
+        return bytes(self._text[int(self._offsets[index]):int(self._offsets[index + 1])]).decode("utf-8")
+
+    def full_text(self):
+        return bytes(self._text).decode("utf-8")
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield {"start": float(self.starts[i]), "end": float(self.ends[i]), "text": self.text(i)}
+
+def write_transcript(file_path, text, segments=None, metadata=None):
+    """
+    儲存轉錄結果。沒有段落資訊的逐字稿 (例如舊版快取) 以單一段落儲存，並在 metadata 標記 timestamps=False。
+    """
+    metadata = dict(metadata or {})
+    if not segments:
+        segments = [{"start": 0.0, "end": 0.0, "text": text}]
+        metadata["timestamps"] = False
+    return write_segments(file_path, segments, metadata)
+
+def read_transcript_text(file_path):
+    """讀取 .segments.bin 中的完整逐字稿文字。"""
+    with SegmentStore(file_path) as store:
+        return store.full_text()
+
+def iter_transcript_text(file_path, block_bytes=1 << 18):
+    """逐塊讀取 .segments.bin 中的逐字稿文字 (不會一次把整份文字載入記憶體)。"""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    with SegmentStore(file_path) as store:
+        blob = store._text
+        for start in range(0, len(blob), block_bytes):
+            text = decoder.decode(bytes(blob[start:start + block_bytes]))
+            if text:
+                yield text
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+def _timestamp(seconds, separator):
+    millis = int(round(max(0.0, seconds) * 1000))
+    hours, millis = divmod(millis, 3600000)
+    minutes, millis = divmod(millis, 60000)
+    secs, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}{separator}{millis:03d}"
+
+def _short_timestamp(seconds):
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, secs = divmod(rest, 60)
+    return f"{hours}:{minutes:02d}:{secs:02d}" if hours else f"{minutes:02d}:{secs:02d}"
+
+def to_srt(store):
+    lines = []
+    for index, seg in enumerate(store, start=1):
+        lines.append(f"{index}\n{_timestamp(seg['start'], ',')} --> {_timestamp(seg['end'], ',')}\n{seg['text'].strip()}\n")
+    return "\n".join(lines)
+
+def to_vtt(store):
+    lines = ["WEBVTT\n"]
+    for seg in store:
+        lines.append(f"{_timestamp(seg['start'], '.')} --> {_timestamp(seg['end'], '.')}\n{seg['text'].strip()}\n")
+    return "\n".join(lines)
+
+def to_timestamped_markdown(store, video_id=None, paragraph_seconds=60, title=None):
+    """
+    將段落依約 paragraph_seconds 秒合併為段落，每段開頭加上時間戳記；
+    提供 video_id 時時間戳記會連結到 YouTube 影片的對應時間點。
+    """
+    lines = [f"# {title}\n"] if title else []
+    paragraph = []
+    paragraph_start = None
+    segments = list(store)
+    for index, seg in enumerate(segments):
+        if paragraph_start is None:
+            paragraph_start = seg["start"]
+        paragraph.append(seg["text"].strip())
+        last = index == len(segments) - 1
+        if last or segments[index + 1]["start"] - paragraph_start >= paragraph_seconds:
+            label = _short_timestamp(paragraph_start)
+            stamp = f"[{label}](https://youtu.be/{video_id}?t={int(paragraph_start)})" if video_id else f"**[{label}]**"
+            lines.append(f"{stamp} {' '.join(p for p in paragraph if p)}\n")
+            paragraph = []
+            paragraph_start = None
+    return "\n".join(lines)
+
+def export_segments(segments_path, output_folder, base_filename_stem, video_id=None, formats=("srt", "vtt", "md")):
+    """
+    由 .segments.bin 產生字幕與附時間連結的 Markdown。
+
+    返回:
+    dict: 格式 → 輸出檔案路徑 (沒有時間資訊時不產生任何檔案)。
+    """
+    writers = {
+        "srt": (f"{base_filename_stem}.srt", to_srt),
+        "vtt": (f"{base_filename_stem}.vtt", to_vtt),
+        "md": (f"{base_filename_stem}_timestamped.md",
+               lambda store: to_timestamped_markdown(store, video_id=video_id, title=base_filename_stem)),
+    }
+    outputs = {}
+    with SegmentStore(segments_path) as store:
+        if not store.has_timestamps:
+            print("[Segments] 逐字稿沒有時間資訊 (來自舊版快取)，跳過字幕輸出。")
+            return outputs
+        for fmt in formats:
+            filename, render = writers[fmt]
+            path = os.path.join(output_folder, filename)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(render(store))
+            os.replace(tmp_path, path)
+            outputs[fmt] = path
+            print(f"[Segments] 已輸出 {fmt.upper()}：{path}")
+    return outputs
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("用法：python segment_store.py <檔案.segments.bin> [srt,vtt,md,txt]")
+        sys.exit(1)
+    source = sys.argv[1]
+    selected = sys.argv[2].split(",") if len(sys.argv) > 2 else ["srt", "vtt", "md"]
+    folder = os.path.dirname(source) or "."
+    stem = os.path.basename(source)[:-len(SEGMENTS_SUFFIX)] if source.endswith(SEGMENTS_SUFFIX) else os.path.basename(source)
+    if "txt" in selected:
+        with SegmentStore(source) as segment_store:
+            print(segment_store.full_text())
+    export_segments(source, folder, stem, formats=[fmt for fmt in selected if fmt != "txt"])
@@ -0,0 +1,123 @@
+# sentence_segmenter.py
+import re
+
+# 串流斷句：逐塊 (約 64K 字元) 讀入逐字稿文字、整塊以 regex 斷句後寫出，
+# 記憶體用量只與區塊大小有關 (不會複製整份逐字稿)，斷句與去除空白都在 regex 引擎中完成，不需逐句處理。
+#   中日文句末 (。．！？，以及接在中日文後的 .!?) 一律斷句，後面緊接的右引號 / 括號併入同一句
+#   英文句末 (.!?) 只在後面接空白或中日文字時斷句，小數 (3.14)、網址與常見縮寫 (Mr. / e.g. / U.S.) 不斷
+#   原有的換行也視為斷句
+# 沒有標點的長段落 (例如未加標點的中文逐字稿) 超過 max_line_chars 時在空白處 (沒有空白時直接) 折行。
+
+_CJK = r'　-〿぀-ヿ㐀-鿿가-힯豈-﫿＀-￯'
+_CLOSERS = r'」』”’）〉》】)\]"\''
+# 英文縮寫與單一大寫字母 (U.S.、J. K.) 後的句點不斷句
+_NOT_ABBREVIATION = ''.join(
+    rf'(?<!\b{abbr}\.)' for abbr in ("Mr", "Mrs", "Ms", "Dr", "Prof", "Sr", "Jr", "St", "vs", r"e\.g", r"i\.e", "[A-Z]")
+)
+# 以字元集合開頭，regex 引擎只會在句末標點處嘗試比對 (比逐一嘗試各個分支快數倍)
+_SENTENCE_END = (
+    rf'[。．！？.!?](?:'
+    rf'(?<=[。．！？])[。．！？]*[{_CLOSERS}]*'                          # 中日文句末
+    rf'|(?<=[{_CJK}][.!?])[.!?]*[{_CLOSERS}]*'                         # 中日文後面的半形句末標點，視同全形
+    rf'|(?<=[.!?]){_NOT_ABBREVIATION}[.!?]*[{_CLOSERS}]*(?=[\s{_CJK}])'  # 英文句末 (需看到下一個字元才能判斷)
+    r')'
+)
+_BOUNDARY = re.compile(rf'{_SENTENCE_END}|\n')
+# 斷句並吃掉句末之後的空白 (包含多餘的換行)，替換為句末 + 單一換行
+_BREAK = re.compile(rf'(?:({_SENTENCE_END})|\n)\s*')
+_TRAILING_SPACE = re.compile(r'[ \t\r\f\v]+\n')
+DEFAULT_MAX_LINE_CHARS = 2000
+_READ_CHARS = 1 << 16
+
+def _last_boundary(buffer):
+    """buffer 中最後一個「確定」的斷句位置 (結尾落在 buffer 最後的句末標點可能還有下一塊的右引號，不算)。"""
+    start = max(0, len(buffer) - 4096)
+    while True:
+        last = 0
+        for match in _BOUNDARY.finditer(buffer, start):
+            if match.end() < len(buffer):
+                last = match.end()
+        if last or start == 0:
+            return last
+        start = 0
+
+def _wrap_long(text, max_line_chars):
+    """將過長的句子在 max_line_chars 內最後一個空白處折行，返回 (完整的行, 剩下的文字)。"""
+    lines = []
+    while len(text) > max_line_chars:
+        cut = text.rfind(' ', 0, max_line_chars)
+        if cut <= 0:
+            cut = max_line_chars
+        lines.append(text[:cut].rstrip())
+        text = text[cut:].lstrip()
+    return lines, text
+
+def _format_block(text, long_line, max_line_chars):
+    """在每個句末後換行並去除每行前後的空白與空行；只有出現過長的行時才逐行折行。"""
+    text = _BREAK.sub('\\1\n', text).strip()
+    if ' \n' in text or '\t\n' in text:
+        text = _TRAILING_SPACE.sub('\n', text)
+    if long_line.search(text):
+        wrapped = []
+        for line in text.split('\n'):
+            lines, rest = _wrap_long(line, max_line_chars)
+            wrapped.extend(lines)
+            if rest:
+                wrapped.append(rest)
+        text = '\n'.join(wrapped)
+    return text
+
+def iter_blocks(chunks, max_line_chars=DEFAULT_MAX_LINE_CHARS):
+    """
+    將文字片段串流斷句，每次返回一個區塊 (多個句子，以換行分隔)。
+
+    參數:
+    chunks (iterable | str): 文字片段 (例如逐塊讀取的逐字稿)；傳入 str 時會切成固定大小的片段處理。
+    max_line_chars (int): 單行的長度上限，沒有標點的長段落會在此長度內折行。
+
+    返回:
+    generator: 非空的區塊文字，每行都已去除前後空白。
+    """
+    if isinstance(chunks, str):
+        text = chunks
+        chunks = (text[i:i + _READ_CHARS] for i in range(0, len(text), _READ_CHARS))
+    long_line = re.compile(rf'[^\n]{{{max_line_chars + 1}}}')
+    carry = ""
+    for chunk in chunks:
+        buffer = carry + chunk
+        cut = _last_boundary(buffer)
+        carry = buffer[cut:]
+        if cut:
+            block = _format_block(buffer[:cut], long_line, max_line_chars)
+            if block:
+                yield block
+        if len(carry) > max_line_chars:
+            # 沒有標點的長段落：先輸出已折好的行，只保留最後不完整的一行
+            lines, carry = _wrap_long(carry.lstrip(), max_line_chars)
+            # 只因開頭空白而超過長度時沒有完整的行可輸出，不能產生空區塊
+            if lines:
+                yield '\n'.join(lines)
+    # 最後一塊：剩下的文字 (包含結尾的句末標點) 直接輸出
+    block = _format_block(carry, long_line, max_line_chars)
+    if block:
+        yield block
+
+def iter_sentences(chunks, max_line_chars=DEFAULT_MAX_LINE_CHARS):
+    """逐句返回斷句結果 (參數同 iter_blocks)。"""
+    for block in iter_blocks(chunks, max_line_chars=max_line_chars):
+        yield from block.split('\n')
+
+def write_sentences(chunks, file_obj, max_line_chars=DEFAULT_MAX_LINE_CHARS):
+    """
+    將斷句結果逐塊寫入已開啟的文字檔 (每句一行，結尾不加換行)。
+
+    返回:
+    int: 寫入的字元數。
+    """
+    written = 0
+    for block in iter_blocks(chunks, max_line_chars=max_line_chars):
+        if written:
+            file_obj.write('\n')
+            written += 1
+        written += file_obj.write(block)
+    return written
@@ -1,9 +1,159 @@
 import os
-import whisper  # 官方 OpenAI Whisper 套件
-import torch    # PyTorch 用於檢查 CUDA 和設定 device
+import sys
+import wave
+import threading
 import traceback # 用於印出更詳細的錯誤訊息
+from collections import OrderedDict
+from contextlib import contextmanager
+import numpy as np
 
-def transcribe_audio_locally(audio_file_path, model_name="base", target_language=None):
+# whisper / torch 只在使用 openai-whisper 引擎時才匯入 (見 transcription_backends)
+from transcription_backends import SAMPLE_RATE, get_backend
+
+# ---------------------------------------------------------------------------
+# 行程內共用的 Whisper 模型池
+# ---------------------------------------------------------------------------
+# 以 (引擎, model_name, device, 計算精度) 為鍵，保存已載入但目前閒置的模型實例，
+# 讓重複的轉錄只需支付一次模型載入成本。
+# 同一個模型實例同時間只會借給一個呼叫者 (Whisper 在 transcribe 時會掛上 kv-cache hook，
+# 不能在多執行緒間共用)，併發時會額外載入新的實例。
+# 可透過環境變數調整上限：
+#   WHISPER_MODEL_POOL_SIZE      閒置模型實例的最大數量 (預設 2)
+#   WHISPER_MODEL_POOL_BUDGET_MB 所有已載入模型的記憶體預算 (MB，預設 0 代表不限制)
+_MODEL_POOL = OrderedDict()  # key -> list[model]，依最近使用順序排列 (最舊在前)
+_MODEL_SIZES_MB = {}         # id(model) -> 估計的記憶體用量 (MB)
+_MODEL_POOL_LOCK = threading.Lock()
+MODEL_POOL_MAX_IDLE = int(os.getenv("WHISPER_MODEL_POOL_SIZE", "2"))
+MODEL_POOL_BUDGET_MB = float(os.getenv("WHISPER_MODEL_POOL_BUDGET_MB", "0"))
+
+def _pool_memory_mb():
+    return sum(_MODEL_SIZES_MB.values())
+
+def _evict_idle_models(max_idle, budget_mb, incoming_mb=0.0):
+    """
+    依 LRU 順序移除閒置的模型實例，直到閒置數量不超過 max_idle，
+    且 (有設定預算時) 總記憶體加上即將載入的模型不超過 budget_mb。
+    呼叫前必須持有 _MODEL_POOL_LOCK。
+    """
+    def idle_count():
+        return sum(len(models) for models in _MODEL_POOL.values())
+
+    while _MODEL_POOL and (
+        idle_count() > max_idle
+        or (budget_mb > 0 and _pool_memory_mb() + incoming_mb > budget_mb)
+    ):
+        key, models = next(iter(_MODEL_POOL.items()))
+        evicted = models.pop(0)
+        if not models:
+            del _MODEL_POOL[key]
+        _MODEL_SIZES_MB.pop(id(evicted), None)
+        print(f"[Transcriber] 已從模型池釋放 Whisper 模型 '{key[1]}' ({key[0]}, {key[2]})。")
+        del evicted
+    # 只有 openai-whisper 引擎會載入 PyTorch；沒有載入時不需要 (也不應為此) 匯入
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+def _acquire_model(backend, model_name, device, compute_type):
+    key = (backend.name, model_name, device, compute_type)
+    with _MODEL_POOL_LOCK:
+        models = _MODEL_POOL.get(key)
+        if models:
+            model = models.pop()
+            if not models:
+                del _MODEL_POOL[key]
+            print(f"[Transcriber] 使用模型池中已載入的 Whisper 模型 '{model_name}'。")
+            return model
+        # 載入新模型前，先依記憶體預算騰出空間
+        incoming_mb = backend.estimate_size_mb(model_name, compute_type)
+        _evict_idle_models(MODEL_POOL_MAX_IDLE, MODEL_POOL_BUDGET_MB, incoming_mb=incoming_mb)
+
+    print(f"\n[Transcriber] 正在載入 Whisper 模型 '{model_name}' ({backend.name}, {compute_type})... (首次使用可能需要下載)")
+    model = backend.load_model(model_name, device, compute_type)
+    with _MODEL_POOL_LOCK:
+        _MODEL_SIZES_MB[id(model)] = backend.model_size_mb(model, model_name, compute_type)
+    print(f"[Transcriber] 模型 '{model_name}' 載入完成。")
+    return model
+
+def _release_model(model, backend, model_name, device, compute_type, keep_loaded=True):
+    key = (backend.name, model_name, device, compute_type)
+    with _MODEL_POOL_LOCK:
+        if not keep_loaded:
+            _MODEL_SIZES_MB.pop(id(model), None)
+            return
+        _MODEL_POOL.setdefault(key, []).append(model)
+        _MODEL_POOL.move_to_end(key)
+        _evict_idle_models(MODEL_POOL_MAX_IDLE, MODEL_POOL_BUDGET_MB)
+
+@contextmanager
+def pooled_whisper_model(model_name, device, compute_type=None, keep_loaded=True, backend=None):
+    """
+    從模型池借出一個 Whisper 模型，離開 with 區塊時歸還。
+    keep_loaded 為 False 時，用完後不放回模型池 (交由垃圾回收釋放)。
+    backend 為轉錄引擎名稱 (見 transcription_backends)，compute_type 未指定時使用引擎在該裝置上的預設精度。
+    """
+    engine = get_backend(backend)
+    compute_type = compute_type or engine.compute_type(device)
+    model = _acquire_model(engine, model_name, device, compute_type)
+    try:
+        yield model
+    finally:
+        _release_model(model, engine, model_name, device, compute_type, keep_loaded=keep_loaded)
+
+def _read_pcm16k_wav(audio_file_path):
+    """
+    若檔案是 16 kHz 單聲道 16-bit PCM WAV (download_audio 的 wav16k 格式)，
+    直接讀取成 Whisper 使用的 float32 陣列，省去再呼叫 ffmpeg 解碼；其他檔案返回 None。
+    """
+    if not audio_file_path.lower().endswith(".wav"):
+        return None
+    try:
+        with wave.open(audio_file_path, 'rb') as wav_file:
+            if (wav_file.getframerate() != SAMPLE_RATE
+                    or wav_file.getnchannels() != 1 or wav_file.getsampwidth() != 2):
+                return None
+            frames = wav_file.readframes(wav_file.getnframes())
+    except (wave.Error, EOFError, OSError):
+        return None
+    return np.frombuffer(frames, dtype=np.int16).astype(np.float32) / 32768.0
+
+def load_audio(audio_file_path, backend=None):
+    """
+    載入音訊為 16 kHz 單聲道 float32 陣列。16 kHz PCM WAV 直接讀取，其他格式交給轉錄引擎解碼。
+    """
+    samples = _read_pcm16k_wav(audio_file_path)
+    if samples is not None:
+        return samples
+    return get_backend(backend).load_audio(audio_file_path)
+
+def get_default_device(backend=None):
+    """返回轉錄引擎預設使用的裝置與是否使用 fp16 (各引擎自行偵測 GPU)。"""
+    device = get_backend(backend).default_device()
+    # fp16 (半精度浮點數) 在 GPU 上可以加速並減少 VRAM 使用，但在 CPU 上應為 False。
+    return device, device == "cuda"
+
+def preload_whisper_model(model_name="base", backend=None):
+    """
+    預先載入 Whisper 模型並放入模型池 (例如批次處理開始前先暖機)。
+    返回 True 代表模型已在模型池中。
+    """
+    try:
+        device, _ = get_default_device(backend)
+        with pooled_whisper_model(model_name, device, backend=backend):
+            pass
+        return True
+    except Exception as e:
+        print(f"[Transcriber] 預先載入 Whisper 模型 '{model_name}' 時發生錯誤：{e}")
+        return False
+
+def release_whisper_models():
+    """釋放模型池中所有閒置的 Whisper 模型。"""
+    with _MODEL_POOL_LOCK:
+        _evict_idle_models(0, 0)
+
+def transcribe_audio_locally(audio_file_path, model_name="base", target_language=None, keep_model_loaded=True,
+                             chunked=False, chunk_seconds=600, chunk_overlap_seconds=5, num_workers=None,
+                             return_segments=False, backend=None, vad=False, on_progress=None):
     """
     使用本地執行的 Whisper 模型將音訊檔案轉錄為文字。
 
@@ -13,43 +163,79 @@ def transcribe_audio_locally(audio_file_path, model_name="base", target_language
                        (e.g., "tiny", "base", "small", "medium", "large").
     target_language (str, optional): 音訊的語言代碼 (例如 "zh" 代表中文, "en" 代表英文)。
                                      如果為 None，Whisper 會自動偵測。
+    keep_model_loaded (bool): 轉錄完成後是否將模型保留在模型池中，供之後的呼叫重複使用。
+    chunked (bool): 是否啟用分段平行轉錄 (適合只有 CPU 的機器處理長音訊)。
+    chunk_seconds (float): 分段模式下每個片段的目標長度 (秒)。
+    chunk_overlap_seconds (float): 分段模式下相鄰片段的重疊長度 (秒)。
+    num_workers (int, optional): 分段模式下平行 worker 行程數量，預設依 CPU 核心數決定。
+    return_segments (bool): 為 True 時返回包含段落時間戳記的字典，而不只是文字。
+    backend (str, optional): 轉錄引擎，"openai-whisper" (預設) 或 "faster-whisper" (CPU 上使用 int8 量化)。
+                             未指定時使用環境變數 WHISPER_BACKEND。
+    vad (bool): 是否先以語音活動偵測 (見 vad.py) 略過靜音與音樂，只轉錄語音區段；時間戳記會換回原始時間軸。
+    on_progress (callable, optional): 轉錄過程中呼叫 on_progress(已處理秒數, 總秒數) 回報進度
+                                      (啟用 vad 時以去除靜音後的長度計算)。
 
     返回:
     str: 辨識後的逐字稿文字，如果失敗則返回 None。
+    return_segments=True 時返回 dict：{"text", "language", "segments": [{"start", "end", "text",
+    "avg_logprob", "no_speech_prob"}, ...]}，各段落文字相接即為完整逐字稿。
+    啟用 vad 時另含 "vad": {"audio_seconds", "speech_seconds", "skipped_seconds", "speech_regions"}。
     """
     if not os.path.exists(audio_file_path):
         print(f"錯誤 (transcriber)：找不到音訊檔案 {audio_file_path}")
         return None
 
-    print(f"\n[Transcriber] 正在載入 Whisper 模型 '{model_name}'... (首次使用可能需要下載)")
     try:
-        # 檢查是否有可用的 GPU (PyTorch 方式)
-        device = "cuda" if torch.cuda.is_available() else "cpu"
-        print(f"[Transcriber] Whisper 將使用 '{device}' 執行。")
-        
-        # fp16 (半精度浮點數) 在 GPU 上可以加速並減少 VRAM 使用，但在 CPU 上應為 False。
-        use_fp16 = (device == "cuda") 
+        # 檢查是否有可用的 GPU (由轉錄引擎偵測)
+        engine = get_backend(backend)
+        device, _ = get_default_device(engine.name)
+        compute_type = engine.compute_type(device)
+        print(f"[Transcriber] Whisper 將使用 '{device}' 執行 (引擎：{engine.name}，精度：{compute_type})。")
 
-        model = whisper.load_model(model_name, device=device)
-        print(f"[Transcriber] 模型 '{model_name}' 載入完成。")
-        print(f"[Transcriber] 開始轉錄音訊檔案：'{os.path.basename(audio_file_path)}'...")
-        
-        transcribe_options = {"fp16": use_fp16}
         if target_language:
-            transcribe_options["language"] = target_language
             print(f"[Transcriber] 指定語言進行轉錄：{target_language}")
         else:
             print(f"[Transcriber] 將自動偵測語言。")
 
-        # 執行轉錄
-        # verbose=None 會使用預設的詳細程度，verbose=True 會印出更多進度
-        result = model.transcribe(audio_file_path, verbose=None, **transcribe_options)
-        
-        transcript_text = result["text"]
-        detected_language = result.get("language", "未知") # .get() 避免如果 'language' 鍵不存在時出錯
+        if chunked:
+            from chunked_transcriber import transcribe_in_chunks
+            result = transcribe_in_chunks(
+                audio_file_path,
+                model_name=model_name,
+                target_language=target_language,
+                chunk_seconds=chunk_seconds,
+                overlap_seconds=chunk_overlap_seconds,
+                num_workers=num_workers,
+                device=device,
+                backend=engine.name,
+                vad=vad,
+                on_progress=on_progress
+            )
+            print(f"[Transcriber] 分段轉錄完成！偵測到的語言：{result.get('language') or '未知'}")
+            return result if return_segments else result["text"]
+
+        with pooled_whisper_model(model_name, device, compute_type, keep_loaded=keep_model_loaded,
+                                  backend=engine.name) as model:
+            print(f"[Transcriber] 開始轉錄音訊檔案：'{os.path.basename(audio_file_path)}'...")
+            timeline = None
+            if vad:
+                from vad import apply_vad
+                audio_input, timeline = apply_vad(load_audio(audio_file_path, engine.name))
+            else:
+                # 16 kHz PCM WAV 直接以陣列傳入；其他格式 (mp3 / m4a / opus / flac) 由引擎呼叫 ffmpeg 解碼一次
+                audio_input = _read_pcm16k_wav(audio_file_path)
+                if audio_input is None:
+                    audio_input = audio_file_path
+            result = engine.transcribe(model, audio_input, language=target_language, compute_type=compute_type,
+                                       on_progress=on_progress)
+            if timeline is not None:
+                from vad import remap_segments
+                remap_segments(result["segments"], timeline)
+                result["vad"] = timeline.stats()
+
+        detected_language = result.get("language") or "未知"
         print(f"[Transcriber] 轉錄完成！偵測到的語言：{detected_language}")
-        
-        return transcript_text
+        return result if return_segments else result["text"]
 
     except ModuleNotFoundError as e:
         if 'torch' in str(e).lower():
@@ -0,0 +1,361 @@
+# transcript_cache.py
+import os
+import sys
+import json
+import time
+import hashlib
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl  # POSIX 的檔案鎖
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# 快取預設放在 downloads/.cache 底下：
+#   index.json        索引 (影片 ID → 音訊雜湊、各項快取條目)
+#   index.json.lock   寫入索引時的檔案鎖 (job_server 與批次模式可能在不同行程中共用同一個快取)
+#   stats.log         命中統計，每次查詢附加一行 (查詢不會重寫索引)
+#   transcripts/*.json  逐字稿快取，鍵為 (音訊內容雜湊, 模型名稱, 語言, 轉錄選項)
+#   llm/*.md            LLM 輸出快取，鍵為 (提示詞, 模型名稱) 的雜湊 (提示詞已包含逐字稿)
+# 快取檔案的修改時間即為最後使用時間 (命中時更新)，供 LRU 淘汰使用。
+DEFAULT_CACHE_DIR = os.path.join("downloads", ".cache")
+DEFAULT_MAX_CACHE_MB = float(os.getenv("TRANSCRIPT_CACHE_MAX_MB", "1024"))
+
+_INDEX_LOCK = threading.Lock()
+
+def _sha256_text(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def hash_file(file_path, block_size=1024 * 1024):
+    """計算檔案內容的 SHA-256 雜湊。"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _empty_index():
+    return {
+        "videos": {},
+        "entries": {},
+        "stats": {
+            "transcript": {"hits": 0, "misses": 0},
+            "llm": {"hits": 0, "misses": 0},
+        },
+    }
+
+def _index_path(cache_dir):
+    return os.path.join(cache_dir, "index.json")
+
+def _load_index(cache_dir):
+    try:
+        with open(_index_path(cache_dir), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return _empty_index()
+
+def _save_index(cache_dir, index):
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{_index_path(cache_dir)}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, _index_path(cache_dir))
+
+def _lock_file(lock_file):
+    if fcntl is not None:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+    else:
+        lock_file.seek(0)
+        msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+
+def _unlock_file(lock_file):
+    if fcntl is not None:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+    else:
+        lock_file.seek(0)
+        msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+@contextmanager
+def _locked_index(cache_dir):
+    """
+    讀取 → 修改 → 寫回索引期間持有的鎖，yield 最新的索引 (修改後由呼叫端以 _save_index 寫回)。
+    同一行程的執行緒以 _INDEX_LOCK 互斥，不同行程以 index.json.lock 的檔案鎖互斥。
+    只讀取索引時不需要鎖 (_save_index 以改名的方式整個取代索引檔)。
+    """
+    with _INDEX_LOCK:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(_index_path(cache_dir) + ".lock", 'a+b') as lock_file:
+            _lock_file(lock_file)
+            try:
+                yield _load_index(cache_dir)
+            finally:
+                _unlock_file(lock_file)
+
+def _record(cache_dir, kind, hit, entry_path=None):
+    """
+    記錄一次查詢：附加一行到 stats.log (不重寫索引)；命中時更新快取檔案的修改時間，作為 LRU 的最後使用時間。
+    """
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # 以附加模式一次寫入一整行，多個行程同時寫入也不會交錯
+        with open(os.path.join(cache_dir, "stats.log"), 'a', encoding='utf-8') as f:
+            f.write(f"{kind} {'hit' if hit else 'miss'}\n")
+        if hit and entry_path:
+            os.utime(entry_path)
+    except OSError:
+        pass
+
+def _last_used(entry):
+    """條目的最後使用時間：快取檔案的修改時間 (命中時更新)，檔案不存在時為 0 (最先淘汰)。"""
+    try:
+        return max(entry.get("last_used", 0), os.path.getmtime(entry["path"]))
+    except OSError:
+        return 0
+
+def _transcript_key(audio_hash, model_name, language, options):
+    options_json = json.dumps(options or {}, sort_keys=True)
+    return "t-" + _sha256_text(f"{audio_hash}|{model_name}|{language or 'auto'}|{options_json}")
+
+def _audio_hash(audio_path, video_record=None):
+    """
+    取得音訊檔案的雜湊；若檔案大小與修改時間和索引中記錄的一致，直接沿用已記錄的雜湊，
+    避免每次都重新讀取整個 MP3。
+    """
+    stat = os.stat(audio_path)
+    if (video_record and video_record.get("audio_path") == audio_path
+            and video_record.get("audio_size") == stat.st_size
+            and video_record.get("audio_mtime") == stat.st_mtime):
+        return video_record["audio_hash"]
+    return hash_file(audio_path)
+
+def _read_transcript_entry(cache_dir, key):
+    path = os.path.join(cache_dir, "transcripts", f"{key}.json")
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def lookup_transcript_by_video(video_id, model_name, language=None, options=None, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    以 YouTube 影片 ID 查詢逐字稿快取 (命中時可跳過下載與轉錄)。
+    若當初下載的音訊檔仍存在，會確認其內容雜湊與快取記錄一致。
+
+    返回:
+    dict: {"text", "segments", "language", "audio_path", ...}；未命中時返回 None。
+          舊版快取條目沒有 "segments"。
+    """
+    if not video_id:
+        return None
+    index = _load_index(cache_dir)
+    video_record = index["videos"].get(video_id)
+    entry = None
+    key = None
+    if video_record:
+        key = _transcript_key(video_record["audio_hash"], model_name, language, options)
+        if key in index["entries"]:
+            audio_path = video_record.get("audio_path")
+            if audio_path and os.path.exists(audio_path) and _audio_hash(audio_path, video_record) != video_record["audio_hash"]:
+                print(f"[Cache] 音訊檔 '{audio_path}' 內容已變更，忽略舊的逐字稿快取。")
+            else:
+                entry = _read_transcript_entry(cache_dir, key)
+    _record(cache_dir, "transcript", entry is not None,
+            entry_path=index["entries"][key]["path"] if entry is not None else None)
+    if entry:
+        print(f"[Cache] 命中逐字稿快取 (影片 ID: {video_id}，模型: {model_name})，跳過下載與轉錄。")
+    return entry
+
+def lookup_transcript_by_audio(audio_path, model_name, language=None, options=None, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    以音訊內容雜湊查詢逐字稿快取 (命中時可跳過轉錄)。
+
+    返回:
+    dict | None: 與 lookup_transcript_by_video 相同。
+    """
+    if not audio_path or not os.path.exists(audio_path):
+        return None
+    key = _transcript_key(hash_file(audio_path), model_name, language, options)
+    index = _load_index(cache_dir)
+    entry = _read_transcript_entry(cache_dir, key) if key in index["entries"] else None
+    _record(cache_dir, "transcript", entry is not None,
+            entry_path=index["entries"][key]["path"] if entry is not None else None)
+    if entry:
+        print(f"[Cache] 命中逐字稿快取 (音訊內容相同，模型: {model_name})，跳過轉錄。")
+    return entry
+
+def store_transcript(video_id, audio_path, model_name, transcript_text, language=None, options=None,
+                     detected_language=None, cache_dir=DEFAULT_CACHE_DIR, segments=None):
+    """
+    將逐字稿寫入快取，並記錄影片 ID 與音訊雜湊的對應。
+    segments (list, optional) 為含時間戳記的段落，會一併存入，命中時可直接重建字幕。
+    返回快取鍵，失敗時返回 None。
+    """
+    if not transcript_text or not audio_path or not os.path.exists(audio_path):
+        return None
+    try:
+        stat = os.stat(audio_path)
+        audio_hash = hash_file(audio_path)
+        key = _transcript_key(audio_hash, model_name, language, options)
+        entry = {
+            "text": transcript_text,
+            "segments": segments,
+            "language": detected_language or language,
+            "model_name": model_name,
+            "requested_language": language,
+            "options": options or {},
+            "video_id": video_id,
+            "audio_path": audio_path,
+            "audio_hash": audio_hash,
+            "created": time.time(),
+        }
+        transcripts_dir = os.path.join(cache_dir, "transcripts")
+        os.makedirs(transcripts_dir, exist_ok=True)
+        entry_path = os.path.join(transcripts_dir, f"{key}.json")
+        tmp_path = f"{entry_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, entry_path)
+
+        with _locked_index(cache_dir) as index:
+            if video_id:
+                index["videos"][video_id] = {
+                    "audio_hash": audio_hash,
+                    "audio_path": audio_path,
+                    "audio_size": stat.st_size,
+                    "audio_mtime": stat.st_mtime,
+                }
+            index["entries"][key] = {
+                "kind": "transcript",
+                "path": entry_path,
+                "size": os.path.getsize(entry_path),
+                "last_used": time.time(),
+            }
+            _save_index(cache_dir, index)
+        evict_cache(cache_dir=cache_dir)
+        return key
+    except OSError as e:
+        print(f"[Cache] 寫入逐字稿快取時發生錯誤：{e}")
+        return None
+
+def llm_cache_key(prompt, model_name):
+    """LLM 快取鍵：由完整提示詞 (包含逐字稿) 與模型名稱決定。"""
+    return "l-" + _sha256_text(f"{model_name}|{prompt}")
+
+def lookup_llm_output(key, cache_dir=DEFAULT_CACHE_DIR):
+    """查詢 LLM 輸出快取，命中時返回先前的輸出文字，否則返回 None。"""
+    index = _load_index(cache_dir)
+    content = None
+    if key in index["entries"]:
+        try:
+            with open(index["entries"][key]["path"], 'r', encoding='utf-8') as f:
+                content = f.read()
+        except OSError:
+            content = None
+    _record(cache_dir, "llm", content is not None,
+            entry_path=index["entries"][key]["path"] if content is not None else None)
+    if content:
+        print("[Cache] 命中 LLM 輸出快取，跳過 Gemini 請求。")
+    return content
+
+def store_llm_output(key, content, cache_dir=DEFAULT_CACHE_DIR):
+    """將 LLM 輸出寫入快取。"""
+    if not content:
+        return None
+    try:
+        llm_dir = os.path.join(cache_dir, "llm")
+        os.makedirs(llm_dir, exist_ok=True)
+        entry_path = os.path.join(llm_dir, f"{key}.md")
+        tmp_path = f"{entry_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(tmp_path, entry_path)
+        with _locked_index(cache_dir) as index:
+            index["entries"][key] = {
+                "kind": "llm",
+                "path": entry_path,
+                "size": os.path.getsize(entry_path),
+                "last_used": time.time(),
+            }
+            _save_index(cache_dir, index)
+        evict_cache(cache_dir=cache_dir)
+        return key
+    except OSError as e:
+        print(f"[Cache] 寫入 LLM 輸出快取時發生錯誤：{e}")
+        return None
+
+def evict_cache(max_mb=None, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    依最後使用時間 (LRU) 淘汰快取條目，直到總大小不超過 max_mb。
+    返回被淘汰的條目數量。
+    """
+    max_bytes = (DEFAULT_MAX_CACHE_MB if max_mb is None else max_mb) * 1024 * 1024
+    removed = 0
+    with _locked_index(cache_dir) as index:
+        total = sum(entry["size"] for entry in index["entries"].values())
+        if total <= max_bytes:
+            return 0
+        for key, entry in sorted(index["entries"].items(), key=lambda item: _last_used(item[1])):
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(entry["path"])
+            except OSError:
+                pass
+            total -= entry["size"]
+            del index["entries"][key]
+            removed += 1
+        _save_index(cache_dir, index)
+    if removed:
+        print(f"[Cache] 已淘汰 {removed} 個快取條目 (上限 {max_bytes / (1024 * 1024):.0f} MB)。")
+    return removed
+
+def get_cache_stats(cache_dir=DEFAULT_CACHE_DIR):
+    """返回快取統計資料：各類條目數量、大小與命中率。"""
+    index = _load_index(cache_dir)
+    # 舊版記錄在索引中的統計加上 stats.log 中的查詢紀錄
+    counts = {(kind, result): index["stats"][kind][field]
+              for kind in ("transcript", "llm") for result, field in (("hit", "hits"), ("miss", "misses"))}
+    try:
+        with open(os.path.join(cache_dir, "stats.log"), 'r', encoding='utf-8') as f:
+            for line in f:
+                fields = tuple(line.split())
+                if fields in counts:
+                    counts[fields] += 1
+    except OSError:
+        pass
+    stats = {}
+    for kind in ("transcript", "llm"):
+        entries = [e for e in index["entries"].values() if e["kind"] == kind]
+        hits = counts[(kind, "hit")]
+        misses = counts[(kind, "miss")]
+        lookups = hits + misses
+        stats[kind] = {
+            "entries": len(entries),
+            "size_bytes": sum(e["size"] for e in entries),
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+        }
+    stats["videos"] = len(index["videos"])
+    return stats
+
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else "stats"
+    if command == "stats":
+        cache_stats = get_cache_stats()
+        print(f"--- 快取統計 ({DEFAULT_CACHE_DIR}) ---")
+        print(f"已記錄的影片數：{cache_stats['videos']}")
+        for kind, label in (("transcript", "逐字稿"), ("llm", "LLM 輸出")):
+            s = cache_stats[kind]
+            print(f"{label}：{s['entries']} 筆，{s['size_bytes'] / 1024:.1f} KB，"
+                  f"命中 {s['hits']} / 查詢 {s['hits'] + s['misses']} (命中率 {s['hit_rate']:.1%})")
+    elif command == "evict":
+        limit_mb = float(sys.argv[2]) if len(sys.argv) > 2 else None
+        evict_cache(max_mb=limit_mb)
+    elif command == "clear":
+        evict_cache(max_mb=0)
+        print("[Cache] 已清除所有快取條目。")
+    else:
+        print("用法：python transcript_cache.py [stats | evict [上限MB] | clear]")
@@ -0,0 +1,194 @@
+# transcription_backends.py
+import os
+import types
+import threading
+from contextlib import contextmanager
+
+# 可用的轉錄引擎 (transcribe_audio_locally 的 backend 參數)：
+#   openai-whisper   官方 Whisper (PyTorch)，預設；GPU 上使用 fp16
+#   faster-whisper   以 CTranslate2 執行的 Whisper，CPU 上使用 int8 量化推論，通常比 PyTorch 快數倍
+# 兩者都返回相同格式的結果：
+#   {"text", "language", "segments": [{"start", "end", "text", "avg_logprob", "no_speech_prob"[, "words"]}]}
+# transcribe() 的 on_progress(已處理秒數, 音訊總秒數) 在解碼過程中回報進度 (見 transcription_worker.py)。
+# 各引擎的套件 (whisper / torch、faster_whisper / ctranslate2) 只在使用該引擎時才匯入，
+# 使用 faster-whisper 時不需要安裝或載入 PyTorch。
+# 可透過環境變數設定：
+#   WHISPER_BACKEND               預設使用的引擎 (預設 openai-whisper)
+#   FASTER_WHISPER_COMPUTE_TYPE   faster-whisper 的計算精度 (預設 CPU 為 int8、GPU 為 float16)
+DEFAULT_BACKEND = os.getenv("WHISPER_BACKEND", "openai-whisper")
+
+SAMPLE_RATE = 16000  # Whisper 固定使用 16 kHz 單聲道
+
+# 載入前用來預估記憶體需求的大約數值 (fp32 權重，MB)
+APPROX_MODEL_SIZE_MB = {"tiny": 150, "base": 290, "small": 930, "medium": 2950, "large": 5900, "turbo": 3100}
+
+def approx_model_size_mb(model_name):
+    return APPROX_MODEL_SIZE_MB.get(model_name.split('.')[0].split('-')[0], 0.0)
+
+_WHISPER_PROGRESS_LOCK = threading.Lock()
+
+@contextmanager
+def _whisper_progress(on_progress):
+    """
+    openai-whisper 的 transcribe() 只以 tqdm 進度列顯示進度 (verbose=False 時)，沒有回呼介面；
+    這裡暫時以只轉發進度的物件取代 whisper.transcribe 模組中的 tqdm，每解碼完一個 30 秒視窗回報一次。
+    進度列是模組層級的狀態，同一時間只允許一個轉錄使用。
+    """
+    import whisper
+    import whisper.transcribe as whisper_transcribe
+    if not on_progress or not hasattr(whisper_transcribe, "tqdm"):
+        yield
+        return
+    frame_seconds = whisper.audio.HOP_LENGTH / whisper.audio.SAMPLE_RATE
+
+    class _ProgressBar:
+        def __init__(self, total=None, **kwargs):
+            self.total = total or 0
+            self.n = 0
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc_info):
+            return False
+
+        def update(self, n=1):
+            self.n += n
+            on_progress(self.n * frame_seconds, self.total * frame_seconds)
+
+    with _WHISPER_PROGRESS_LOCK:
+        original = whisper_transcribe.tqdm
+        whisper_transcribe.tqdm = types.SimpleNamespace(tqdm=_ProgressBar)
+        try:
+            yield
+        finally:
+            whisper_transcribe.tqdm = original
+
+class OpenAIWhisperBackend:
+    """官方 openai-whisper (PyTorch) 引擎。"""
+    name = "openai-whisper"
+
+    def default_device(self):
+        import torch
+        return "cuda" if torch.cuda.is_available() else "cpu"
+
+    def compute_type(self, device):
+        # fp16 (半精度浮點數) 在 GPU 上可以加速並減少 VRAM 使用，但在 CPU 上應為 False。
+        return "float16" if device == "cuda" else "float32"
+
+    def set_cpu_threads(self, num_threads):
+        import torch
+        torch.set_num_threads(num_threads)
+
+    def load_audio(self, audio_file_path):
+        """以 ffmpeg 解碼為 16 kHz 單聲道 float32 陣列。"""
+        import whisper
+        return whisper.load_audio(audio_file_path)
+
+    def load_model(self, model_name, device, compute_type, cpu_threads=0):
+        import whisper
+        return whisper.load_model(model_name, device=device)
+
+    def estimate_size_mb(self, model_name, compute_type):
+        """載入前預估模型的記憶體用量 (MB)。"""
+        return approx_model_size_mb(model_name) * (0.5 if compute_type == "float16" else 1.0)
+
+    def model_size_mb(self, model, model_name, compute_type):
+        """估計已載入模型權重佔用的記憶體大小 (MB)。"""
+        try:
+            total_bytes = sum(p.numel() * p.element_size() for p in model.parameters())
+            total_bytes += sum(b.numel() * b.element_size() for b in model.buffers())
+            return total_bytes / (1024 * 1024)
+        except Exception:
+            return self.estimate_size_mb(model_name, compute_type)
+
+    def transcribe(self, model, audio, language=None, compute_type="float32", word_timestamps=False, on_progress=None):
+        options = {"fp16": compute_type == "float16", "word_timestamps": word_timestamps}
+        if language:
+            options["language"] = language
+        if on_progress:
+            with _whisper_progress(on_progress):
+                result = model.transcribe(audio, verbose=False, **options)
+        else:
+            result = model.transcribe(audio, verbose=None, **options)
+        segments = []
+        for seg in result.get("segments", []):
+            segment = {
+                "start": seg["start"],
+                "end": seg["end"],
+                "text": seg["text"],
+                "avg_logprob": seg.get("avg_logprob"),
+                "no_speech_prob": seg.get("no_speech_prob"),
+            }
+            if word_timestamps:
+                segment["words"] = [
+                    {"word": w["word"], "start": w["start"], "end": w["end"]} for w in seg.get("words", [])
+                ]
+            segments.append(segment)
+        return {"text": result["text"], "language": result.get("language"), "segments": segments}
+
+class FasterWhisperBackend:
+    """faster-whisper (CTranslate2) 引擎，CPU 上預設以 int8 量化推論。"""
+    name = "faster-whisper"
+    # 與 openai-whisper 的 transcribe() 預設相同使用 greedy decoding，比較 RTF 時只反映引擎差異
+    beam_size = 1
+
+    def default_device(self):
+        import ctranslate2
+        return "cuda" if ctranslate2.get_cuda_device_count() > 0 else "cpu"
+
+    def compute_type(self, device):
+        return os.getenv("FASTER_WHISPER_COMPUTE_TYPE") or ("float16" if device == "cuda" else "int8")
+
+    def set_cpu_threads(self, num_threads):
+        pass  # 執行緒數量在 load_model 時以 cpu_threads 設定
+
+    def load_audio(self, audio_file_path):
+        """以 PyAV 解碼為 16 kHz 單聲道 float32 陣列 (不需要 PyTorch)。"""
+        from faster_whisper.audio import decode_audio
+        return decode_audio(audio_file_path, sampling_rate=SAMPLE_RATE)
+
+    def load_model(self, model_name, device, compute_type, cpu_threads=0):
+        from faster_whisper import WhisperModel
+        return WhisperModel(model_name, device=device, compute_type=compute_type, cpu_threads=cpu_threads or 0)
+
+    def estimate_size_mb(self, model_name, compute_type):
+        """依精度由 fp32 的大小推估 (MB)。"""
+        ratio = {"int8": 0.25, "int8_float16": 0.25, "int8_float32": 0.25, "float16": 0.5}.get(compute_type, 1.0)
+        return approx_model_size_mb(model_name) * ratio
+
+    def model_size_mb(self, model, model_name, compute_type):
+        # CTranslate2 的權重不在 Python 端，無法直接量測
+        return self.estimate_size_mb(model_name, compute_type)
+
+    def transcribe(self, model, audio, language=None, compute_type="int8", word_timestamps=False, on_progress=None):
+        segment_iter, info = model.transcribe(
+            audio, language=language, beam_size=self.beam_size, word_timestamps=word_timestamps
+        )
+        segments = []
+        for seg in segment_iter:  # 產生器：迭代時才實際進行解碼
+            segment = {
+                "start": seg.start,
+                "end": seg.end,
+                "text": seg.text,
+                "avg_logprob": seg.avg_logprob,
+                "no_speech_prob": seg.no_speech_prob,
+            }
+            if word_timestamps:
+                segment["words"] = [{"word": w.word, "start": w.start, "end": w.end} for w in (seg.words or [])]
+            segments.append(segment)
+            if on_progress:
+                on_progress(seg.end, getattr(info, "duration_after_vad", None) or info.duration)
+        return {"text": "".join(seg["text"] for seg in segments), "language": info.language, "segments": segments}
+
+BACKENDS = {
+    OpenAIWhisperBackend.name: OpenAIWhisperBackend(),
+    FasterWhisperBackend.name: FasterWhisperBackend(),
+}
+
+def get_backend(name=None):
+    """依名稱取得轉錄引擎，未指定時使用 DEFAULT_BACKEND。"""
+    name = name or DEFAULT_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"未知的轉錄引擎 '{name}'，可用引擎：{', '.join(BACKENDS)}")
+    return BACKENDS[name]
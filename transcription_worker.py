@@ -0,0 +1,277 @@
+# transcription_worker.py
+import os
+import time
+import signal
+import multiprocessing
+
+try:
+    import psutil  # 選用套件：有安裝時用來量測記憶體 (跨平台)；否則讀取 Linux 的 /proc
+except ImportError:
+    psutil = None
+
+# 在受監控的子行程中執行轉錄：large 模型處理長音訊時記憶體不足 (或被 OOM killer 終止) 只會結束子行程，
+# 不會拖垮整個流程；子行程透過 pipe 即時回報進度 (已處理的百分比與預估剩餘時間)。
+# 子行程因記憶體超過上限被終止時，自動改用較小的模型重試，最小的模型仍不足時改用分段模式 (單一 worker)。
+# 可透過環境變數設定：
+#   WHISPER_WORKER              1 時 main.py 以子行程轉錄 (batch_runner.py 可用 --isolated) (預設 0)
+#   WHISPER_WORKER_MAX_RSS_MB   子行程 (含其子行程) 的常駐記憶體上限 (MB)，超過時終止並重試 (預設 0，不限制)
+#   WHISPER_WORKER_TIMEOUT      單次嘗試的逾時秒數 (預設 0，不限制)；逾時不會重試
+#   WHISPER_WORKER_RETRIES      因記憶體不足被終止後最多重試幾次 (預設 2)
+WHISPER_WORKER = os.getenv("WHISPER_WORKER", "0") == "1"
+WHISPER_WORKER_MAX_RSS_MB = float(os.getenv("WHISPER_WORKER_MAX_RSS_MB", "0"))
+WHISPER_WORKER_TIMEOUT = float(os.getenv("WHISPER_WORKER_TIMEOUT", "0"))
+WHISPER_WORKER_RETRIES = int(os.getenv("WHISPER_WORKER_RETRIES", "2"))
+
+# 由大到小的模型順序 (記憶體不足時往下一級重試)
+MODEL_FALLBACK_ORDER = ("large", "medium", "small", "base", "tiny")
+_POLL_SECONDS = 0.5          # 監控記憶體與逾時的間隔
+_PROGRESS_SEND_SECONDS = 0.5 # 子行程送出進度訊息的最短間隔
+_PROGRESS_PRINT_SECONDS = 10 # 終端機顯示進度的最短間隔
+
+def _worker_main(conn, options):
+    """子行程：執行 transcribe_audio_locally，並透過 conn 送出 ("progress", 已處理秒數, 總秒數) 與最終結果。"""
+    from transcriber import transcribe_audio_locally
+    last_sent = 0.0
+
+    def on_progress(done_seconds, total_seconds):
+        nonlocal last_sent
+        now = time.monotonic()
+        if now - last_sent >= _PROGRESS_SEND_SECONDS or done_seconds >= total_seconds:
+            last_sent = now
+            conn.send(("progress", done_seconds, total_seconds))
+
+    try:
+        result = transcribe_audio_locally(keep_model_loaded=False, return_segments=True, on_progress=on_progress,
+                                          **options)
+        conn.send(("result", result))
+    except Exception as e:
+        conn.send(("error", str(e)))
+    finally:
+        conn.close()
+
+def _children_pids(pid):
+    """返回 pid 的所有子孫行程 (分段模式的 worker 行程、ffmpeg 等)。"""
+    if psutil is not None:
+        try:
+            return [child.pid for child in psutil.Process(pid).children(recursive=True)]
+        except psutil.Error:
+            return []
+    found = []
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            tasks = os.listdir(f"/proc/{current}/task")
+        except OSError:
+            continue
+        for task in tasks:
+            try:
+                with open(f"/proc/{current}/task/{task}/children", 'r') as f:
+                    children = [int(p) for p in f.read().split()]
+            except OSError:
+                continue
+            found.extend(children)
+            pending.extend(children)
+    return found
+
+def _rss_mb(pid):
+    if psutil is not None:
+        try:
+            return psutil.Process(pid).memory_info().rss / (1024 * 1024)
+        except psutil.Error:
+            return 0.0
+    try:
+        with open(f"/proc/{pid}/status", 'r') as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+def process_tree_rss_mb(pid):
+    """子行程與其所有子孫行程的常駐記憶體總和 (MB)；無法量測 (非 Linux 且未安裝 psutil) 時返回 None。"""
+    if psutil is None and not os.path.isdir(f"/proc/{pid}"):
+        return None
+    return sum(_rss_mb(p) for p in [pid] + _children_pids(pid))
+
+def _kill_tree(process):
+    """終止子行程及其子孫行程 (先終止子孫，避免分段模式的 worker 變成孤兒行程)。"""
+    if hasattr(signal, "SIGKILL"):
+        for pid in _children_pids(process.pid):
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except OSError:
+                pass
+    process.kill()
+
+def _format_seconds(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes} 分 {seconds} 秒" if minutes else f"{seconds} 秒"
+
+class _ProgressTracker:
+    """由子行程回報的已處理秒數計算百分比與預估剩餘時間 (以第一次回報後的處理速度估計，不含模型載入時間)。"""
+
+    def __init__(self, label, on_progress=None):
+        self.label = label
+        self.on_progress = on_progress
+        self.first = None
+        self.last_print = 0.0
+
+    def update(self, done_seconds, total_seconds):
+        now = time.monotonic()
+        if self.first is None:
+            self.first = (now, done_seconds)
+        eta = None
+        first_time, first_done = self.first
+        if done_seconds > first_done and now > first_time:
+            rate = (done_seconds - first_done) / (now - first_time)
+            eta = max(0.0, total_seconds - done_seconds) / rate
+        percent = min(1.0, done_seconds / total_seconds) if total_seconds else 0.0
+        info = {"model": self.label, "seconds_done": round(done_seconds, 1), "audio_seconds": round(total_seconds, 1),
+                "percent": round(percent * 100, 1), "eta_seconds": round(eta, 1) if eta is not None else None}
+        if self.on_progress:
+            self.on_progress(info)
+        if now - self.last_print >= _PROGRESS_PRINT_SECONDS or percent >= 1.0:
+            self.last_print = now
+            eta_text = f"，預估剩餘 {_format_seconds(eta)}" if eta is not None else ""
+            print(f"[Transcriber Worker] {self.label}：{percent:.1%} "
+                  f"({done_seconds:.0f} / {total_seconds:.0f} 秒){eta_text}")
+
+def _run_attempt(options, max_rss_mb, timeout, on_progress, target=_worker_main):
+    """
+    以一個子行程執行一次轉錄。
+
+    參數:
+    target (callable): 子行程執行的函數 target(conn, options)，訊息格式與 _worker_main 相同 (基準測試以假的 worker 取代)。
+
+    返回:
+    tuple: (狀態, 結果, 記憶體峰值 MB)。狀態為 ok / memory (超過上限或被系統以 SIGKILL 終止) / timeout / failed。
+    """
+    context = multiprocessing.get_context("spawn")  # 與 chunked_transcriber 相同，避免 fork 已載入 PyTorch 的行程
+    parent_conn, child_conn = context.Pipe(duplex=False)
+    # 不設為 daemon：分段模式需要在子行程中再建立 worker 行程
+    process = context.Process(target=target, args=(child_conn, options), name="transcription-worker")
+    process.start()
+    child_conn.close()
+
+    label = f"{options['model_name']}{' (分段)' if options.get('chunked') else ''}"
+    tracker = _ProgressTracker(label, on_progress)
+    started = time.monotonic()
+    peak_mb = 0.0
+    status = None
+    result = None
+    try:
+        while status is None:
+            if parent_conn.poll(_POLL_SECONDS):
+                try:
+                    message = parent_conn.recv()
+                except EOFError:
+                    break  # 子行程已結束但沒有送出結果 (例如被系統終止)
+                if message[0] == "progress":
+                    tracker.update(message[1], message[2])
+                elif message[0] == "result":
+                    result = message[1]
+                    status = "ok" if result else "failed"
+                else:
+                    print(f"[Transcriber Worker] 子行程發生錯誤：{message[1]}")
+                    status = "failed"
+                if status is not None:
+                    break
+            elif not process.is_alive():
+                break
+            # 每次迴圈都檢查記憶體與逾時：子行程持續回報進度時 poll 不會等到逾時
+            rss_mb = process_tree_rss_mb(process.pid)
+            if rss_mb:
+                peak_mb = max(peak_mb, rss_mb)
+            if max_rss_mb and rss_mb and rss_mb > max_rss_mb:
+                print(f"[Transcriber Worker] 記憶體用量 {rss_mb:.0f} MB 超過上限 {max_rss_mb:.0f} MB，終止子行程。")
+                _kill_tree(process)
+                status = "memory"
+            elif timeout and time.monotonic() - started > timeout:
+                print(f"[Transcriber Worker] 轉錄超過 {timeout:.0f} 秒，終止子行程。")
+                _kill_tree(process)
+                status = "timeout"
+    finally:
+        parent_conn.close()
+        process.join(timeout=10)
+        if process.is_alive():
+            _kill_tree(process)
+            process.join()
+    if status is None:
+        sigkill = -getattr(signal, "SIGKILL", 9)
+        status = "memory" if process.exitcode == sigkill else "failed"
+        print(f"[Transcriber Worker] 子行程異常結束 (exit code {process.exitcode})。")
+    return status, result, round(peak_mb, 1)
+
+def next_fallback(model_name, chunked):
+    """
+    記憶體不足時的下一個嘗試設定：改用下一級較小的模型；已是最小的模型時改用分段模式。
+    沒有可嘗試的設定時返回 None。
+    """
+    base_name = model_name.split('.')[0].split('-')[0]  # large-v3 → large、medium.en → medium
+    if base_name in MODEL_FALLBACK_ORDER:
+        index = MODEL_FALLBACK_ORDER.index(base_name)
+        if index + 1 < len(MODEL_FALLBACK_ORDER):
+            return MODEL_FALLBACK_ORDER[index + 1], chunked
+    if not chunked:
+        return model_name, True
+    return None
+
+def transcribe_in_worker(audio_file_path, model_name="base", target_language=None, chunked=False, chunk_seconds=600,
+                         backend=None, vad=False, max_rss_mb=None, timeout=None, retries=None, on_progress=None):
+    """
+    在子行程中執行 transcribe_audio_locally (參數相同)，監控記憶體與執行時間。
+
+    參數:
+    max_rss_mb (float, optional): 記憶體上限 (MB)，預設依 WHISPER_WORKER_MAX_RSS_MB。
+    timeout (float, optional): 單次嘗試的逾時秒數，預設依 WHISPER_WORKER_TIMEOUT。
+    retries (int, optional): 記憶體不足時的重試次數，預設依 WHISPER_WORKER_RETRIES。
+    on_progress (callable, optional): 收到進度時呼叫 on_progress({"model", "seconds_done", "audio_seconds",
+                                      "percent", "eta_seconds"})。
+
+    返回:
+    dict: 與 transcribe_audio_locally(return_segments=True) 相同，另含
+          "worker": {"model", "chunked", "attempts": [{"model", "chunked", "status", "seconds", "peak_rss_mb"}]}，
+          "model" / "chunked" 為實際產生結果的設定 (重試後可能與要求的不同)。所有嘗試都失敗時返回 None。
+    """
+    if not os.path.exists(audio_file_path):
+        print(f"錯誤 (transcriber)：找不到音訊檔案 {audio_file_path}")
+        return None
+    max_rss_mb = WHISPER_WORKER_MAX_RSS_MB if max_rss_mb is None else max_rss_mb
+    timeout = WHISPER_WORKER_TIMEOUT if timeout is None else timeout
+    retries = WHISPER_WORKER_RETRIES if retries is None else retries
+    if max_rss_mb and psutil is None and not os.path.isdir("/proc"):
+        print("[Transcriber Worker] 警告：無法量測記憶體 (請安裝 psutil)，不會套用記憶體上限。")
+
+    attempts = []
+    current = (model_name, chunked)
+    while current:
+        attempt_model, attempt_chunked = current
+        options = {
+            "audio_file_path": audio_file_path,
+            "model_name": attempt_model,
+            "target_language": target_language,
+            "chunked": attempt_chunked,
+            "chunk_seconds": chunk_seconds,
+            "backend": backend,
+            "vad": vad,
+        }
+        if attempt_chunked and attempts:
+            options["num_workers"] = 1  # 因記憶體不足改用分段模式時，一次只載入一個模型
+        print(f"[Transcriber Worker] 以子行程轉錄 (模型 '{attempt_model}'{'，分段模式' if attempt_chunked else ''})...")
+        started = time.monotonic()
+        status, result, peak_mb = _run_attempt(options, max_rss_mb, timeout, on_progress)
+        attempts.append({"model": attempt_model, "chunked": attempt_chunked, "status": status,
+                         "seconds": round(time.monotonic() - started, 2), "peak_rss_mb": peak_mb})
+        if status == "ok":
+            result["worker"] = {"model": attempt_model, "chunked": attempt_chunked, "attempts": attempts}
+            return result
+        if status != "memory" or len(attempts) > retries:
+            break
+        current = next_fallback(attempt_model, attempt_chunked)
+        if current:
+            print(f"[Transcriber Worker] 記憶體不足，改用模型 '{current[0]}'"
+                  f"{' (分段模式)' if current[1] else ''} 重試。")
+    print(f"[Transcriber Worker] 轉錄失敗 (嘗試 {len(attempts)} 次，最後狀態：{attempts[-1]['status']})。")
+    return None
@@ -0,0 +1,166 @@
+# vad.py
+import os
+
+import numpy as np
+
+try:
+    import webrtcvad  # 選用套件：有安裝時以 WebRTC VAD 判斷語音，比能量門檻更能排除背景音樂
+except ImportError:
+    webrtcvad = None
+
+# 語音活動偵測 (VAD)：轉錄前先找出有人說話的區段，只把這些區段 (以短暫靜音相接) 送進 Whisper，
+# 轉錄後再將時間戳記對應回原始音訊的時間軸。可略過長片頭、背景音樂與靜音，也減少 Whisper 在這些部分「幻聽」出文字。
+#
+# 可透過環境變數調整：
+#   VAD_METHOD                  "webrtc" 或 "energy"，預設有安裝 webrtcvad 時使用 webrtc
+#   VAD_AGGRESSIVENESS          WebRTC VAD 的嚴格程度 0-3 (預設 2)
+#   VAD_MIN_SILENCE_SECONDS     短於此長度的停頓不切開 (預設 0.6)
+#   VAD_PAD_SECONDS             每個語音區段前後保留的長度 (預設 0.25)
+SAMPLE_RATE = 16000
+_FRAME_SECONDS = 0.03
+VAD_METHOD = os.getenv("VAD_METHOD") or ("webrtc" if webrtcvad is not None else "energy")
+VAD_AGGRESSIVENESS = int(os.getenv("VAD_AGGRESSIVENESS", "2"))
+VAD_MIN_SILENCE_SECONDS = float(os.getenv("VAD_MIN_SILENCE_SECONDS", "0.6"))
+VAD_PAD_SECONDS = float(os.getenv("VAD_PAD_SECONDS", "0.25"))
+_MIN_SPEECH_SECONDS = 0.25
+_JOIN_GAP_SECONDS = 0.3      # 相接的語音區段之間插入的靜音，讓 Whisper 仍能分辨句子邊界
+_MIN_SKIP_RATIO = 0.05       # 可略過的部分少於 5% 時直接轉錄原始音訊
+
+def _energy_speech_frames(audio, frame, threshold_db=12.0):
+    """以音框能量判斷：高於雜訊底噪 (第 10 百分位) threshold_db 以上的音框視為語音。"""
+    n_frames = len(audio) // frame
+    frames = audio[:n_frames * frame].reshape(n_frames, frame)
+    energy_db = 10 * np.log10(np.mean(frames ** 2, axis=1) + 1e-10)
+    threshold = max(np.percentile(energy_db, 10) + threshold_db, -50.0)
+    return energy_db > threshold
+
+def _webrtc_speech_frames(audio, frame, aggressiveness):
+    vad = webrtcvad.Vad(aggressiveness)
+    n_frames = len(audio) // frame
+    pcm = (np.clip(audio[:n_frames * frame], -1.0, 1.0) * 32767).astype("<i2").tobytes()
+    step = frame * 2
+    return np.array([vad.is_speech(pcm[i * step:(i + 1) * step], SAMPLE_RATE) for i in range(n_frames)], dtype=bool)
+
+def detect_speech_regions(audio, method=None, aggressiveness=None, min_silence_seconds=None, pad_seconds=None):
+    """
+    找出音訊中的語音區段。
+
+    參數:
+    audio (np.ndarray): 16 kHz 單聲道 float32 音訊。
+    method (str, optional): "webrtc" 或 "energy"，預設依 VAD_METHOD。
+
+    返回:
+    list: [(開始樣本, 結束樣本), ...]，依時間排序且互不重疊。
+    """
+    method = method or VAD_METHOD
+    min_silence = VAD_MIN_SILENCE_SECONDS if min_silence_seconds is None else min_silence_seconds
+    pad = int((VAD_PAD_SECONDS if pad_seconds is None else pad_seconds) * SAMPLE_RATE)
+    frame = int(_FRAME_SECONDS * SAMPLE_RATE)
+    if len(audio) < frame:
+        return [(0, len(audio))] if len(audio) else []
+
+    if method == "webrtc":
+        if webrtcvad is None:
+            raise ValueError("VAD_METHOD=webrtc 需要先安裝 webrtcvad 套件")
+        speech = _webrtc_speech_frames(audio, frame, VAD_AGGRESSIVENESS if aggressiveness is None else aggressiveness)
+    elif method == "energy":
+        speech = _energy_speech_frames(audio, frame)
+    else:
+        raise ValueError(f"未知的 VAD 方法 '{method}'，可用方法：webrtc, energy")
+
+    # 連續的語音音框 → 區段 (以音框為單位)
+    edges = np.diff(np.concatenate(([0], speech.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+
+    regions = []
+    max_gap = int(min_silence / _FRAME_SECONDS)
+    for start, end in zip(starts, ends):
+        if regions and start - regions[-1][1] <= max_gap:
+            regions[-1][1] = end  # 短暫停頓不切開
+        else:
+            regions.append([start, end])
+    min_frames = int(_MIN_SPEECH_SECONDS / _FRAME_SECONDS)
+
+    padded = []
+    for start, end in regions:
+        if end - start < min_frames:
+            continue
+        start = max(0, start * frame - pad)
+        end = min(len(audio), end * frame + pad)
+        if padded and start <= padded[-1][1]:
+            padded[-1] = (padded[-1][0], int(end))
+        else:
+            padded.append((int(start), int(end)))
+    return padded
+
+class SpeechTimeline:
+    """
+    記錄「只含語音的音訊」與原始音訊之間的時間對應，用來將轉錄結果的時間戳記換回原始時間軸。
+    """
+
+    def __init__(self, regions, total_samples, gap_samples):
+        self.total_samples = total_samples
+        self.regions = regions
+        lengths = np.array([end - start for start, end in regions], dtype=np.float64)
+        self._lengths = lengths / SAMPLE_RATE
+        self._original_starts = np.array([start for start, _ in regions], dtype=np.float64) / SAMPLE_RATE
+        concat_starts = np.concatenate(([0.0], np.cumsum(lengths + gap_samples)[:-1]))
+        self._concat_starts = concat_starts / SAMPLE_RATE
+
+    def to_original(self, seconds):
+        """將語音音訊上的時間 (秒) 換算為原始音訊的時間；落在插入的靜音中時對齊到前一區段的結尾。"""
+        index = max(0, int(np.searchsorted(self._concat_starts, seconds, side="right")) - 1)
+        offset = min(max(0.0, seconds - self._concat_starts[index]), self._lengths[index])
+        return float(self._original_starts[index] + offset)
+
+    def stats(self):
+        audio_seconds = self.total_samples / SAMPLE_RATE
+        speech_seconds = float(self._lengths.sum())
+        return {
+            "audio_seconds": round(audio_seconds, 3),
+            "speech_seconds": round(speech_seconds, 3),
+            "skipped_seconds": round(audio_seconds - speech_seconds, 3),
+            "speech_regions": len(self.regions),
+        }
+
+def apply_vad(audio, method=None):
+    """
+    只保留音訊中的語音區段。
+
+    返回:
+    tuple: (語音音訊, SpeechTimeline)；沒有偵測到語音、或可略過的部分太少時返回 (原始音訊, None)。
+    """
+    regions = detect_speech_regions(audio, method=method)
+    total = len(audio)
+    speech_samples = sum(end - start for start, end in regions)
+    if not regions:
+        print("[VAD] 沒有偵測到語音，改為轉錄完整音訊。")
+        return audio, None
+    if total - speech_samples < total * _MIN_SKIP_RATIO:
+        print("[VAD] 音訊幾乎全為語音，直接轉錄完整音訊。")
+        return audio, None
+
+    gap = np.zeros(int(_JOIN_GAP_SECONDS * SAMPLE_RATE), dtype=audio.dtype)
+    pieces = []
+    for start, end in regions:
+        if pieces:
+            pieces.append(gap)
+        pieces.append(audio[start:end])
+    timeline = SpeechTimeline(regions, total, len(gap))
+    stats = timeline.stats()
+    print(f"[VAD] 偵測到 {stats['speech_regions']} 個語音區段，略過 {stats['skipped_seconds']:.1f} 秒 "
+          f"({stats['skipped_seconds'] / stats['audio_seconds']:.0%}) 的非語音音訊。")
+    return np.concatenate(pieces), timeline
+
+def remap_segments(segments, timeline):
+    """將段落 (與其中的字) 的時間戳記換回原始音訊的時間軸 (直接修改並返回 segments)。"""
+    if timeline is None:
+        return segments
+    for seg in segments:
+        seg["start"] = timeline.to_original(seg["start"])
+        seg["end"] = max(seg["start"], timeline.to_original(seg["end"]))
+        for word in seg.get("words") or []:
+            word["start"] = timeline.to_original(word["start"])
+            word["end"] = max(word["start"], timeline.to_original(word["end"]))
+    return segments
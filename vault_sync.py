@@ -0,0 +1,237 @@
+# vault_sync.py
+import os
+import re
+import sys
+import json
+import difflib
+import hashlib
+import argparse
+import threading
+
+# 將筆記同步到 Obsidian Vault。Vault 常放在網路磁碟或雲端同步資料夾，每次寫入都可能觸發一次上傳，
+# 因此只寫入內容有變動的筆記：同步紀錄 (manifest) 保存每個目的地檔案上次寫入的內容雜湊、大小與修改時間，
+# 大小與修改時間相同時直接視為未變動，不需重新讀取 Vault 中的檔案。
+# 寫入時先寫到同一資料夾的暫存檔再改名，同步軟體不會看到寫到一半的筆記。
+# 目的地檔案在上次同步後被修改過 (例如在 Obsidian 中編輯) 時視為衝突，預設保留 Vault 中的版本。
+# 不同影片的筆記檔名相同時 (基礎名稱相同、資料夾為 <基礎名稱> [<影片ID>])，後來的筆記在 Vault 中的檔名會加上影片 ID。
+# 可透過環境變數設定：
+#   VAULT_SYNC_MANIFEST   同步紀錄檔路徑 (預設 downloads/vault_sync.json)
+VAULT_SYNC_MANIFEST = os.getenv("VAULT_SYNC_MANIFEST", os.path.join("downloads", "vault_sync.json"))
+
+# 同步動作：create (新筆記)、update (來源內容有變動)、unchanged (內容相同，略過)、conflict (Vault 中的檔案已被修改)
+SYNC_ACTIONS = ("create", "update", "unchanged", "conflict")
+
+_MANIFEST_LOCK = threading.Lock()
+_FOLDER_VIDEO_ID = re.compile(r" \[([A-Za-z0-9_-]{11})\]$")
+
+def _sha256_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+def _load_manifest(manifest_path):
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_manifest(manifest_path, manifest):
+    os.makedirs(os.path.dirname(manifest_path) or ".", exist_ok=True)
+    tmp_path = f"{manifest_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, manifest_path)
+
+def _destination_state(destination, record):
+    """
+    返回目的地檔案目前的內容雜湊 (不存在時為 None)。
+    大小與修改時間和同步紀錄相同時直接沿用紀錄中的雜湊，不讀取檔案。
+    """
+    try:
+        stat = os.stat(destination)
+    except OSError:
+        return None
+    if record and record.get("size") == stat.st_size and record.get("mtime") == stat.st_mtime:
+        return record["sha256"]
+    with open(destination, 'rb') as f:
+        return _sha256_bytes(f.read())
+
+def _qualified_name(source):
+    """Vault 中已有其他影片的同名筆記時使用的檔名：<檔名> [<影片ID>]<副檔名> (資料夾名稱沒有影片 ID 時改用資料夾名稱)。"""
+    folder = os.path.basename(os.path.dirname(os.path.abspath(source)))
+    match = _FOLDER_VIDEO_ID.search(folder)
+    stem, ext = os.path.splitext(os.path.basename(source))
+    return f"{stem} [{match.group(1) if match else folder}]{ext}"
+
+def _destination_for(source, destination_folder, manifest, claimed):
+    """
+    決定筆記在 Vault 中的路徑：預設與來源同名；該檔名已屬於另一個來源 (依同步紀錄或同一次同步中較早的筆記) 時
+    改用 _qualified_name。仍然重複時返回 None。
+    """
+    source_path = os.path.abspath(source)
+    for name in (os.path.basename(source), _qualified_name(source)):
+        destination = os.path.join(destination_folder, name)
+        key = os.path.abspath(destination)
+        owner = (manifest.get(key) or {}).get("source")
+        if key not in claimed and owner in (None, source_path):
+            return destination
+    return None
+
+def plan_sync(sources, destination_folder, manifest=None):
+    """
+    比較來源筆記與 Vault 中的檔案，決定每個筆記的同步動作 (不寫入任何檔案)。
+    不同來源的筆記檔名相同時不會寫入同一個 Vault 檔案 (見 _destination_for)，無法區分時列為 conflict。
+
+    參數:
+    sources (list): 來源筆記路徑。
+    destination_folder (str): Obsidian Vault 中的目標資料夾。
+    manifest (dict, optional): 同步紀錄，未提供時讀取 VAULT_SYNC_MANIFEST。
+
+    返回:
+    list: [{"source", "destination", "action", "sha256", "content"}, ...]，action 見 SYNC_ACTIONS。
+    """
+    manifest = _load_manifest(VAULT_SYNC_MANIFEST) if manifest is None else manifest
+    plan = []
+    claimed = set()
+    for source in sources:
+        with open(source, 'rb') as f:
+            content = f.read()
+        digest = _sha256_bytes(content)
+        destination = _destination_for(source, destination_folder, manifest, claimed)
+        if destination is None:
+            # 與其他來源的筆記無法區分，不寫入 (避免兩個筆記輪流覆寫同一個檔案)
+            plan.append({"source": source, "destination": os.path.join(destination_folder, _qualified_name(source)),
+                         "action": "conflict", "sha256": digest, "content": content, "duplicate": True})
+            continue
+        claimed.add(os.path.abspath(destination))
+        record = manifest.get(os.path.abspath(destination))
+        current = _destination_state(destination, record)
+        if current is None:
+            action = "create"
+        elif current == digest:
+            action = "unchanged"
+        elif record and record.get("sha256") == current:
+            action = "update"  # Vault 中仍是上次同步的版本，可以安全覆寫
+        else:
+            action = "conflict"
+        plan.append({"source": source, "destination": destination, "action": action,
+                     "sha256": digest, "content": content})
+    return plan
+
+def _atomic_write(destination, content, source):
+    """寫入暫存檔後改名為目的地檔名，並沿用來源檔案的修改時間 (與 shutil.copy2 相同)。"""
+    folder = os.path.dirname(destination) or "."
+    tmp_path = os.path.join(folder, f".{os.path.basename(destination)}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        source_stat = os.stat(source)
+        os.utime(tmp_path, (source_stat.st_atime, source_stat.st_mtime))
+        os.replace(tmp_path, destination)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def print_sync_diff(plan, max_lines=40):
+    """列出同步計畫；update 與 conflict 顯示 Vault 版本與來源版本的差異 (每個檔案最多 max_lines 行)。"""
+    for item in plan:
+        print(f"[Vault Sync] {item['action']:<9} {item['destination']}")
+        if item["action"] not in ("update", "conflict") or item.get("duplicate"):
+            continue
+        with open(item["destination"], 'r', encoding='utf-8', errors='replace') as f:
+            old_lines = f.read().splitlines()
+        new_lines = item["content"].decode('utf-8', 'replace').splitlines()
+        diff = list(difflib.unified_diff(old_lines, new_lines, "vault", "source", lineterm=""))
+        for line in diff[:max_lines]:
+            print(f"    {line}")
+        if len(diff) > max_lines:
+            print(f"    ... (另有 {len(diff) - max_lines} 行差異)")
+
+def sync_notes(sources, destination_folder, dry_run=False, overwrite_conflicts=False):
+    """
+    將多個筆記一次同步到 Vault：只寫入新增或內容有變動的筆記，同步紀錄在全部寫入後只儲存一次。
+
+    參數:
+    sources (list): 來源筆記路徑。
+    destination_folder (str): Obsidian Vault 中的目標資料夾 (需已存在)。
+    dry_run (bool): 只列出會進行的動作與差異，不寫入任何檔案。
+    overwrite_conflicts (bool): Vault 中的檔案在上次同步後被修改過時，仍以來源覆寫。
+
+    返回:
+    dict: 來源路徑 → {"destination", "action", "synced"}；Vault 中的檔案與來源一致
+          (create / update / unchanged 成功) 時 synced 為 True。目標資料夾無效時返回 None。
+    """
+    if not destination_folder or not os.path.isdir(destination_folder):
+        print(f"[Vault Sync] 錯誤：目標資料夾 '{destination_folder}' 不存在或不是一個有效的資料夾。")
+        print("[Vault Sync] 請確認 Obsidian Vault 的路徑是否已在 .env 中正確設定，並且該資料夾已存在。")
+        return None
+    sources = [source for source in sources if source and os.path.exists(source)]
+    with _MANIFEST_LOCK:
+        manifest = _load_manifest(VAULT_SYNC_MANIFEST)
+        plan = plan_sync(sources, destination_folder, manifest)
+        if dry_run:
+            print_sync_diff(plan)
+            return {item["source"]: {"destination": item["destination"], "action": item["action"], "synced": False}
+                    for item in plan}
+        results = {}
+        for item in plan:
+            action = item["action"]
+            destination = item["destination"]
+            if item.get("duplicate"):
+                print(f"[Vault Sync] 衝突：'{item['source']}' 與其他筆記的檔名重複，無法區分，未同步。")
+                results[item["source"]] = {"destination": destination, "action": action, "synced": False}
+                continue
+            if action == "conflict" and not overwrite_conflicts:
+                print(f"[Vault Sync] 衝突：'{destination}' 在上次同步後已被修改，保留 Vault 中的版本。")
+                results[item["source"]] = {"destination": destination, "action": action, "synced": False}
+                continue
+            if action != "unchanged":
+                try:
+                    _atomic_write(destination, item["content"], item["source"])
+                except OSError as e:
+                    print(f"[Vault Sync] 寫入 '{destination}' 時發生錯誤：{e}")
+                    results[item["source"]] = {"destination": destination, "action": action, "synced": False}
+                    continue
+            stat = os.stat(destination)
+            manifest[os.path.abspath(destination)] = {
+                "source": os.path.abspath(item["source"]),
+                "sha256": item["sha256"],
+                "size": stat.st_size,
+                "mtime": stat.st_mtime,
+            }
+            results[item["source"]] = {"destination": destination, "action": action, "synced": True}
+        _save_manifest(VAULT_SYNC_MANIFEST, manifest)
+
+    counts = {action: sum(1 for r in results.values() if r["action"] == action) for action in SYNC_ACTIONS}
+    print(f"[Vault Sync] 同步完成：新增 {counts['create']}、更新 {counts['update']}、"
+          f"未變動 {counts['unchanged']}、衝突 {counts['conflict']}。")
+    return results
+
+def find_notes(output_directory="downloads", suffix="_gemini_output.md"):
+    """列出 output_directory 底下各影片資料夾中的筆記。"""
+    notes = []
+    for name in sorted(os.listdir(output_directory)):
+        folder = os.path.join(output_directory, name)
+        if name.startswith(".") or not os.path.isdir(folder):
+            continue
+        notes.extend(os.path.join(folder, f) for f in sorted(os.listdir(folder)) if f.endswith(suffix))
+    return notes
+
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="將 downloads 底下的筆記同步到 Obsidian Vault (只寫入有變動的筆記)")
+    parser.add_argument("--source", default="downloads", help="筆記所在的資料夾 (預設 downloads)")
+    parser.add_argument("--vault", default=os.getenv("path_to_obsidian_workspace"),
+                        help="Vault 中的目標資料夾 (預設依 .env 的 path_to_obsidian_workspace)")
+    parser.add_argument("--dry-run", action="store_true", help="只列出會新增 / 更新的筆記與差異，不寫入")
+    parser.add_argument("--overwrite-conflicts", action="store_true", help="覆寫在 Vault 中被修改過的筆記")
+    args = parser.parse_args()
+
+    sync_results = sync_notes(find_notes(args.source), args.vault, dry_run=args.dry_run,
+                              overwrite_conflicts=args.overwrite_conflicts)
+    if sync_results is None:
+        sys.exit(1)
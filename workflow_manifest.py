@@ -0,0 +1,137 @@
+# workflow_manifest.py
+import os
+import json
+import threading
+from datetime import datetime
+
+from transcript_cache import hash_file
+
+# 每部影片的處理階段 (依執行順序)。重新計算某個階段時，之後的階段一律視為失效。
+STAGES = ("download", "transcribe", "save_transcript", "summarize", "copy_to_obsidian")
+
+def write_text_atomic(file_path, text):
+    """先寫入暫存檔再改名，避免中途失敗留下不完整的檔案。"""
+    tmp_path = f"{file_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, file_path)
+    return file_path
+
+class WorkflowManifest:
+    """
+    記錄單一影片各階段的狀態與產出檔案 (<輸出資料夾>/<基礎名稱>_manifest.json)。
+    重新執行同一部影片時，已完成且產出檔案雜湊仍相符的階段會被跳過，從第一個未完成的階段繼續。
+    """
+
+    def __init__(self, output_folder, basename, force_stage=None):
+        """
+        參數:
+        output_folder (str): 影片的輸出資料夾。
+        basename (str): 已清理的檔案基礎名稱。
+        force_stage (str, optional): 從此階段 (含) 開始強制重新計算，見 STAGES。
+        """
+        if force_stage is not None and force_stage not in STAGES:
+            raise ValueError(f"未知的階段 '{force_stage}'，可用階段：{', '.join(STAGES)}")
+        self.path = os.path.join(output_folder, f"{basename}_manifest.json")
+        self.force_stage = force_stage
+        self._lock = threading.Lock()
+        self.data = self._load()
+        if force_stage:
+            print(f"[Manifest] 將從階段 '{force_stage}' 開始重新計算。")
+            self.invalidate_from(force_stage)
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if isinstance(data.get("stages"), dict):
+                return data
+        except (OSError, ValueError):
+            pass
+        return {"stages": {}}
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        write_text_atomic(self.path, json.dumps(self.data, ensure_ascii=False, indent=1))
+
+    def _artifact_matches(self, record):
+        """檢查產出檔案仍存在且內容未變；大小與修改時間相同時沿用記錄的雜湊，不重新讀檔。"""
+        path = record.get("path")
+        if not path or not os.path.isfile(path):
+            return False
+        stat = os.stat(path)
+        if stat.st_size == record.get("size") and stat.st_mtime == record.get("mtime"):
+            return True
+        return hash_file(path) == record.get("sha256")
+
+    def is_complete(self, stage, **params):
+        """
+        階段是否已完成且可沿用：狀態為 done、params (例如模型名稱) 與記錄一致，且所有產出檔案的雜湊相符。
+        """
+        with self._lock:
+            record = self.data["stages"].get(stage)
+            if not record or record.get("status") != "done":
+                return False
+            if params and record.get("params") != params:
+                print(f"[Manifest] 階段 '{stage}' 的設定已變更，需要重新計算。")
+                return False
+            for name, artifact in record.get("artifacts", {}).items():
+                if not self._artifact_matches(artifact):
+                    print(f"[Manifest] 階段 '{stage}' 的產出檔案 '{name}' 遺失或已變更，需要重新計算。")
+                    return False
+            return True
+
+    def is_forced(self, stage):
+        """此階段是否因 force_stage 而必須重新計算 (此時也不應使用逐字稿 / LLM 快取)。"""
+        return self.force_stage is not None and STAGES.index(self.force_stage) <= STAGES.index(stage)
+
+    def artifact(self, stage, name):
+        """返回已記錄的產出檔案路徑，沒有記錄時返回 None。"""
+        record = self.data["stages"].get(stage) or {}
+        return record.get("artifacts", {}).get(name, {}).get("path")
+
+    def mark_done(self, stage, artifacts=None, **params):
+        """
+        記錄階段完成與其產出檔案 (名稱 → 路徑)，並使之後的階段失效。
+        """
+        recorded = {}
+        for name, path in (artifacts or {}).items():
+            if not path:
+                continue
+            stat = os.stat(path)
+            recorded[name] = {
+                "path": path,
+                "sha256": hash_file(path),
+                "size": stat.st_size,
+                "mtime": stat.st_mtime,
+            }
+        with self._lock:
+            self._invalidate_after(stage)
+            self.data["stages"][stage] = {
+                "status": "done",
+                "params": params,
+                "artifacts": recorded,
+                "updated_at": datetime.now().isoformat(timespec="seconds"),
+            }
+            self._save()
+
+    def mark_failed(self, stage, error=None):
+        """記錄階段失敗 (下次執行時會從此階段重新開始)。"""
+        with self._lock:
+            self.data["stages"][stage] = {
+                "status": "failed",
+                "error": error,
+                "updated_at": datetime.now().isoformat(timespec="seconds"),
+            }
+            self._save()
+
+    def _invalidate_after(self, stage):
+        for later in STAGES[STAGES.index(stage) + 1:]:
+            self.data["stages"].pop(later, None)
+
+    def invalidate_from(self, stage):
+        """清除指定階段 (含) 之後的所有記錄。"""
+        with self._lock:
+            for later in STAGES[STAGES.index(stage):]:
+                self.data["stages"].pop(later, None)
+            self._save()
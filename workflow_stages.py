@@ -0,0 +1,402 @@
+# workflow_stages.py
+import os
+
+import transcript_cache
+from download_audio import download_youtube_audio
+from llm_processor import build_gemini_prompt
+from run_report import probe_audio_duration, folder_size_bytes
+from segment_store import SEGMENTS_SUFFIX, write_transcript, iter_transcript_text, export_segments
+from sentence_segmenter import write_sentences
+from captions import fetch_captions
+from vault_sync import sync_notes
+
+# 單一影片各階段的處理，main.run_workflow (互動 / 子指令) 與 batch_runner.run_batch_workflow (管線) 共用。
+# 每個 *_stage 函數對應 workflow_manifest.STAGES 中的一個階段：可沿用時直接沿用先前的結果，
+# 否則執行並在 manifest 記錄完成或失敗，此階段的指標寫入呼叫端傳入的 metrics (通常來自 RunReport.stage)。
+# 要執行哪些階段、排程方式與進度訊息由呼叫端決定。
+# transcriber (torch / whisper) 只在實際轉錄時才匯入。
+
+def format_and_save_transcript_to_txt(transcript_text, output_folder, base_filename_stem):
+    """
+    將逐字稿格式化 (句末換行) 並儲存到 .txt 檔案。
+    transcript_text 可以是字串，或逐塊產生文字的 iterable (例如 iter_transcript_text)；
+    斷句以串流方式逐塊寫入檔案，處理數 MB 的逐字稿時也不會複製整份文字 (見 sentence_segmenter.py)。
+    """
+    if not transcript_text:
+        print("[Saver-TXT] 錯誤：沒有逐字稿內容可以儲存。")
+        return None
+    if not os.path.isdir(output_folder):
+        print(f"[Saver-TXT] 警告：輸出資料夾 {output_folder} 不存在，嘗試建立。")
+        try:
+            os.makedirs(output_folder, exist_ok=True)
+        except OSError as e:
+            print(f"[Saver-TXT] 錯誤：無法建立資料夾 {output_folder} - {e}")
+            return None
+    transcript_filename = f"{base_filename_stem}_transcript.txt"
+    transcript_filepath = os.path.join(output_folder, transcript_filename)
+    tmp_path = f"{transcript_filepath}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            written = write_sentences(transcript_text, f)
+        if not written:
+            os.remove(tmp_path)
+            print("[Saver-TXT] 錯誤：沒有逐字稿內容可以儲存。")
+            return None
+        os.replace(tmp_path, transcript_filepath)
+        print(f"[Saver-TXT] 原始逐字稿已成功儲存至：{transcript_filepath}")
+        return transcript_filepath
+    except IOError as e:
+        print(f"[Saver-TXT] 錯誤：無法將原始逐字稿儲存至檔案 {transcript_filepath} - {e}")
+        return None
+
+def save_text_to_markdown(content_text, output_folder, base_filename_stem, suffix="_gemini_output.md"):
+    """
+    將文字內容直接儲存到 Markdown (.md) 檔案。
+    """
+    if not content_text:
+        print("[Saver-MD] 錯誤：沒有內容可以儲存到 Markdown 檔案。")
+        return None
+    if not os.path.isdir(output_folder):
+        print(f"[Saver-MD] 警告：輸出資料夾 {output_folder} 不存在，嘗試建立。")
+        try:
+            os.makedirs(output_folder, exist_ok=True)
+        except OSError as e:
+            print(f"[Saver-MD] 錯誤：無法建立資料夾 {output_folder} - {e}")
+            return None
+    markdown_filename = f"{base_filename_stem}{suffix}"
+    markdown_filepath = os.path.join(output_folder, markdown_filename)
+    try:
+        with open(markdown_filepath, 'w', encoding='utf-8') as f:
+            f.write(content_text)
+        print(f"[Saver-MD] Gemini 處理結果已成功儲存至：{markdown_filepath}")
+        return markdown_filepath
+    except IOError as e:
+        print(f"[Saver-MD] 錯誤：無法將 Gemini 處理結果儲存至檔案 {markdown_filepath} - {e}")
+        return None
+
+def stream_text_to_markdown(generate_fn, output_folder, base_filename_stem, suffix="_gemini_output.md"):
+    """
+    以串流方式將 LLM 輸出逐段寫入 Markdown (.md) 檔案。
+    寫入過程中使用暫存檔 (<基礎名稱>_gemini_output.partial.md)，完成後才原子性地改名為正式檔名；
+    若中途失敗或被中斷，暫存檔會保留下來作為不完整的筆記。
+
+    參數:
+    generate_fn (callable): 接受 on_chunk 回呼函數的生成函數，返回完整文字 (失敗時返回 None)。
+
+    返回:
+    tuple: (完整文字, Markdown 檔案路徑)，失敗時為 (None, None)。
+    """
+    if not os.path.isdir(output_folder):
+        print(f"[Saver-MD] 警告：輸出資料夾 {output_folder} 不存在，嘗試建立。")
+        try:
+            os.makedirs(output_folder, exist_ok=True)
+        except OSError as e:
+            print(f"[Saver-MD] 錯誤：無法建立資料夾 {output_folder} - {e}")
+            return None, None
+    markdown_filepath = os.path.join(output_folder, f"{base_filename_stem}{suffix}")
+    partial_filepath = os.path.join(output_folder, f"{base_filename_stem}{suffix[:-3]}.partial.md")
+    content_text = None
+    try:
+        with open(partial_filepath, 'w', encoding='utf-8') as f:
+            def on_chunk(text):
+                f.write(text)
+                f.flush()
+            content_text = generate_fn(on_chunk)
+            if content_text:
+                # 非串流路徑 (例如串流回應為空時) 不會呼叫 on_chunk，確保檔案內容完整
+                f.seek(0)
+                f.truncate()
+                f.write(content_text)
+        if not content_text:
+            print("[Saver-MD] 錯誤：沒有內容可以儲存到 Markdown 檔案。")
+            if os.path.getsize(partial_filepath) == 0:
+                os.remove(partial_filepath)
+            else:
+                print(f"[Saver-MD] 不完整的內容保留於：{partial_filepath}")
+            return None, None
+        os.replace(partial_filepath, markdown_filepath)
+        print(f"[Saver-MD] Gemini 處理結果已成功儲存至：{markdown_filepath}")
+        return content_text, markdown_filepath
+    except KeyboardInterrupt:
+        print(f"\n[Saver-MD] 已中斷，不完整的內容保留於：{partial_filepath}")
+        raise
+    except IOError as e:
+        print(f"[Saver-MD] 錯誤：無法將 Gemini 處理結果儲存至檔案 {markdown_filepath} - {e}")
+        return None, None
+
+def segments_path_for(output_folder, file_basename):
+    """轉錄結果 (含段落時間戳記) 的路徑：<輸出資料夾>/<基礎名稱>.segments.bin。"""
+    return os.path.join(output_folder, f"{file_basename}{SEGMENTS_SUFFIX}")
+
+def transcribe_params_for(model, language=None, backend="openai-whisper", chunked=False, vad=False,
+                          caption_policy="off"):
+    """
+    返回記錄在 manifest 中的轉錄設定，設定不同時需要重新轉錄。
+    其中的 options 同時作為逐字稿快取的鍵 (見 transcript_cache.py)。
+    """
+    options = {"chunked": chunked}
+    if backend != "openai-whisper":
+        # 不同引擎的輸出不同，需分開快取 (預設引擎不加入此鍵，沿用既有的快取條目)
+        options["backend"] = backend
+    if vad:
+        options["vad"] = True
+    params = {"model": model, "language": language, "options": options}
+    if caption_policy != "off":
+        # 策略不同時逐字稿來源可能不同，需重新計算
+        params["captions"] = caption_policy
+    return params
+
+def lookup_cached_transcript(manifest, transcribe_params, video_id=None, audio_filepath=None):
+    """
+    以音訊內容 (提供 audio_filepath 時) 或影片 ID 查詢逐字稿快取；強制重新轉錄時不查詢。
+
+    返回:
+    dict: 快取的轉錄結果 (text / segments / language)，未命中時返回 None。
+    """
+    if manifest.is_forced("transcribe"):
+        return None
+    model, language, options = transcribe_params["model"], transcribe_params["language"], transcribe_params["options"]
+    if audio_filepath:
+        return transcript_cache.lookup_transcript_by_audio(audio_filepath, model, language, options)
+    return transcript_cache.lookup_transcript_by_video(video_id, model, language, options)
+
+def fetch_caption_transcript(url, transcribe_params, metrics):
+    """
+    依 transcribe_params 中的字幕策略取得影片字幕作為逐字稿 (見 captions.py)。
+
+    返回:
+    dict: 與轉錄結果格式相同，另含 "captions" (種類與分數)；沒有合適的字幕或未啟用時返回 None。
+    """
+    policy = transcribe_params.get("captions", "off")
+    if policy == "off" or not url:
+        return None
+    transcription = fetch_captions(url, language=transcribe_params["language"], policy=policy)
+    if transcription:
+        metrics["caption_kind"] = transcription["captions"]["kind"]
+        metrics["caption_score"] = transcription["captions"]["score"]
+    return transcription
+
+def download_stage(manifest, url, basename, output_directory, output_folder, audio_format="mp3",
+                   keep_video_file=False, session=None, metrics=None):
+    """
+    下載階段：manifest 中已有相同格式的音訊時直接沿用，否則下載並記錄。
+
+    參數:
+    session (YtDlpSession, optional): 提供時以 yt-dlp 的 Python API 下載，否則啟動 yt-dlp 行程。
+
+    返回:
+    str: 音訊檔案路徑，下載失敗時返回 None (manifest 記錄為失敗)。
+    """
+    metrics = {} if metrics is None else metrics
+    if manifest.is_complete("download", audio_format=audio_format):
+        metrics["status"] = "resumed"
+        return manifest.artifact("download", "audio")
+    size_before = folder_size_bytes(output_folder)
+    reuse_existing = not manifest.is_forced("download")
+    if session:
+        download_info = session.download_audio(url, basename, reuse_existing=reuse_existing)
+    else:
+        download_info = download_youtube_audio(
+            url,
+            basename,
+            output_directory=output_directory,
+            keep_video_file=keep_video_file,
+            audio_format=audio_format,
+            reuse_existing=reuse_existing
+        )
+    metrics["audio_format"] = audio_format
+    metrics["bytes_downloaded"] = folder_size_bytes(output_folder) - size_before
+    if not download_info:
+        manifest.mark_failed("download")
+        metrics["status"] = "failed"
+        return None
+    metrics["status"] = "reused" if download_info.get("reused") else "ok"
+    manifest.mark_done("download", artifacts={"audio": download_info["audio_filepath"]}, audio_format=audio_format)
+    return download_info["audio_filepath"]
+
+def transcribe_stage(manifest, audio_filepath, transcribe_params, video_id=None, chunk_seconds=600,
+                     isolated=False, metrics=None):
+    """
+    轉錄階段：先以音訊內容查詢逐字稿快取，未命中時執行語音轉文字並寫入快取。
+    結果需再以 record_transcript 寫入段落檔並記錄到 manifest。
+
+    參數:
+    transcribe_params (dict): transcribe_params_for() 的輸出。
+    isolated (bool): 在受監控的子行程中轉錄 (記憶體上限、逾時、進度回報，見 transcription_worker.py)。
+
+    返回:
+    dict: 轉錄結果 (text / segments / language，子行程模式另含 worker)，失敗時返回 None (manifest 記錄為失敗)。
+    """
+    metrics = {} if metrics is None else metrics
+    transcription = lookup_cached_transcript(manifest, transcribe_params, audio_filepath=audio_filepath)
+    if transcription:
+        metrics["status"] = "cached"
+        return transcription
+    model, language, options = transcribe_params["model"], transcribe_params["language"], transcribe_params["options"]
+    backend = options.get("backend", "openai-whisper")
+    vad = options.get("vad", False)
+    metrics["audio_seconds"] = probe_audio_duration(audio_filepath)
+    if isolated:
+        from transcription_worker import transcribe_in_worker
+        transcription = transcribe_in_worker(
+            audio_filepath,
+            model_name=model,
+            target_language=language,
+            chunked=options["chunked"],
+            chunk_seconds=chunk_seconds,
+            backend=backend,
+            vad=vad
+        )
+    else:
+        from transcriber import transcribe_audio_locally
+        transcription = transcribe_audio_locally(
+            audio_filepath,
+            model_name=model,
+            target_language=language,
+            chunked=options["chunked"],
+            chunk_seconds=chunk_seconds,
+            return_segments=True,
+            backend=backend,
+            vad=vad
+        )
+    if transcription and transcription.get("vad"):
+        metrics["speech_seconds"] = transcription["vad"]["speech_seconds"]
+        metrics["vad_skipped_seconds"] = transcription["vad"]["skipped_seconds"]
+    if not transcription or not transcription["text"]:
+        manifest.mark_failed("transcribe")
+        metrics["status"] = "failed"
+        return None
+    metrics["status"] = "ok"
+    worker = transcription.get("worker")
+    if worker:
+        metrics["model_used"] = worker["model"]
+        metrics["worker_attempts"] = worker["attempts"]
+    # 因記憶體不足改用了較小的模型 / 分段模式時不寫入原設定的快取 (record_transcript 在 manifest 記錄實際的設定)
+    if not worker or (worker["model"] == model and worker["chunked"] == options["chunked"]):
+        transcript_cache.store_transcript(
+            video_id, audio_filepath, model, transcription["text"], language, options,
+            detected_language=transcription.get("language"), segments=transcription.get("segments")
+        )
+    return transcription
+
+def record_transcript(manifest, transcription, transcribe_params, segments_path, video_id=None, source=None):
+    """
+    將轉錄結果 (Whisper、快取或字幕) 寫入段落檔，並記錄轉錄階段完成。
+    子行程改用了較小的模型 / 分段模式時，manifest 記錄實際的設定，下次執行時仍會以原本的設定重新轉錄。
+
+    參數:
+    source (str, optional): 逐字稿不是由 Whisper 產生時的來源 (例如 "captions:manual")，記錄在段落檔中。
+    """
+    metadata = {"model": transcribe_params["model"], "video_id": video_id, "language": transcription.get("language")}
+    if source:
+        metadata["source"] = source
+    done_params = transcribe_params
+    worker = transcription.get("worker")
+    if worker:
+        metadata["model"] = worker["model"]
+        done_params = dict(transcribe_params, model=worker["model"],
+                           options=dict(transcribe_params["options"], chunked=worker["chunked"]))
+    os.makedirs(os.path.dirname(segments_path) or ".", exist_ok=True)
+    write_transcript(segments_path, transcription["text"], transcription.get("segments"), metadata)
+    manifest.mark_done("transcribe", artifacts={"segments": segments_path}, **done_params)
+
+def save_transcript_stage(manifest, segments_path, output_folder, file_basename, video_id=None, metrics=None):
+    """
+    儲存逐字稿階段：由段落檔產生格式化的 txt、字幕與附時間連結的 Markdown。
+
+    返回:
+    str: 逐字稿 txt 路徑，失敗時返回 None (manifest 記錄為失敗)。
+    """
+    metrics = {} if metrics is None else metrics
+    if manifest.is_complete("save_transcript"):
+        metrics["status"] = "resumed"
+        return manifest.artifact("save_transcript", "transcript_txt")
+    transcript_txt_path = format_and_save_transcript_to_txt(iter_transcript_text(segments_path), output_folder,
+                                                            file_basename)
+    subtitle_paths = export_segments(segments_path, output_folder, file_basename, video_id=video_id)
+    if not transcript_txt_path:
+        manifest.mark_failed("save_transcript")
+        metrics["status"] = "failed"
+        return None
+    manifest.mark_done("save_transcript", artifacts=dict(subtitle_paths, transcript_txt=transcript_txt_path))
+    metrics["status"] = "ok"
+    return transcript_txt_path
+
+def summarize_stage(manifest, transcript, video_title, output_folder, file_basename, llm_model, generate,
+                    metrics=None):
+    """
+    LLM 統整階段：同一個模型的筆記已存在時直接沿用；否則查詢 LLM 輸出快取，
+    未命中時呼叫 generate 並以串流方式寫入 Markdown (見 stream_text_to_markdown)。
+
+    參數:
+    llm_model (str): 模型標籤，記錄在 manifest 與 LLM 快取鍵中。
+    generate (callable): generate(on_chunk, usage_stats) 返回完整的筆記內容 (失敗時返回 None)；
+                         不支援串流時可忽略 on_chunk，token 用量累加到 usage_stats。
+                         None 代表未啟用 LLM (例如沒有 API 金鑰)，只沿用先前的筆記。
+
+    返回:
+    tuple: (筆記內容, 筆記路徑)。沿用先前的筆記時內容為 None；失敗時路徑為 None (manifest 記錄為失敗)。
+    """
+    metrics = {} if metrics is None else metrics
+    if manifest.is_complete("summarize", model=llm_model):
+        metrics["status"] = "resumed"
+        return None, manifest.artifact("summarize", "note")
+    if generate is None:
+        metrics["status"] = "skipped"
+        return None, None
+    llm_key = transcript_cache.llm_cache_key(build_gemini_prompt(transcript, video_title), llm_model)
+    content = None
+    if not manifest.is_forced("summarize"):
+        content = transcript_cache.lookup_llm_output(llm_key)
+    if content:
+        metrics["status"] = "cached"
+        note_path = save_text_to_markdown(content, output_folder, file_basename)
+    else:
+        usage_stats = {}
+        content, note_path = stream_text_to_markdown(
+            lambda on_chunk: generate(on_chunk, usage_stats), output_folder, file_basename
+        )
+        metrics.update(usage_stats)
+        transcript_cache.store_llm_output(llm_key, content)
+    if not note_path:
+        manifest.mark_failed("summarize")
+        metrics["status"] = "failed"
+        return content, None
+    manifest.mark_done("summarize", artifacts={"note": note_path}, model=llm_model)
+    metrics.setdefault("status", "ok")
+    return content, note_path
+
+def sync_to_vault_stage(notes, destination_folder, metrics=None):
+    """
+    複製到 Obsidian 階段：一次同步多部影片的筆記 (只寫入有變動的筆記，見 vault_sync.py)。
+
+    參數:
+    notes (list): (manifest, 筆記路徑) 組成的 list。
+
+    返回:
+    dict: 筆記路徑 → Vault 中的路徑；同步失敗的筆記不在其中 (manifest 記錄為失敗)。
+    """
+    metrics = {} if metrics is None else metrics
+    synced = {}
+    pending = []
+    for manifest, note_path in notes:
+        if manifest.is_complete("copy_to_obsidian", destination=destination_folder):
+            synced[note_path] = manifest.artifact("copy_to_obsidian", "note")
+        else:
+            pending.append((manifest, note_path))
+    metrics["notes"] = len(pending)
+    if not pending:
+        metrics["status"] = "resumed"
+        return synced
+    results = sync_notes([note_path for _, note_path in pending], destination_folder) or {}
+    metrics["notes_written"] = sum(1 for r in results.values() if r["synced"] and r["action"] in ("create", "update"))
+    for manifest, note_path in pending:
+        result = results.get(note_path)
+        if result and result["synced"]:
+            synced[note_path] = result["destination"]
+            manifest.mark_done("copy_to_obsidian", artifacts={"note": result["destination"]},
+                               destination=destination_folder)
+        else:
+            manifest.mark_failed("copy_to_obsidian")
+    metrics["status"] = "ok" if len(synced) == len(notes) else "failed"
+    return synced